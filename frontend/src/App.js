@@ -10,6 +10,7 @@ const BASE_URL = 'http://127.0.0.1:5000';
 const PRODUCTS_API_URL = `${BASE_URL}/api/products`;
 const TRIGGER_AGENT_RUN_URL = `${BASE_URL}/trigger-full-agent-run`;
 const GENERATE_PROMO_IDEA_URL = `${BASE_URL}/api/generate-promo-idea`;
+const GENERATE_PROMO_IDEA_STREAM_URL = `${BASE_URL}/api/generate-promo-idea/stream`;
 const APPLY_RECOMMENDATION_URL = `${BASE_URL}/apply-recommendation`;
 
 function App() {
@@ -179,7 +180,7 @@ function App() {
               </div>
             )}
             {activeTab === 'ai_promos' && (
-              <AIPromoGenerator apiUrl={GENERATE_PROMO_IDEA_URL} />
+              <AIPromoGenerator apiUrl={GENERATE_PROMO_IDEA_URL} streamUrl={GENERATE_PROMO_IDEA_STREAM_URL} />
             )}
           </>
         )}
@@ -1,12 +1,55 @@
 import React, { useState } from 'react';
 
-const AIPromoGenerator = ({ apiUrl }) => {
+const AIPromoGenerator = ({ apiUrl, streamUrl }) => {
   const [sku, setSku] = useState('');
   const [prompt, setPrompt] = useState('');
   const [idea, setIdea] = useState('');
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
+  // Reads Server-Sent Events from the streaming endpoint and appends each token as it arrives.
+  const streamPromotionIdea = async () => {
+    const response = await fetch(streamUrl, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' },
+      body: JSON.stringify({ sku, prompt }),
+    });
+
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // SSE frames are separated by a blank line
+      const frames = buffer.split('\n\n');
+      buffer = frames.pop();
+      for (const frame of frames) {
+        let eventName = 'message';
+        let data = '';
+        for (const line of frame.split('\n')) {
+          if (line.startsWith('event: ')) eventName = line.slice(7);
+          else if (line.startsWith('data: ')) data += line.slice(6);
+        }
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (eventName === 'error') {
+          throw new Error(payload.message);
+        }
+        if (eventName === 'message' && payload.text) {
+          setIdea((previous) => previous + payload.text);
+        }
+      }
+    }
+  };
+
   const getPromotionIdea = async () => {
     setLoading(true);
     setError(null);
@@ -19,6 +62,11 @@ const AIPromoGenerator = ({ apiUrl }) => {
     }
 
     try {
+      if (streamUrl) {
+        await streamPromotionIdea();
+        return;
+      }
+
       const response = await fetch(apiUrl, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
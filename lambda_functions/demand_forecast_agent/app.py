@@ -16,6 +16,87 @@ market_data_table = dynamodb.Table(os.getenv("MARKET_DATA_TABLE", "retail-market
 inventory_table = dynamodb.Table(os.getenv("INVENTORY_TABLE", "retail-inventory"))
 demand_forecasts_table = dynamodb.Table(os.getenv("DEMAND_FORECASTS_TABLE", "retail-demand-forecasts"))
 
+def _forecast_inventory_item(inventory_item, current_aws_region):
+    """
+    Forecasts demand for one inventory item and stores the forecast in DynamoDB.
+    Returns the forecast item.
+    """
+    sku = inventory_item['sku'] # Original SKU from inventory item
+    sku_region_pk = f"{sku}_{current_aws_region}" # Construct composite PK
+    
+    # Convert Decimal values to float immediately after retrieval for calculations
+    current_stock = float(inventory_item.get('current_stock', Decimal('1.0'))) # Mock current price for simplicity
+    
+    # --- Get Latest Competitor Price from retail-market-data ---
+    print(f"DEBUG: Querying {market_data_table.name} for latest competitor price for {sku_region_pk}.")
+    try:
+        market_data_response = market_data_table.query(
+            KeyConditionExpression=Key('sku_region_pk').eq(sku_region_pk),
+            ScanIndexForward=False, # Get latest first
+            Limit=1
+        )
+        latest_competitor_price_decimal = market_data_response['Items'][0]['competitor_price'] if market_data_response['Items'] else None
+        latest_competitor_price = float(latest_competitor_price_decimal) if latest_competitor_price_decimal is not None else None
+        print(f"DEBUG: Latest competitor price for {sku_region_pk}: {latest_competitor_price}")
+    except ClientError as e:
+        print(f"ERROR: ClientError querying market data for {sku_region_pk}: {e.response['Error']['Message']}")
+        latest_competitor_price = None
+    except Exception as e:
+        print(f"ERROR: Unexpected error fetching competitor price for {sku_region_pk}: {e}")
+        latest_competitor_price = None
+
+    # --- Simple Dummy Forecasting Logic (Replace with SageMaker in production) ---
+    simulated_demand_factor = 1.0 # Base demand factor
+    
+    # Simulate impact of competitor price
+    if latest_competitor_price:
+        if latest_competitor_price < (current_stock * 0.9): 
+            simulated_demand_factor -= 0.05 
+        elif latest_competitor_price > (current_stock * 1.1):
+            simulated_demand_factor += 0.03 
+
+    simulated_demand_factor += (time.time() % 100 / 1000 - 0.05) 
+    
+    forecasted_demand = max(1, round(current_stock * simulated_demand_factor * 0.8))
+
+    forecast_item = {
+        'sku_region_pk': sku_region_pk, # Partition Key
+        'forecast_date': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), # Sort Key
+        'sku': sku, # Original SKU as attribute
+        'forecasted_demand_next_7_days': Decimal(str(forecasted_demand)), # Store as Decimal
+        'demand_factor': Decimal(str(round(simulated_demand_factor, 2))), # Store as Decimal
+        'competitor_price': Decimal(str(latest_competitor_price)) if latest_competitor_price is not None else None # Store as Decimal
+    }
+    
+    # Store forecast in DynamoDB
+    print(f"DEBUG: Attempting to put forecast item to {demand_forecasts_table.name}: {forecast_item}")
+    try:
+        demand_forecasts_table.put_item(Item=forecast_item)
+        print(f"DEBUG: Successfully put forecast for SKU {sku_region_pk}")
+    except ClientError as e:
+        print(f"ERROR: ClientError putting forecast for SKU {sku_region_pk}: {e.response['Error']['Message']}")
+    except Exception as e:
+        print(f"ERROR: Unexpected error putting forecast for SKU {sku_region_pk}: {e}")
+
+    return forecast_item
+
+def generate_forecasts(current_aws_region=None):
+    """
+    Yields (inventory_item, forecast_item) pairs as each SKU is forecast, so downstream
+    stages (e.g. the pipelined strategy run in main.py) can start before the whole
+    catalog is done. Forecasts are still stored in DynamoDB as they are produced.
+    """
+    current_aws_region = current_aws_region or os.getenv("AWS_REGION", "us-east-1").upper()
+
+    # Fetch all SKUs from inventory table (as our product master for demo)
+    print(f"DEBUG: Scanning {inventory_table.name} for all inventory items.")
+    response = inventory_table.scan() # Scan is okay for small demo data
+    all_inventory_items = response['Items']
+    print(f"DEBUG: Found {len(all_inventory_items)} inventory items.")
+
+    for inventory_item in all_inventory_items:
+        yield inventory_item, _forecast_inventory_item(inventory_item, current_aws_region)
+
 def lambda_handler(event, context):
     """
     Lambda function for the Demand Forecast Agent.
@@ -28,71 +109,7 @@ def lambda_handler(event, context):
     current_aws_region = os.getenv("AWS_REGION", "us-east-1").upper()
 
     try:
-        # Fetch all SKUs from inventory table (as our product master for demo)
-        print(f"DEBUG: Scanning {inventory_table.name} for all inventory items.")
-        response = inventory_table.scan() # Scan is okay for small demo data
-        all_inventory_items = response['Items']
-        print(f"DEBUG: Found {len(all_inventory_items)} inventory items.")
-        
-        forecasts = []
-        for inventory_item in all_inventory_items:
-            sku = inventory_item['sku'] # Original SKU from inventory item
-            sku_region_pk = f"{sku}_{current_aws_region}" # Construct composite PK
-            
-            # Convert Decimal values to float immediately after retrieval for calculations
-            current_stock = float(inventory_item.get('current_stock', Decimal('1.0'))) # Mock current price for simplicity
-            
-            # --- Get Latest Competitor Price from retail-market-data ---
-            print(f"DEBUG: Querying {market_data_table.name} for latest competitor price for {sku_region_pk}.")
-            try:
-                market_data_response = market_data_table.query(
-                    KeyConditionExpression=Key('sku_region_pk').eq(sku_region_pk),
-                    ScanIndexForward=False, # Get latest first
-                    Limit=1
-                )
-                latest_competitor_price_decimal = market_data_response['Items'][0]['competitor_price'] if market_data_response['Items'] else None
-                latest_competitor_price = float(latest_competitor_price_decimal) if latest_competitor_price_decimal is not None else None
-                print(f"DEBUG: Latest competitor price for {sku_region_pk}: {latest_competitor_price}")
-            except ClientError as e:
-                print(f"ERROR: ClientError querying market data for {sku_region_pk}: {e.response['Error']['Message']}")
-                latest_competitor_price = None
-            except Exception as e:
-                print(f"ERROR: Unexpected error fetching competitor price for {sku_region_pk}: {e}")
-                latest_competitor_price = None
-
-            # --- Simple Dummy Forecasting Logic (Replace with SageMaker in production) ---
-            simulated_demand_factor = 1.0 # Base demand factor
-            
-            # Simulate impact of competitor price
-            if latest_competitor_price:
-                if latest_competitor_price < (current_stock * 0.9): 
-                    simulated_demand_factor -= 0.05 
-                elif latest_competitor_price > (current_stock * 1.1):
-                    simulated_demand_factor += 0.03 
-
-            simulated_demand_factor += (time.time() % 100 / 1000 - 0.05) 
-            
-            forecasted_demand = max(1, round(current_stock * simulated_demand_factor * 0.8))
-
-            forecast_item = {
-                'sku_region_pk': sku_region_pk, # Partition Key
-                'forecast_date': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), # Sort Key
-                'sku': sku, # Original SKU as attribute
-                'forecasted_demand_next_7_days': Decimal(str(forecasted_demand)), # Store as Decimal
-                'demand_factor': Decimal(str(round(simulated_demand_factor, 2))), # Store as Decimal
-                'competitor_price': Decimal(str(latest_competitor_price)) if latest_competitor_price is not None else None # Store as Decimal
-            }
-            forecasts.append(forecast_item)
-            
-            # Store forecast in DynamoDB
-            print(f"DEBUG: Attempting to put forecast item to {demand_forecasts_table.name}: {forecast_item}")
-            try:
-                demand_forecasts_table.put_item(Item=forecast_item)
-                print(f"DEBUG: Successfully put forecast for SKU {sku_region_pk}")
-            except ClientError as e:
-                print(f"ERROR: ClientError putting forecast for SKU {sku_region_pk}: {e.response['Error']['Message']}")
-            except Exception as e:
-                print(f"ERROR: Unexpected error putting forecast for SKU {sku_region_pk}: {e}")
+        forecasts = [forecast_item for _, forecast_item in generate_forecasts(current_aws_region)]
 
         print(f"Generated and stored {len(forecasts)} demand forecasts.")
         return {
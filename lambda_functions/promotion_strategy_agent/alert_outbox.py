@@ -0,0 +1,369 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Attr
+
+try:
+    from .notifications import (
+        SNS_PUBLISH_BATCH_LIMIT, publish_alert_batches, send_sms_alert
+    )
+except ImportError:  # Deployed from the agent's own folder, where this is a top-level module
+    from notifications import (
+        SNS_PUBLISH_BATCH_LIMIT, publish_alert_batches, send_sms_alert
+    )
+
+OUTBOX_STATUS_PENDING = 'pending'
+OUTBOX_STATUS_IN_FLIGHT = 'in_flight'
+OUTBOX_STATUS_SENT = 'sent'
+OUTBOX_STATUS_DEAD_LETTER = 'dead_letter'
+
+# PartiQL BatchExecuteStatement accepts at most 25 statements per call
+PARTIQL_BATCH_LIMIT = 25
+
+# A claimed entry not settled within this many seconds (e.g. its worker died) can be claimed again
+CLAIM_LEASE_SECONDS = 300
+
+
+def build_outbox_entry(alert, promo_key):
+    """
+    Builds an outbox entry for an alert. alert_id doubles as the idempotency key;
+    promo_key is the recommendations table key of the promotion idea the alert belongs to.
+    """
+    return {
+        'alert_id': alert['id'],
+        'status': OUTBOX_STATUS_PENDING,
+        'attempts': 0,
+        'next_attempt_at': 0,
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'message': alert['message'],
+        'contact': alert['contact'],
+        'attributes': alert['attributes'],
+        'promo_key': promo_key,
+    }
+
+
+class LocalAlertOutbox:
+    """
+    In-process outbox for local runs. Entries live in memory and are drained by a
+    background AlertWorkerPool in the same process.
+    """
+    name = 'local'
+
+    def __init__(self, lease_seconds=CLAIM_LEASE_SECONDS):
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def enqueue(self, entries):
+        added = 0
+        with self._lock:
+            for entry in entries:
+                if entry['alert_id'] not in self._entries:
+                    self._entries[entry['alert_id']] = dict(entry)
+                    added += 1
+        return added
+
+    def claim(self, limit, now=None):
+        """
+        Claims up to limit due pending entries, or in-flight entries whose lease has expired.
+        """
+        now = now or time.time()
+        claimed = []
+        with self._lock:
+            for entry in self._entries.values():
+                if len(claimed) >= limit:
+                    break
+                due = entry['status'] == OUTBOX_STATUS_PENDING and entry['next_attempt_at'] <= now
+                expired = entry['status'] == OUTBOX_STATUS_IN_FLIGHT and entry.get('claimed_until', 0) <= now
+                if due or expired:
+                    entry.update(status=OUTBOX_STATUS_IN_FLIGHT, claimed_until=now + self.lease_seconds)
+                    claimed.append(dict(entry))
+        return claimed
+
+    def mark_sent(self, entries):
+        with self._lock:
+            for entry in entries:
+                self._entries[entry['alert_id']]['status'] = OUTBOX_STATUS_SENT
+
+    def reschedule(self, entry, status, attempts, next_attempt_at, error):
+        with self._lock:
+            self._entries[entry['alert_id']].update(status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=error)
+
+    def next_due_at(self):
+        """
+        Returns when the earliest pending entry becomes due (or in-flight lease expires),
+        or None if nothing is left to send.
+        """
+        with self._lock:
+            due = [
+                e['next_attempt_at'] if e['status'] == OUTBOX_STATUS_PENDING else e.get('claimed_until', 0)
+                for e in self._entries.values() if e['status'] in (OUTBOX_STATUS_PENDING, OUTBOX_STATUS_IN_FLIGHT)
+            ]
+        return min(due) if due else None
+
+
+class DynamoDBAlertOutbox:
+    """
+    Outbox backed by a DynamoDB table (partition key 'alert_id'), drained by scheduled
+    'drain_alerts' invocations of the agent. Enqueues and claims are conditional writes, so
+    an alert is queued once and concurrent workers never send the same alert twice; a claim
+    whose worker dies is released when its lease expires.
+    """
+    name = 'dynamodb'
+
+    def __init__(self, table, lease_seconds=CLAIM_LEASE_SECONDS):
+        self.table = table
+        self.lease_seconds = lease_seconds
+
+    def enqueue(self, entries):
+        added = 0
+        for entry in entries:
+            try:
+                self.table.put_item(Item=entry, ConditionExpression="attribute_not_exists(alert_id)")
+                added += 1
+            except ClientError as e:
+                # Already queued (or sent): alert_id is the idempotency key
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        return added
+
+    def _scan(self, filter_expression, **kwargs):
+        scan_kwargs = dict(kwargs, FilterExpression=filter_expression)
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def claim(self, limit, now=None):
+        """
+        Claims up to limit due pending entries, or in-flight entries whose lease has expired.
+        """
+        now = int(now or time.time())
+        claimed = []
+        claimable = (
+            (Attr('status').eq(OUTBOX_STATUS_PENDING) & Attr('next_attempt_at').lte(now))
+            | (Attr('status').eq(OUTBOX_STATUS_IN_FLIGHT) & Attr('claimed_until').lte(now))
+        )
+        for entry in self._scan(claimable):
+            if len(claimed) >= limit:
+                break
+            try:
+                self.table.update_item(
+                    Key={'alert_id': entry['alert_id']},
+                    UpdateExpression="SET #s = :in_flight, claimed_until = :claimed_until",
+                    ConditionExpression="(#s = :pending AND next_attempt_at <= :now) OR (#s = :in_flight AND claimed_until <= :now)",
+                    ExpressionAttributeNames={'#s': 'status'},
+                    ExpressionAttributeValues={
+                        ':in_flight': OUTBOX_STATUS_IN_FLIGHT, ':pending': OUTBOX_STATUS_PENDING,
+                        ':now': now, ':claimed_until': now + int(self.lease_seconds)
+                    }
+                )
+                claimed.append(entry)
+            except ClientError as e:
+                # Another worker claimed it first
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+        return claimed
+
+    def mark_sent(self, entries):
+        with self.table.batch_writer(overwrite_by_pkeys=['alert_id']) as batch:
+            for entry in entries:
+                batch.put_item(Item=dict(entry, status=OUTBOX_STATUS_SENT))
+
+    def reschedule(self, entry, status, attempts, next_attempt_at, error):
+        self.table.update_item(
+            Key={'alert_id': entry['alert_id']},
+            UpdateExpression="SET #s = :status, attempts = :attempts, next_attempt_at = :next_attempt_at, last_error = :error",
+            ExpressionAttributeNames={'#s': 'status'},
+            ExpressionAttributeValues={':status': status, ':attempts': attempts, ':next_attempt_at': int(next_attempt_at), ':error': error}
+        )
+
+    def next_due_at(self):
+        due = [
+            float(item['next_attempt_at'] if item['status'] == OUTBOX_STATUS_PENDING else item.get('claimed_until', 0))
+            for item in self._scan(
+                Attr('status').is_in([OUTBOX_STATUS_PENDING, OUTBOX_STATUS_IN_FLIGHT]),
+                ProjectionExpression='#s, next_attempt_at, claimed_until', ExpressionAttributeNames={'#s': 'status'}
+            )
+        ]
+        return min(due) if due else None
+
+
+def mark_promotion_ideas_sent(dynamodb_client, table_name, promo_keys):
+    """
+    Sets status 'sent' on promotion ideas in the recommendations table with PartiQL
+    BatchExecuteStatement, 25 updates per call.
+    """
+    for start in range(0, len(promo_keys), PARTIQL_BATCH_LIMIT):
+        statements = [
+            {
+                'Statement': f'UPDATE "{table_name}" SET "status" = ? WHERE sku_region_pk = ? AND "timestamp" = ?',
+                'Parameters': [{'S': 'sent'}, {'S': key['sku_region_pk']}, {'S': key['timestamp']}]
+            }
+            for key in promo_keys[start:start + PARTIQL_BATCH_LIMIT]
+        ]
+        response = dynamodb_client.batch_execute_statement(Statements=statements)
+        failures = [r['Error'] for r in response.get('Responses', []) if r.get('Error')]
+        if failures:
+            print(f"WARN: {len(failures)} promotion idea status updates failed: {failures[0].get('Message')}")
+
+
+class _RateGate:
+    """
+    Spaces message sends so the pool never exceeds max_per_second across all workers.
+    """
+
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second if max_per_second else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.time()
+
+    def acquire(self, messages):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next_slot)
+            self._next_slot = start + self.interval * messages
+        if start > now:
+            time.sleep(start - now)
+
+
+class AlertWorkerPool:
+    """
+    Drains an alert outbox with a pool of worker threads.
+    Topic alerts are published 10 per PublishBatch call, SMS alerts one by one.
+    Failed alerts are retried with exponential backoff and dead-lettered after max_attempts.
+    on_sent receives the delivered outbox entries (e.g. to mark promotion ideas as sent).
+    An error in one batch is logged and does not stop the drain; entries whose outcome could
+    not be recorded are claimed again once their lease expires. Keep one pool per process:
+    its rate limit only holds across the drains it runs.
+    """
+
+    def __init__(self, outbox, sns_client, topic_arn, max_workers=4, max_messages_per_second=None,
+                 max_attempts=5, base_backoff_seconds=2.0, on_sent=None):
+        self.outbox = outbox
+        self.sns_client = sns_client
+        self.topic_arn = topic_arn
+        self.max_workers = max_workers
+        self.rate_gate = _RateGate(max_messages_per_second)
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.on_sent = on_sent
+        self._thread_lock = threading.Lock()
+        self._drain_thread = None
+        self._drain_requested = False
+
+    def _send_batch(self, entries):
+        """
+        Sends one batch of claimed entries. Returns (sent_entries, failed_entries).
+        """
+        self.rate_gate.acquire(len(entries))
+        topic_entries = [e for e in entries if '@' in e['contact']]
+        sms_entries = [e for e in entries if '@' not in e['contact']]
+        sent_ids = set()
+
+        if topic_entries:
+            if self.topic_arn:
+                alerts = [{'id': e['alert_id'], 'message': e['message'], 'attributes': e['attributes']} for e in topic_entries]
+                sent, _, _ = publish_alert_batches(self.sns_client, self.topic_arn, alerts)
+                sent_ids.update(sent)
+            else:
+                print("WARN: SNS_PROMOTION_TOPIC_ARN not set. Topic alerts cannot be delivered.")
+        for entry in sms_entries:
+            if send_sms_alert(self.sns_client, entry['contact'], entry['message']):
+                sent_ids.add(entry['alert_id'])
+
+        return [e for e in entries if e['alert_id'] in sent_ids], [e for e in entries if e['alert_id'] not in sent_ids]
+
+    def _handle_failures(self, failed_entries):
+        dead_lettered = 0
+        for entry in failed_entries:
+            attempts = int(entry.get('attempts', 0)) + 1
+            if attempts >= self.max_attempts:
+                self.outbox.reschedule(entry, OUTBOX_STATUS_DEAD_LETTER, attempts, 0, 'max attempts reached')
+                dead_lettered += 1
+                print(f"ERROR: Alert {entry['alert_id']} moved to dead letter after {attempts} attempts.")
+            else:
+                backoff = self.base_backoff_seconds * (2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+                self.outbox.reschedule(entry, OUTBOX_STATUS_PENDING, attempts, time.time() + backoff, 'delivery failed')
+        return dead_lettered
+
+    def drain(self, max_seconds=60.0, wait_for_retries=True):
+        """
+        Sends due alerts until the outbox is empty or max_seconds elapse.
+        With wait_for_retries, the pool sleeps until backed-off retries become due.
+        Returns delivery counts and throughput.
+        """
+        started_at = time.time()
+        stats = {'sent': 0, 'failed_attempts': 0, 'dead_lettered': 0, 'batches': 0}
+        claim_size = self.max_workers * SNS_PUBLISH_BATCH_LIMIT
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while time.time() - started_at < max_seconds:
+                claimed = self.outbox.claim(claim_size)
+                if not claimed:
+                    next_due_at = self.outbox.next_due_at() if wait_for_retries else None
+                    if next_due_at is None or next_due_at - started_at > max_seconds:
+                        break
+                    time.sleep(min(max(next_due_at - time.time(), 0.05), 1.0))
+                    continue
+
+                batches = [claimed[i:i + SNS_PUBLISH_BATCH_LIMIT] for i in range(0, len(claimed), SNS_PUBLISH_BATCH_LIMIT)]
+                futures = [executor.submit(self._send_batch, batch) for batch in batches]
+                for batch, future in zip(batches, futures):
+                    stats['batches'] += 1
+                    try:
+                        sent_entries, failed_entries = future.result()
+                    except Exception as e:
+                        print(f"ERROR: Sending a batch of {len(batch)} alerts failed: {e}")
+                        sent_entries, failed_entries = [], batch
+                    try:
+                        if sent_entries:
+                            self.outbox.mark_sent(sent_entries)
+                            stats['sent'] += len(sent_entries)
+                        if failed_entries:
+                            stats['failed_attempts'] += len(failed_entries)
+                            stats['dead_lettered'] += self._handle_failures(failed_entries)
+                    except Exception as e:
+                        print(f"ERROR: Could not record the outcome of {len(batch)} alerts; they will be retried after their claim lease expires: {e}")
+                        continue
+                    if sent_entries and self.on_sent:
+                        try:
+                            self.on_sent(sent_entries)
+                        except Exception as e:
+                            print(f"WARN: on_sent failed for {len(sent_entries)} delivered alerts: {e}")
+
+        elapsed = max(time.time() - started_at, 1e-6)
+        stats['duration_ms'] = round(elapsed * 1000, 1)
+        stats['messages_per_second'] = round(stats['sent'] / elapsed, 1)
+        print(f"Alert worker pool drained {stats['sent']} alerts in {stats['duration_ms']} ms ({stats['failed_attempts']} failed attempts, {stats['dead_lettered']} dead-lettered).")
+        return stats
+
+    def _background_drain(self, max_seconds):
+        while True:
+            with self._thread_lock:
+                if not self._drain_requested:
+                    self._drain_thread = None
+                    return
+                self._drain_requested = False
+            self.drain(max_seconds=max_seconds)
+
+    def start_background_drain(self, max_seconds=300.0):
+        """
+        Drains the outbox on a daemon thread so the caller can return immediately. At most one
+        drain thread runs per pool: while it is alive, the request makes it drain once more
+        before exiting, so alerts queued during a drain are never left behind.
+        """
+        with self._thread_lock:
+            self._drain_requested = True
+            if self._drain_thread is None:
+                self._drain_thread = threading.Thread(
+                    target=self._background_drain, args=(max_seconds,), daemon=True, name='alert-outbox-drain'
+                )
+                self._drain_thread.start()
+            return self._drain_thread
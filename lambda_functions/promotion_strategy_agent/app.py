@@ -1,12 +1,65 @@
 import json
 import os
-import random
+import itertools
+import queue
+import tempfile
+import threading
 import time
+import uuid
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
 from dotenv import load_dotenv
 from decimal import Decimal
+try:
+    from .prompt_builder import PromptBuilder, TokenUsageTracker, estimate_tokens
+    from .model_router import ModelRouter, score_pricing_complexity
+    from .prompt_cache import (
+        CACHE_MODE_BEDROCK, CACHE_MODE_SIMULATE, PromptCacheSimulator, build_system_blocks, supports_prompt_caching
+    )
+    from .targeting import CustomerTargetingIndex
+    from .promo_copy_library import PromoCopyLibrary
+    from .circuit_breaker import CircuitBreaker, CircuitOpenError
+    from .guardrails import GUARDRAIL_REJECTED, GuardrailEngine
+    from .fallback_pricing import FALLBACK_SOURCE, fallback_for_product, rule_based_recommendation
+    from .scheduler import impact_score, load_priority_weights, rank_products
+    from .checkpoints import (
+        CHECKPOINT_STATUS_COMPLETE, CHECKPOINT_STATUS_IN_PROGRESS, DynamoDBCheckpointStore, LocalCheckpointStore, TimeBudget, checkpoint_summary, new_checkpoint
+    )
+    from .notifications import build_alert_message, build_topic_alert
+    from .alert_outbox import (
+        AlertWorkerPool, DynamoDBAlertOutbox, LocalAlertOutbox, build_outbox_entry, mark_promotion_ideas_sent
+    )
+    from .structured_output import StructuredOutputStats, build_json_fix_prompt, parse_structured_output
+    from .batch_inference import (
+        BATCH_SUCCESS_STATUSES, BATCH_TERMINAL_STATUSES, BedrockBatchInferenceBackend, LocalBatchInferenceBackend,
+        build_manifest_record, extract_model_text, wait_for_batch_job, write_jsonl
+    )
+except ImportError:  # Deployed from the agent's own folder, where this is a top-level module
+    from prompt_builder import PromptBuilder, TokenUsageTracker, estimate_tokens
+    from model_router import ModelRouter, score_pricing_complexity
+    from prompt_cache import (
+        CACHE_MODE_BEDROCK, CACHE_MODE_SIMULATE, PromptCacheSimulator, build_system_blocks, supports_prompt_caching
+    )
+    from targeting import CustomerTargetingIndex
+    from promo_copy_library import PromoCopyLibrary
+    from circuit_breaker import CircuitBreaker, CircuitOpenError
+    from guardrails import GUARDRAIL_REJECTED, GuardrailEngine
+    from fallback_pricing import FALLBACK_SOURCE, fallback_for_product, rule_based_recommendation
+    from scheduler import impact_score, load_priority_weights, rank_products
+    from checkpoints import (
+        CHECKPOINT_STATUS_COMPLETE, CHECKPOINT_STATUS_IN_PROGRESS, DynamoDBCheckpointStore, LocalCheckpointStore, TimeBudget, checkpoint_summary, new_checkpoint
+    )
+    from notifications import build_alert_message, build_topic_alert
+    from alert_outbox import (
+        AlertWorkerPool, DynamoDBAlertOutbox, LocalAlertOutbox, build_outbox_entry, mark_promotion_ideas_sent
+    )
+    from structured_output import StructuredOutputStats, build_json_fix_prompt, parse_structured_output
+    from batch_inference import (
+        BATCH_SUCCESS_STATUSES, BATCH_TERMINAL_STATUSES, BedrockBatchInferenceBackend, LocalBatchInferenceBackend,
+        build_manifest_record, extract_model_text, wait_for_batch_job, write_jsonl
+    )
 
 # Load environment variables (for local testing)
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
@@ -18,30 +71,114 @@ demand_forecasts_table = dynamodb.Table(os.getenv("DEMAND_FORECASTS_TABLE", "ret
 inventory_table = dynamodb.Table(os.getenv("INVENTORY_TABLE", "retail-inventory"))
 customer_profiles_table = dynamodb.Table(os.getenv("CUSTOMER_PROFILES_TABLE", "retail-customer-profiles"))
 
-bedrock_runtime = boto3.client('bedrock-runtime', region_name=os.getenv("AWS_REGION", "us-east-1"))
+# Bounded timeouts and retries so a degraded Bedrock endpoint fails fast enough for the circuit breaker to see it
+bedrock_runtime = boto3.client(
+    'bedrock-runtime',
+    region_name=os.getenv("AWS_REGION", "us-east-1"),
+    config=Config(
+        connect_timeout=int(os.getenv("BEDROCK_CONNECT_TIMEOUT_SECONDS", "5")),
+        read_timeout=int(os.getenv("BEDROCK_READ_TIMEOUT_SECONDS", "60")),
+        retries={'max_attempts': int(os.getenv("BEDROCK_MAX_ATTEMPTS", "2")), 'mode': 'standard'}
+    )
+)
+# Shared by every Bedrock call; while open, recommendations come from the rule-based fallback
+bedrock_breaker = CircuitBreaker.from_env('bedrock', 'BEDROCK_BREAKER')
+# Business rules (min margin, max change, MAP floor, price endings) every recommended price must pass;
+# compiled once from STRATEGY_GUARDRAILS (see guardrails.py)
+guardrail_engine = GuardrailEngine()
 sns_client = boto3.client('sns', region_name=os.getenv("AWS_REGION", "us-east-1"))
-bedrock_model_id = os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+# Routes each Bedrock call to a model by task type and complexity (see model_router.py).
+# BEDROCK_MODEL_ID is the large model; BEDROCK_FAST_MODEL_ID the small, low-latency one.
+model_router = ModelRouter.from_env()
+# The static recommendation instructions go in a cacheable system block (see prompt_cache.py).
+# BEDROCK_PROMPT_CACHE_MODE: 'bedrock' (default), 'simulate' (local cache-hit estimates) or 'off'.
+prompt_cache_mode = os.getenv("BEDROCK_PROMPT_CACHE_MODE", CACHE_MODE_BEDROCK).lower()
+prompt_cache_simulator = PromptCacheSimulator(min_cacheable_tokens=int(os.getenv("BEDROCK_PROMPT_CACHE_MIN_TOKENS", "1024")))
+# Short "fix this JSON" follow-ups allowed per malformed recommendation before giving up
+json_repair_retries = int(os.getenv("BEDROCK_JSON_REPAIR_RETRIES", "1"))
+structured_output_stats = StructuredOutputStats()
+# Number of best-matching customers targeted with each SKU's promotion
+promo_target_top_k = int(os.getenv("PROMO_TARGET_TOP_K", "3"))
+# Promo copy templates are generated once per (category, offer type, discount band, segment)
+# cluster and filled locally per SKU; they stay cached across warm invocations.
+promo_copy_library = PromoCopyLibrary(max_rendered=int(os.getenv("PROMO_COPY_CACHE_SIZE", "1024")))
 sns_promotion_topic_arn = os.getenv("SNS_PROMOTION_TOPIC_ARN") 
 
-def _invoke_bedrock_model(prompt_text): # This is for general text generation (used by AIPromoGenerator)
+# Customer alerts are written to an outbox and delivered by a separate worker pool.
+# Set ALERT_OUTBOX_TABLE (partition key 'alert_id') to use DynamoDB; otherwise an in-process outbox is used.
+alert_outbox_table_name = os.getenv("ALERT_OUTBOX_TABLE")
+alert_outbox = DynamoDBAlertOutbox(dynamodb.Table(alert_outbox_table_name)) if alert_outbox_table_name else LocalAlertOutbox()
+# Lambda freezes background threads once the handler returns, so without the table alerts are
+# delivered before each flush returns (waiting up to ALERT_INLINE_DRAIN_SECONDS for retries)
+alert_inline_drain = not alert_outbox_table_name and bool(os.getenv("AWS_LAMBDA_FUNCTION_NAME"))
+alert_inline_drain_seconds = float(os.getenv("ALERT_INLINE_DRAIN_SECONDS", "30"))
+if alert_inline_drain:
+    print("WARN: ALERT_OUTBOX_TABLE is not set; customer alerts are delivered inline in Lambda and undelivered ones are lost on a cold start.")
+# One worker pool per process (created on first use), so all drains share its ALERT_MAX_MESSAGES_PER_SECOND budget
+alert_worker_pool = None
+alert_worker_pool_lock = threading.Lock()
+
+# Long runs stop before the Lambda timeout and resume from a checkpoint.
+# Set STRATEGY_CHECKPOINT_TABLE (partition key 'run_id') to use DynamoDB; otherwise JSON files in STRATEGY_CHECKPOINT_DIR.
+strategy_checkpoint_table_name = os.getenv("STRATEGY_CHECKPOINT_TABLE")
+checkpoint_store = (
+    DynamoDBCheckpointStore(dynamodb.Table(strategy_checkpoint_table_name)) if strategy_checkpoint_table_name
+    else LocalCheckpointStore(os.getenv("STRATEGY_CHECKPOINT_DIR"))
+)
+# In Lambda a local checkpoint lives in one execution environment's /tmp: a resume token could
+# land on another one (or after a cold start), so runs are only resumable with the table there
+checkpoint_resumable = bool(strategy_checkpoint_table_name) or not os.getenv("AWS_LAMBDA_FUNCTION_NAME")
+if not checkpoint_resumable:
+    print("WARN: STRATEGY_CHECKPOINT_TABLE is not set; strategy runs cut short in Lambda return no resume_token and cannot be resumed.")
+# SKUs processed between checkpoints; results are persisted in bulk at each checkpoint
+strategy_checkpoint_every = int(os.getenv("STRATEGY_CHECKPOINT_EVERY", "25"))
+# Optional Bedrock token budget per invocation; SKUs are ranked by expected impact so a
+# run cut short by time or tokens has already covered the most valuable SKUs.
+strategy_token_budget = int(os.getenv("STRATEGY_TOKEN_BUDGET", "0"))
+
+def _build_text_generation_body(prompt_text, max_tokens=200):
+    """
+    Builds the Bedrock request body for general text generation (e.g., promo copy).
+    """
+    messages = [
+        {"role": "user", "content": [{"type": "text", "text": prompt_text}]}
+    ]
+    return json.dumps({
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": max_tokens, # Max 200 tokens for promo copy by default
+        "messages": messages
+    })
+
+def _record_routed_call(route_name, started_at, prompt_text, generated_text, reported_usage=None, success=True):
+    """
+    Records latency and token usage of a Bedrock call on its model route.
+    """
+    reported_usage = reported_usage or {}
+    model_router.record(
+        route_name,
+        (time.time() - started_at) * 1000,
+        int(reported_usage.get('input_tokens', estimate_tokens(prompt_text))),
+        int(reported_usage.get('output_tokens', estimate_tokens(generated_text))),
+        success=success,
+        cache_read_tokens=int(reported_usage.get('cache_read_input_tokens', 0)),
+        cache_write_tokens=int(reported_usage.get('cache_creation_input_tokens', 0))
+    )
+
+def _invoke_bedrock_model(prompt_text, usage_tracker=None, task_type='promo_copy', max_tokens=200): # This is for general text generation (used by AIPromoGenerator)
     """
     Invokes an Amazon Bedrock model for general text generation (e.g., promo copy).
-    Returns raw text response.
+    Returns raw text response. Token usage is recorded on usage_tracker when provided.
+    The model is chosen by model_router for the given task_type.
     """
+    route_name, model_id = model_router.select(task_type)
+    started_at = time.time()
     try:
-        messages = [
-            {"role": "user", "content": [{"type": "text", "text": prompt_text}]}
-        ]
-
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 200, # Max 200 tokens for promo copy
-            "messages": messages
-        })
+        body = _build_text_generation_body(prompt_text, max_tokens)
         
-        print(f"DEBUG: Invoking Bedrock for general text with prompt (first 100 chars): {body[:100]}...")
-        response = bedrock_runtime.invoke_model(
-            modelId=bedrock_model_id,
+        print(f"DEBUG: Invoking Bedrock ({route_name} route, {model_id}) for general text with prompt (first 100 chars): {body[:100]}...")
+        response = bedrock_breaker.call(
+            bedrock_runtime.invoke_model,
+            modelId=model_id,
             contentType="application/json",
             accept="application/json",
             body=body
@@ -55,54 +192,175 @@ def _invoke_bedrock_model(prompt_text): # This is for general text generation (u
         # Extract the generated text from the response
         generated_text = response_body['content'][0]['text']
         print(f"DEBUG: Extracted generated text from Bedrock: {generated_text[:100]}...") # Print first 100 chars
+        _record_routed_call(route_name, started_at, prompt_text, generated_text, response_body.get('usage'))
+        if usage_tracker is not None:
+            call_usage = usage_tracker.record(task_type, prompt_text, generated_text, response_body.get('usage'))
+            print(f"DEBUG: Token usage for {task_type} call: input={call_usage['input_tokens']}, output={call_usage['output_tokens']}")
         return generated_text
 
+    except CircuitOpenError as e:
+        print(f"WARN: Skipping Bedrock general text generation: {e}")
+        return f"Error: {str(e)}"
     except ClientError as e:
+        _record_routed_call(route_name, started_at, prompt_text, '', success=False)
         print(f"ERROR: Bedrock Client Error for general text generation: {e.response['Error']['Message']}")
         return f"Error: {e.response['Error']['Message']}"
     except Exception as e:
+        _record_routed_call(route_name, started_at, prompt_text, '', success=False)
         import traceback # Import traceback here for local debugging
         print(f"ERROR: Unexpected error invoking Bedrock for general text generation: {e}")
         print(traceback.format_exc()) # Print full traceback
         return f"Error: {str(e)}"
 
-def _invoke_bedrock_model_for_recommendation(data_context_prompt): # This is for structured recommendations
+def _invoke_bedrock_model_stream(prompt_text, usage_tracker=None, task_type='promo_copy'):
     """
-    Invokes an Amazon Bedrock model to generate pricing/promotion recommendations
-    with reasoning, expecting a structured JSON output.
+    Invokes an Amazon Bedrock model for general text generation and yields the
+    generated text incrementally as Bedrock streams it back.
+    Errors (including CircuitOpenError while the Bedrock breaker is open) are raised
+    to the caller, which decides how to surface them mid-stream.
     """
+    route_name, model_id = model_router.select(task_type)
+    body = _build_text_generation_body(prompt_text)
+    if not bedrock_breaker.allow():
+        raise CircuitOpenError(f"Circuit breaker '{bedrock_breaker.name}' is open")
+    print(f"DEBUG: Invoking Bedrock ({route_name} route, {model_id}) with response stream for prompt (first 100 chars): {body[:100]}...")
+    started_at = time.time()
+    generated_chunks = []
+    reported_usage = {}
+    # None until the stream ends; a consumer that stops early (GeneratorExit) leaves it unset
+    succeeded = None
     try:
-        system_prompt = (
-            "You are an expert retail pricing and promotion strategist. "
-            "Your primary goal is to recommend optimal price adjustments or promotion strategies "
-            "to maximize revenue, clear inventory, or remain competitive. "
-            "Analyze the provided product data, market conditions, and demand forecasts. "
-            "If a price change is beneficial, recommend a specific 'recommended_price' that is different from 'current_price'. "
-            "If the current price is truly optimal, recommend the 'current_price'. "
-            "Provide your recommendation and detailed reasoning in a JSON format. "
-            "The JSON should contain: "
-            "'recommended_price' (float), "
-            "'recommendation_type' (string, MUST be 'price_adjustment' for price changes, or 'flash_sale', 'bundle_offer' for promotions), "
-            "'reason' (string explaining the decision), and "
-            "'promo_copy' (string, a short engaging marketing message if applicable, otherwise empty string). "
-            "Always output valid JSON only. Do not include any conversational text outside the JSON."
+        response = bedrock_runtime.invoke_model_with_response_stream(
+            modelId=model_id,
+            contentType="application/json",
+            accept="application/json",
+            body=body
         )
 
-        user_prompt = f"Analyze the following product context and provide an optimal strategy:\n\n{data_context_prompt}"
+        for event in response.get('body'):
+            chunk = event.get('chunk')
+            if not chunk:
+                continue
+            payload = json.loads(chunk.get('bytes'))
+            payload_type = payload.get('type')
+            if payload_type == 'message_start':
+                reported_usage.update(payload.get('message', {}).get('usage', {}))
+            elif payload_type == 'content_block_delta':
+                text = payload.get('delta', {}).get('text', '')
+                if text:
+                    if not generated_chunks:
+                        print(f"DEBUG: Bedrock stream time-to-first-token: {int((time.time() - started_at) * 1000)} ms")
+                    generated_chunks.append(text)
+                    yield text
+            elif payload_type == 'message_delta':
+                reported_usage.update(payload.get('usage', {}))
+        succeeded = True
+    except Exception:
+        succeeded = False
+        raise
+    finally:
+        if succeeded is None:
+            # Client disconnected mid-stream: says nothing about Bedrock's health, but frees a half-open probe
+            bedrock_breaker.release()
+        else:
+            bedrock_breaker.record(succeeded, (time.time() - started_at) * 1000)
+
+    generated_text = "".join(generated_chunks)
+    print(f"DEBUG: Bedrock stream completed in {int((time.time() - started_at) * 1000)} ms ({len(generated_text)} chars).")
+    _record_routed_call(route_name, started_at, prompt_text, generated_text, reported_usage)
+    if usage_tracker is not None:
+        usage_tracker.record(task_type, prompt_text, generated_text, reported_usage)
 
-        messages = [
-            {"role": "user", "content": [{"type": "text", "text": system_prompt + "\n\n" + user_prompt}]}
-        ]
+RECOMMENDATION_SYSTEM_PROMPT = (
+    "You are an expert retail pricing and promotion strategist. "
+    "Your primary goal is to recommend optimal price adjustments or promotion strategies "
+    "to maximize revenue, clear inventory, or remain competitive. "
+    "Analyze the provided product data, market conditions, and demand forecasts. "
+    "If a price change is beneficial, recommend a specific 'recommended_price' that is different from 'current_price'. "
+    "If the current price is truly optimal, recommend the 'current_price'. "
+    "Provide your recommendation and detailed reasoning in a JSON format. "
+    "The JSON should contain: "
+    "'recommended_price' (float), "
+    "'recommendation_type' (string, MUST be 'price_adjustment' for price changes, or 'flash_sale', 'bundle_offer' for promotions), "
+    "'reason' (string explaining the decision), and "
+    "'promo_copy' (string, a short engaging marketing message if applicable, otherwise empty string). "
+    "Always output valid JSON only. Do not include any conversational text outside the JSON."
+)
 
-        body = json.dumps({
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 500, 
-            "messages": messages
-        })
+def _build_recommendation_request(data_context_prompt, model_id=None):
+    """
+    Builds the Bedrock request for a structured pricing recommendation.
+    Returns the request body as a dict and the full prompt text (for token accounting).
+    The static instructions are sent as the system prompt, identical on every call, so the
+    provider can reuse the prefix; it is marked cacheable when model_id supports prompt caching.
+    Shared by synchronous invocation and batch inference manifests.
+    """
+    user_prompt = f"Analyze the following product context and provide an optimal strategy:\n\n{data_context_prompt}"
+    prompt_text = RECOMMENDATION_SYSTEM_PROMPT + "\n\n" + user_prompt
+    cacheable = prompt_cache_mode == CACHE_MODE_BEDROCK and supports_prompt_caching(model_id)
+
+    messages = [
+        {"role": "user", "content": [{"type": "text", "text": user_prompt}]}
+    ]
+    request_body = {
+        "anthropic_version": "bedrock-2023-05-31",
+        "max_tokens": 500, 
+        "system": build_system_blocks(RECOMMENDATION_SYSTEM_PROMPT, cacheable),
+        "messages": messages
+    }
+    return request_body, prompt_text
+
+def _parse_recommendation_text(generated_text, usage_tracker=None):
+    """
+    Parses the LLM's recommendation text into a validated dict.
+    JSON wrapped in prose is extracted and truncated JSON is repaired locally; only if that
+    fails is the model sent a short "fix this JSON" follow-up (not the full prompt again).
+    Returns None if no valid recommendation could be recovered.
+    """
+    recommendation, errors, repaired = parse_structured_output(generated_text or '')
+    if recommendation is not None and not errors:
+        if repaired:
+            print(f"DEBUG: Repaired truncated recommendation JSON locally.")
+        structured_output_stats.record('repaired_locally' if repaired else 'parsed')
+        return recommendation
+
+    broken_text = generated_text or ''
+    followup_calls = 0
+    for attempt in range(1, json_repair_retries + 1):
+        print(f"WARN: Recommendation output invalid ({'; '.join(errors)}). Requesting JSON fix (attempt {attempt}/{json_repair_retries}).")
+        followup_calls += 1
+        fixed_text = _invoke_bedrock_model(
+            build_json_fix_prompt(broken_text, errors), usage_tracker=usage_tracker, task_type='json_repair', max_tokens=500
+        )
+        if fixed_text.startswith("Error:"):
+            break
+        recommendation, errors, _ = parse_structured_output(fixed_text)
+        if recommendation is not None and not errors:
+            structured_output_stats.record('fixed_by_followup', followup_calls=followup_calls)
+            return recommendation
+        broken_text = fixed_text
+
+    structured_output_stats.record('failed', followup_calls=followup_calls)
+    print(f"ERROR: Bedrock did not return valid JSON for recommendation: {generated_text}")
+    return None
+
+def _invoke_bedrock_model_for_recommendation(data_context_prompt, usage_tracker=None, complexity=None): # This is for structured recommendations
+    """
+    Invokes an Amazon Bedrock model to generate pricing/promotion recommendations
+    with reasoning, expecting a structured JSON output.
+    Token usage is recorded on usage_tracker when provided.
+    complexity (0.0-1.0) decides whether the fast or the large model handles the call.
+    """
+    route_name, model_id = model_router.select('recommendation', complexity)
+    started_at = time.time()
+    request_body, prompt_text = _build_recommendation_request(data_context_prompt, model_id)
+    try:
+        body = json.dumps(request_body)
         
-        print(f"DEBUG: Invoking Bedrock for recommendation with prompt (first 200 chars): {body[:200]}...")
-        response = bedrock_runtime.invoke_model(
-            modelId=bedrock_model_id,
+        print(f"DEBUG: Invoking Bedrock ({route_name} route, {model_id}, complexity {complexity}) for recommendation with prompt (first 200 chars): {body[:200]}...")
+        response = bedrock_breaker.call(
+            bedrock_runtime.invoke_model,
+            modelId=model_id,
             contentType="application/json",
             accept="application/json",
             body=body
@@ -111,226 +369,765 @@ def _invoke_bedrock_model_for_recommendation(data_context_prompt): # This is for
         response_body = json.loads(response.get('body').read())
         generated_text = response_body['content'][0]['text']
         print(f"DEBUG: Bedrock raw recommendation response: {generated_text}")
+        reported_usage = response_body.get('usage')
+        if prompt_cache_mode == CACHE_MODE_SIMULATE:
+            reported_usage = prompt_cache_simulator.apply(model_id, RECOMMENDATION_SYSTEM_PROMPT, reported_usage, prompt_text)
+        _record_routed_call(route_name, started_at, prompt_text, generated_text, reported_usage)
+        if usage_tracker is not None:
+            call_usage = usage_tracker.record('recommendation', prompt_text, generated_text, reported_usage)
+            print(f"DEBUG: Token usage for recommendation call: input={call_usage['input_tokens']}, cache read={call_usage['cache_read_input_tokens']}, cache write={call_usage['cache_creation_input_tokens']}, output={call_usage['output_tokens']}")
 
-        try:
-            llm_recommendation = json.loads(generated_text)
-            return llm_recommendation
-        except json.JSONDecodeError:
-            print(f"ERROR: Bedrock did not return valid JSON for recommendation: {generated_text}")
-            return None
+        return _parse_recommendation_text(generated_text, usage_tracker)
 
+    except CircuitOpenError as e:
+        print(f"WARN: Skipping Bedrock recommendation: {e}")
+        return None
     except ClientError as e:
+        _record_routed_call(route_name, started_at, prompt_text, '', success=False)
         print(f"ERROR: Bedrock Client Error for recommendation: {e.response['Error']['Message']}")
         return None
     except Exception as e:
+        _record_routed_call(route_name, started_at, prompt_text, '', success=False)
         print(f"ERROR: Unexpected error invoking Bedrock for recommendation: {e}")
         return None
 
-def _send_customer_alert(customer_contact_info, message):
+def _load_strategy_inputs():
     """
-    Sends an alert to a customer using AWS SNS.
-    customer_contact_info can be a phone number for SMS or an email address.
+    Scans the forecast, inventory and customer profile tables for a strategy run.
     """
+    print(f"DEBUG: Scanning {demand_forecasts_table.name} for all forecasts.")
+    forecasts_response = demand_forecasts_table.scan()
+    all_forecasts = forecasts_response['Items']
+    print(f"DEBUG: Found {len(all_forecasts)} forecasts.")
+    
+    print(f"DEBUG: Scanning {inventory_table.name} for all inventory items.")
+    inventory_response = inventory_table.scan()
+    all_inventory_items = inventory_response['Items']
+    print(f"DEBUG: Found {len(all_inventory_items)} inventory items.")
+    
+    print(f"DEBUG: Scanning {customer_profiles_table.name} for all customer profiles.")
+    customer_response = customer_profiles_table.scan()
+    customer_profiles = customer_response['Items']
+    print(f"DEBUG: Found {len(customer_profiles)} customer profiles.")
+
+    return all_forecasts, all_inventory_items, customer_profiles
+
+def _index_latest_forecasts(all_forecasts):
+    """
+    Maps each sku_region_pk to its most recent forecast in a single pass over the forecasts.
+    """
+    latest_forecasts = {}
+    for forecast in all_forecasts:
+        sku_region_pk = forecast.get('sku_region_pk')
+        current = latest_forecasts.get(sku_region_pk)
+        if current is None or forecast['forecast_date'] > current['forecast_date']:
+            latest_forecasts[sku_region_pk] = forecast
+    return latest_forecasts
+
+def _build_product_snapshot(product_info, latest_forecasts, current_aws_region):
+    """
+    Extracts the numeric pricing inputs for one inventory item and its latest forecast.
+    Returns None if the item has no 'sku'.
+    """
+    sku = product_info.get('sku') 
+    if not sku:
+        print(f"WARN: Skipping inventory item due to missing 'sku' attribute: {product_info}")
+        return None
+
+    sku_region_pk = f"{sku}_{current_aws_region}"
+    
+    current_price = float(product_info.get('current_stock', Decimal('1.0')))
+    inventory = float(product_info.get('inventory', Decimal('0')))
+    cost = float(product_info.get('cost', Decimal(str(current_price * 0.7))))
+
+    latest_forecast = latest_forecasts.get(sku_region_pk)
+    demand_factor = float(latest_forecast.get('demand_factor', Decimal('1.0'))) if latest_forecast else 1.0
+    competitor_price = float(latest_forecast.get('competitor_price', Decimal('0.0'))) if latest_forecast and latest_forecast.get('competitor_price') is not None else None
+    forecasted_demand = float(latest_forecast.get('forecasted_demand_next_7_days') or 0) if latest_forecast else 0.0
+    # Minimum advertised price, if the inventory item carries one
+    map_price = float(product_info['map_price']) if product_info.get('map_price') is not None else None
+
+    return {
+        'sku': sku,
+        'sku_region_pk': sku_region_pk,
+        'category': product_info.get('category', "General"),
+        'current_price': current_price,
+        'inventory': inventory,
+        'cost': cost,
+        'demand_factor': demand_factor,
+        'competitor_price': competitor_price,
+        'forecasted_demand': forecasted_demand,
+        'map_price': map_price,
+    }
+
+def _build_pricing_recommendation_item(product, llm_recommendation_output, source='bedrock'):
+    """
+    Turns the LLM's recommendation output into a recommendations table item.
+    Returns None when the LLM recommended neither a price change nor a promotion.
+    """
+    current_price = product['current_price']
+    new_price = float(llm_recommendation_output.get('recommended_price', current_price))
+    recommendation_reason = llm_recommendation_output.get('reason', "LLM provided no specific reason.")
+    recommendation_type = llm_recommendation_output.get('recommendation_type', 'price_adjustment')
+    promo_copy = llm_recommendation_output.get('promo_copy', '')
+
+    if new_price == current_price and recommendation_type == 'price_adjustment':
+        print(f"DEBUG: LLM recommended no significant price change or specific promo for SKU {product['sku_region_pk']} (type: {recommendation_type}, price: {new_price}).")
+        return None
+
+    rec_id = f"llm_price_{product['sku']}_{int(time.time())}"
+    return {
+        'sku_region_pk': product['sku_region_pk'],
+        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'id': rec_id,
+        'sku': product['sku'],
+        'original_price': Decimal(str(current_price)),
+        'recommended_price': Decimal(str(new_price)),
+        'reason': recommendation_reason,
+        'type': recommendation_type, 
+        'promo_copy': promo_copy, 
+        'status': 'pending_review', 
+        'source': source,
+    }
+
+def _on_alerts_sent(sent_entries):
+    """
+    Marks the promotion ideas behind delivered alerts as 'sent', in PartiQL batches.
+    """
+    mark_promotion_ideas_sent(dynamodb.meta.client, recommendations_table.name, [entry['promo_key'] for entry in sent_entries])
+
+def _create_alert_worker_pool(outbox):
+    """
+    Creates the worker pool that drains the alert outbox, configured from the environment.
+    """
+    return AlertWorkerPool(
+        outbox,
+        sns_client,
+        sns_promotion_topic_arn,
+        max_workers=int(os.getenv("ALERT_WORKER_POOL_SIZE", "4")),
+        max_messages_per_second=float(os.getenv("ALERT_MAX_MESSAGES_PER_SECOND", "0")) or None,
+        max_attempts=int(os.getenv("ALERT_MAX_ATTEMPTS", "5")),
+        on_sent=_on_alerts_sent
+    )
+
+def _get_alert_worker_pool():
+    """
+    Returns the process-wide alert worker pool, creating it on first use.
+    """
+    global alert_worker_pool
+    with alert_worker_pool_lock:
+        if alert_worker_pool is None:
+            alert_worker_pool = _create_alert_worker_pool(alert_outbox)
+        return alert_worker_pool
+
+def _enqueue_customer_alerts(pending_alerts, promotion_ideas):
+    """
+    Writes the run's alerts to the outbox; delivery happens outside the pricing run.
+    With the local outbox a background worker pool starts draining immediately (in Lambda,
+    the pool drains before this returns); with ALERT_OUTBOX_TABLE a scheduled
+    {'mode': 'drain_alerts'} invocation drains the table.
+    """
+    promo_keys = {item['id']: {'sku_region_pk': item['sku_region_pk'], 'timestamp': item['timestamp']} for item in promotion_ideas}
+    entries = [build_outbox_entry(alert, promo_keys[alert['id']]) for alert in pending_alerts]
+    queued = alert_outbox.enqueue(entries) if entries else 0
+    print(f"DEBUG: Queued {queued} customer alerts in the {alert_outbox.name} outbox.")
+
+    if queued and alert_inline_drain:
+        _get_alert_worker_pool().drain(max_seconds=alert_inline_drain_seconds)
+    elif queued and isinstance(alert_outbox, LocalAlertOutbox):
+        _get_alert_worker_pool().start_background_drain()
+    return {'queued': queued, 'outbox': alert_outbox.name}
+
+def _run_alert_drain(event, context):
+    """
+    Handles {'mode': 'drain_alerts'}: delivers due alerts from the outbox until it is
+    empty or the invocation's time budget (minus a safety margin) runs out.
+    Meant to run on a schedule when ALERT_OUTBOX_TABLE is set.
+    """
+    max_seconds = float(event.get('max_seconds', 60))
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        max_seconds = min(max_seconds, context.get_remaining_time_in_millis() / 1000.0 - 5.0)
+    stats = _get_alert_worker_pool().drain(max_seconds=max(max_seconds, 1.0), wait_for_retries=False)
+    return {'statusCode': 200, 'body': json.dumps({'message': 'Alert outbox drained', 'outbox': alert_outbox.name, 'alert_delivery': stats})}
+
+def _persist_pricing_recommendations(pricing_recommendations):
+    """
+    Writes pricing recommendations in bulk (25 items per BatchWriteItem call).
+    """
+    if not pricing_recommendations:
+        return
+    print(f"DEBUG: Bulk writing {len(pricing_recommendations)} pricing recommendations to {recommendations_table.name}.")
     try:
-        if not sns_promotion_topic_arn:
-            print("WARN: SNS_PROMOTION_TOPIC_ARN not set in .env. Skipping customer alert.")
-            return False
-
-        if '@' in customer_contact_info: 
-            print(f"DEBUG: Attempting to send email alert via SNS topic {sns_promotion_topic_arn} to {customer_contact_info}")
-            sns_client.publish(
-                TopicArn=sns_promotion_topic_arn,
-                Message=message,
-                Subject="Exclusive Promotion Alert!"
-            )
-            print(f"DEBUG: Email alert sent to topic {sns_promotion_topic_arn} for {customer_contact_info}")
-        else: 
-            print(f"DEBUG: Attempting to send SMS alert to {customer_contact_info}")
-            sns_client.publish(
-                PhoneNumber=customer_contact_info,
-                Message=message
-            )
-            print(f"DEBUG: SMS alert sent to {customer_contact_info}")
-        return True
+        with recommendations_table.batch_writer() as batch:
+            for pricing_recommendation_item in pricing_recommendations:
+                batch.put_item(Item=pricing_recommendation_item)
+        print(f"DEBUG: Successfully wrote {len(pricing_recommendations)} pricing recommendations.")
     except ClientError as e:
-        print(f"ERROR: SNS Client Error sending alert to {customer_contact_info}: {e.response['Error']['Message']}")
-        return False
+        print(f"ERROR: ClientError bulk writing pricing recommendations: {e.response['Error']['Message']}")
     except Exception as e:
-        print(f"ERROR: Unexpected error sending alert to {customer_contact_info}: {e}")
-        return False
+        print(f"ERROR: Unexpected error bulk writing pricing recommendations: {e}")
 
-def lambda_handler(event, context):
+def _persist_promotion_ideas(promotion_ideas):
     """
-    Lambda function for the Promotion Strategy Agent.
-    Now uses Amazon Bedrock for core pricing/promotion recommendations.
+    Writes promotion ideas with their final status in bulk (25 items per BatchWriteItem call),
+    replacing a put plus a status update per idea.
     """
-    print("Promotion Strategy Agent triggered.")
+    if not promotion_ideas:
+        return
+    print(f"DEBUG: Bulk writing {len(promotion_ideas)} promotion ideas to {recommendations_table.name}.")
+    try:
+        with recommendations_table.batch_writer() as batch:
+            for promotion_idea_item in promotion_ideas:
+                batch.put_item(Item=promotion_idea_item)
+        print(f"DEBUG: Successfully wrote {len(promotion_ideas)} promotion ideas.")
+    except ClientError as e:
+        print(f"ERROR: ClientError bulk writing promotion ideas: {e.response['Error']['Message']}")
+    except Exception as e:
+        print(f"ERROR: Unexpected error bulk writing promotion ideas: {e}")
 
-    current_aws_region = os.getenv("AWS_REGION", "us-east-1").upper()
+# --- Batch Inference Mode (nightly full-catalog repricing) ---
 
-    try:
-        print(f"DEBUG: Scanning {demand_forecasts_table.name} for all forecasts.")
-        forecasts_response = demand_forecasts_table.scan()
-        all_forecasts = forecasts_response['Items']
-        print(f"DEBUG: Found {len(all_forecasts)} forecasts.")
-        
-        print(f"DEBUG: Scanning {inventory_table.name} for all inventory items.")
-        inventory_response = inventory_table.scan()
-        all_inventory_items = inventory_response['Items']
-        print(f"DEBUG: Found {len(all_inventory_items)} inventory items.")
-        
-        print(f"DEBUG: Scanning {customer_profiles_table.name} for all customer profiles.")
-        customer_response = customer_profiles_table.scan()
-        customer_profiles = customer_response['Items']
-        print(f"DEBUG: Found {len(customer_profiles)} customer profiles.")
+def _local_batch_responder(model_input):
+    """
+    Stand-in model for the local batch backend: applies the rule-based fallback recommender.
+    The data context is the last paragraph of the recommendation prompt.
+    """
+    prompt_text = model_input['messages'][0]['content'][0]['text']
+    data_context = json.loads(prompt_text.rsplit("\n\n", 1)[-1])
+    return json.dumps(rule_based_recommendation(
+        data_context['current_price'], data_context.get('cost_of_goods'), data_context.get('inventory') or 0.0,
+        data_context.get('latest_demand_factor'), data_context.get('latest_competitor_price')
+    ))
+
+def _create_batch_backend(backend_name=None):
+    """
+    Creates the batch inference backend named by BATCH_INFERENCE_BACKEND ('bedrock' or 'local').
+    """
+    backend_name = (backend_name or os.getenv("BATCH_INFERENCE_BACKEND", "local")).lower()
+    if backend_name == 'bedrock':
+        return BedrockBatchInferenceBackend(
+            bedrock_client=boto3.client('bedrock', region_name=os.getenv("AWS_REGION", "us-east-1")),
+            s3_client=boto3.client('s3', region_name=os.getenv("AWS_REGION", "us-east-1")),
+            bucket=os.getenv("BATCH_INFERENCE_S3_BUCKET", os.getenv("S3_PROCESSED_DATA_BUCKET")),
+            role_arn=os.getenv("BATCH_INFERENCE_ROLE_ARN"),
+            model_id=model_router.select('batch_recommendation')[1]
+        )
+    return LocalBatchInferenceBackend(work_dir=tempfile.gettempdir(), responder=_local_batch_responder)
 
-        pricing_recommendations = []
-        promotion_ideas = []
+def _submit_batch_job(backend, current_aws_region):
+    """
+    Writes one recommendation prompt per SKU to a JSONL manifest and submits it to the batch backend.
+    """
+    all_forecasts, all_inventory_items, customer_profiles = _load_strategy_inputs()
+    prompt_builder = PromptBuilder(customer_profiles)
+    latest_forecasts = _index_latest_forecasts(all_forecasts)
 
-        for current_product_info in all_inventory_items:
-            sku = current_product_info.get('sku') 
-            if not sku:
-                print(f"WARN: Skipping inventory item due to missing 'sku' attribute: {current_product_info}")
+    def _manifest_records():
+        for product_info in all_inventory_items:
+            product = _build_product_snapshot(product_info, latest_forecasts, current_aws_region)
+            if not product:
                 continue
+            data_context = prompt_builder.build_data_context(
+                product['sku'], product['current_price'], product['inventory'], product['cost'],
+                product['demand_factor'], product['competitor_price']
+            )
+            request_body, _ = _build_recommendation_request(prompt_builder.serialize(data_context))
+            yield build_manifest_record(product['sku_region_pk'], request_body)
 
-            sku_region_pk = f"{sku}_{current_aws_region}"
-            
-            current_price = float(current_product_info.get('current_stock', Decimal('1.0')))
-            inventory = float(current_product_info.get('inventory', Decimal('0')))
-            cost = float(current_product_info.get('cost', Decimal(str(current_price * 0.7))))
+    job_name = f"retail-pricing-batch-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}"
+    manifest_path = os.path.join(tempfile.gettempdir(), f"{job_name}.jsonl")
+    record_count = write_jsonl(manifest_path, _manifest_records())
+    print(f"DEBUG: Wrote {record_count} records to batch manifest {manifest_path}")
 
-            print(f"DEBUG: Processing SKU {sku_region_pk}. Current Price: {current_price}, Inventory: {inventory}, Cost: {cost}")
+    job = backend.submit(job_name, manifest_path)
+    job['record_count'] = record_count
+    return job
 
-            latest_forecast = next(
-                (f for f in sorted(all_forecasts, key=lambda x: x['forecast_date'], reverse=True) if f.get('sku_region_pk') == sku_region_pk),
-                None
-            )
-            
-            demand_factor = float(latest_forecast.get('demand_factor', Decimal('1.0'))) if latest_forecast else 1.0
-            competitor_price = float(latest_forecast.get('competitor_price', Decimal('0.0'))) if latest_forecast and latest_forecast.get('competitor_price') is not None else None
-            
-            print(f"DEBUG:   Demand Factor: {demand_factor}, Competitor Price: {competitor_price}")
-
-            # --- Prepare comprehensive data context for LLM ---
-            data_context = {
-                "sku": sku,
-                "current_price": current_price,
-                "inventory": inventory,
-                "cost_of_goods": cost,
-                "latest_demand_factor": demand_factor,
-                "latest_competitor_price": competitor_price,
-                "customer_segments_available": [c.get('segment') for c in customer_profiles if c.get('segment')],
-                "business_goal_priority": "maximize_revenue_and_clear_excess_inventory_and_be_competitive" 
-            }
-            context_prompt = json.dumps(data_context, indent=2)
-
-            # --- Invoke Bedrock for the core recommendation ---
-            llm_recommendation_output = _invoke_bedrock_model_for_recommendation(context_prompt)
-
-            if llm_recommendation_output:
-                new_price = float(llm_recommendation_output.get('recommended_price', current_price))
-                recommendation_reason = llm_recommendation_output.get('reason', "LLM provided no specific reason.")
-                recommendation_type = llm_recommendation_output.get('recommendation_type', 'price_adjustment')
-                promo_copy = llm_recommendation_output.get('promo_copy', '')
-
-                if new_price != current_price or recommendation_type != 'price_adjustment': 
-                    rec_id = f"llm_price_{sku}_{int(time.time())}"
-                    pricing_recommendation_item = {
-                        'sku_region_pk': sku_region_pk,
-                        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                        'id': rec_id,
-                        'sku': sku,
-                        'original_price': Decimal(str(current_price)),
-                        'recommended_price': Decimal(str(new_price)),
-                        'reason': recommendation_reason,
-                        'type': recommendation_type, 
-                        'promo_copy': promo_copy, 
-                        'status': 'pending_review', 
-                    }
-                    pricing_recommendations.append(pricing_recommendation_item)
-                    print(f"DEBUG: Attempting to put LLM-generated recommendation to {recommendations_table.name}: {rec_id}, New Price: {new_price}, Type: {recommendation_type}")
-                    try:
-                        recommendations_table.put_item(Item=pricing_recommendation_item)
-                        print(f"DEBUG: Successfully put LLM-generated recommendation {rec_id}")
-                    except ClientError as e:
-                        print(f"ERROR: ClientError putting LLM recommendation for SKU {sku_region_pk}: {e.response['Error']['Message']}")
-                    except Exception as e:
-                        print(f"ERROR: Unexpected error putting LLM recommendation for SKU {sku_region_pk}: {e}")
-                else:
-                    print(f"DEBUG: LLM recommended no significant price change or specific promo for SKU {sku_region_pk} (type: {recommendation_type}, price: {new_price}).")
-
-                # --- Handle Promotion Idea Generation and Alerting ---
-                if promo_copy:
-                    llm_promo_text = promo_copy
-                    print(f"DEBUG: Using promo copy directly from LLM's recommendation output.")
-                else:
-                    print(f"DEBUG: LLM did not provide promo_copy. Attempting to generate separate creative text.")
-                    user_prompt_for_llm_creative = (
-                        f"Generate a concise, engaging marketing message for product SKU '{sku}'. "
-                        f"Current inventory: {inventory} units. Demand factor: {demand_factor}. "
-                        f"Suggest a specific discount or offer. Max 50 words."
-                    )
-                    # Use the _invoke_bedrock_model function defined above for simple text generation
-                    llm_promo_text = _invoke_bedrock_model(user_prompt_for_llm_creative)
-
-
-                if llm_promo_text and "Error:" not in llm_promo_text: # Check for actual content, not just error string
-                    for customer in customer_profiles:
-                        if random.random() < 0.2: 
-                            customer_segment = customer['segment']
-                            customer_prefs = ", ".join(customer.get('preferences', []))
-                            customer_contact = customer.get('email') or customer.get('phone_number') 
-                            
-                            promo_id = f"promo_{sku}_{customer['customer_id']}_{int(time.time())}"
-                            promotion_idea_item = {
-                                'sku_region_pk': sku_region_pk,
-                                'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                                'id': promo_id,
-                                'sku': sku,
-                                'customer_id': customer['customer_id'],
-                                'customer_segment': customer_segment,
-                                'promo_text': llm_promo_text,
-                                'type': 'promotion_idea', 
-                                'status': 'draft', 
-                            }
-                            promotion_ideas.append(promotion_idea_item) 
-                            print(f"DEBUG: Attempting to put promo idea to {recommendations_table.name}: {promo_id}")
-                            try:
-                                recommendations_table.put_item(Item=promotion_idea_item)
-                                print(f"DEBUG: Successfully put promo idea {promo_id}")
-                                
-                                if customer_contact and llm_promo_text:
-                                    alert_message = f"📢 Special Offer for You!\nProduct: {sku}\nOffer: {llm_promo_text}\nDon't miss out!"
-                                    if _send_customer_alert(customer_contact, alert_message):
-                                        recommendations_table.update_item(
-                                            Key={'sku_region_pk': sku_region_pk, 'timestamp': promotion_idea_item['timestamp']},
-                                            UpdateExpression="SET #status = :sent_status",
-                                            ExpressionAttributeNames={'#status': 'status'},
-                                            ExpressionAttributeValues={':sent_status': 'sent'}
-                                        )
-                                        print(f"DEBUG: Successfully sent promotion alert for SKU {sku} to {customer_contact}. Status updated to 'sent'.")
-                                    else:
-                                        print(f"WARN: Failed to send promotion alert for SKU {sku} to {customer_contact}.")
-
-                            except ClientError as e:
-                                print(f"ERROR: ClientError putting promo idea for SKU {sku_region_pk}, segment {customer_segment}: {e.response['Error']['Message']}")
-                            except Exception as e:
-                                print(f"ERROR: Unexpected error putting promo idea for SKU {sku_region_pk}, segment {customer_segment}: {e}")
-                            break 
-                else:
-                    print(f"DEBUG: No valid promo copy generated for SKU {sku_region_pk} to send alerts.")
+def _ingest_batch_results(backend, job, current_aws_region):
+    """
+    Reads a completed batch job's JSONL results and bulk-writes the resulting
+    recommendations into the recommendations table.
+    """
+    print(f"DEBUG: Scanning {inventory_table.name} to resolve current prices for batch results.")
+    products = {}
+    for product_info in inventory_table.scan()['Items']:
+        product = _build_product_snapshot(product_info, {}, current_aws_region)
+        if product:
+            products[product['sku_region_pk']] = product
+
+    usage_tracker = TokenUsageTracker()
+    guardrail_engine.reset_stats()
+    pricing_recommendations = []
+    recommended_products = []
+    failed_records = []
+    for output_record in backend.fetch_results(job):
+        record_id = output_record.get('recordId')
+        product = products.get(record_id)
+        generated_text = extract_model_text(output_record)
+        if not product or generated_text is None:
+            print(f"WARN: Skipping batch record {record_id}: {output_record.get('error') or 'unknown SKU'}")
+            failed_records.append(record_id)
+            continue
+
+        usage_tracker.record('batch_recommendation', json.dumps(output_record.get('modelInput', {})), generated_text,
+                             (output_record.get('modelOutput') or {}).get('usage'))
+        llm_recommendation_output = _parse_recommendation_text(generated_text, usage_tracker)
+        if not llm_recommendation_output:
+            failed_records.append(record_id)
+            continue
+
+        pricing_recommendation_item = _build_pricing_recommendation_item(product, llm_recommendation_output, source='batch_inference')
+        if pricing_recommendation_item:
+            pricing_recommendations.append(pricing_recommendation_item)
+            recommended_products.append(product)
+
+    # All batch results go through the guardrails in one columnar pass
+    guardrail_engine.apply(pricing_recommendations, recommended_products)
+    print(f"DEBUG: Bulk writing {len(pricing_recommendations)} batch recommendations to {recommendations_table.name}.")
+    with recommendations_table.batch_writer() as batch:
+        for pricing_recommendation_item in pricing_recommendations:
+            batch.put_item(Item=pricing_recommendation_item)
+
+    return pricing_recommendations, failed_records, usage_tracker.summary()
+
+def _run_batch_mode(event, current_aws_region):
+    """
+    Handles the batch inference modes of the agent:
+    'batch_submit' submits a manifest and returns the job handle,
+    'batch_ingest' ingests a submitted job's results once it has finished (re-invoke while 'in_progress'),
+    'batch' submits, waits and ingests in one invocation (local runs and small catalogs).
+    """
+    mode = event['mode']
+    if mode == 'batch_ingest':
+        job = event['batch_job']
+        backend = _create_batch_backend(job.get('backend'))
+    else:
+        backend = _create_batch_backend()
+        job = _submit_batch_job(backend, current_aws_region)
+        if mode == 'batch_submit':
+            return {'statusCode': 202, 'body': json.dumps({'message': 'Batch inference job submitted', 'status': 'submitted', 'batch_job': job})}
+
+    if mode == 'batch':
+        status = wait_for_batch_job(backend, job, timeout_seconds=float(os.getenv("BATCH_INFERENCE_WAIT_SECONDS", "600")))
+    else:
+        status = backend.get_status(job)
+
+    if status not in BATCH_TERMINAL_STATUSES:
+        return {'statusCode': 202, 'body': json.dumps({'message': f'Batch inference job is {status}', 'status': 'in_progress', 'batch_job': job})}
+    if status not in BATCH_SUCCESS_STATUSES:
+        print(f"ERROR: Batch inference job {job['job_id']} ended with status {status}.")
+        return {'statusCode': 500, 'body': json.dumps({'message': f'Batch inference job ended with status {status}', 'status': status, 'batch_job': job})}
+
+    pricing_recommendations, failed_records, token_usage = _ingest_batch_results(backend, job, current_aws_region)
+    print(f"Ingested {len(pricing_recommendations)} batch pricing recommendations ({len(failed_records)} records failed).")
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': 'Batch strategy recommendations ingested successfully',
+            'status': status,
+            'batch_job': job,
+            'pricing_recommendations': pricing_recommendations,
+            'promotion_ideas': [],
+            'failed_records': failed_records,
+            'token_usage': token_usage,
+            'guardrails': guardrail_engine.summary()
+        }, default=str)
+    }
+
+def _start_strategy_run(customer_profiles):
+    """
+    Resets per-run metrics and builds the per-run state shared by every SKU:
+    the prompt builder, the customer targeting index and the result lists.
+    """
+    global structured_output_stats
+    model_router.reset_metrics()
+    structured_output_stats = StructuredOutputStats()
+    promo_copy_library.reset_stats()
+    guardrail_engine.reset_stats()
+
+    # Distinct customer segments are computed once per run rather than once per SKU.
+    prompt_builder = PromptBuilder(customer_profiles)
+    print(f"DEBUG: Found {len(prompt_builder.customer_segments)} distinct customer segments.")
+    targeting_index = CustomerTargetingIndex(customer_profiles)
+    print(f"DEBUG: Indexed {len(targeting_index.customers)} customers across {len(targeting_index.by_preference)} preferences.")
+
+    def _generate_promo_template(prompt_text):
+        return _invoke_bedrock_model(prompt_text, usage_tracker=prompt_builder.usage, task_type='promo_template')
+
+    return {
+        'prompt_builder': prompt_builder,
+        'targeting_index': targeting_index,
+        'generate_promo_template': _generate_promo_template,
+        'pricing_recommendations': [],
+        'promotion_ideas': [],
+        'pending_alerts': [],
+        # How many of the run's results have been written so far
+        'persisted_pricing': 0,
+        'persisted_promotions': 0,
+        'alert_delivery': {'queued': 0, 'outbox': alert_outbox.name},
+    }
+
+def _process_sku(run, product):
+    """
+    Generates the pricing recommendation and promotion ideas for one SKU and adds
+    them to the run. Safe to call from several worker threads for the same run.
+    """
+    sku = product['sku']
+    sku_region_pk = product['sku_region_pk']
+    inventory = product['inventory']
+    demand_factor = product['demand_factor']
+
+    print(f"DEBUG: Processing SKU {sku_region_pk}. Current Price: {product['current_price']}, Inventory: {inventory}, Cost: {product['cost']}")
+    print(f"DEBUG:   Demand Factor: {demand_factor}, Competitor Price: {product['competitor_price']}")
+
+    # --- Prepare compact data context for LLM ---
+    data_context = run['prompt_builder'].build_data_context(
+        sku, product['current_price'], inventory, product['cost'], demand_factor, product['competitor_price']
+    )
+    context_prompt = run['prompt_builder'].serialize(data_context)
+
+    # --- Invoke Bedrock for the core recommendation (fast or large model by complexity) ---
+    complexity = score_pricing_complexity(product)
+    llm_recommendation_output = _invoke_bedrock_model_for_recommendation(context_prompt, usage_tracker=run['prompt_builder'].usage, complexity=complexity)
+    recommendation_source = 'bedrock'
+    if not llm_recommendation_output:
+        # Bedrock failed or its breaker is open: fall back to deterministic rules rather than skip the SKU
+        print(f"WARN: No usable Bedrock recommendation for SKU {sku_region_pk}; using the rule-based fallback.")
+        llm_recommendation_output = fallback_for_product(product)
+        recommendation_source = FALLBACK_SOURCE
+
+    if llm_recommendation_output:
+        promo_copy = llm_recommendation_output.get('promo_copy', '')
+        pricing_recommendation_item = _build_pricing_recommendation_item(product, llm_recommendation_output, source=recommendation_source)
+
+        if pricing_recommendation_item:
+            # Guardrails run before the promo copy is written, so copy quotes the price that will be stored
+            guardrail_engine.apply([pricing_recommendation_item], [product])
+            if pricing_recommendation_item['guardrail_status'] == GUARDRAIL_REJECTED:
+                print(f"WARN: Guardrails rejected the recommendation for SKU {sku_region_pk}: {pricing_recommendation_item['guardrail_reasons']}")
             else:
-                print(f"WARN: Bedrock recommendation invocation failed or returned no valid output for SKU {sku_region_pk}.")
+                llm_recommendation_output['recommended_price'] = float(pricing_recommendation_item['recommended_price'])
+
+            # Written in bulk at the next checkpoint (see _flush_strategy_run)
+            run['pricing_recommendations'].append(pricing_recommendation_item)
+            print(f"DEBUG: Queued LLM-generated recommendation {pricing_recommendation_item['id']}, New Price: {pricing_recommendation_item['recommended_price']}, Type: {pricing_recommendation_item['type']}")
+
+        # --- Handle Promotion Idea Generation and Alerting ---
+        # Target the top-K customers by preference/segment affinity for this SKU's category,
+        # rotating past customers who already got PROMO_MAX_ALERTS_PER_CUSTOMER alerts this run
+        targets = run['targeting_index'].top_customers(product['category'], promo_target_top_k)
+        if pricing_recommendation_item and pricing_recommendation_item['guardrail_status'] == GUARDRAIL_REJECTED:
+            # A price that failed the business rules is not promoted
+            llm_promo_text = None
+        elif not targets:
+            llm_promo_text = None
+        elif promo_copy:
+            llm_promo_text = promo_copy
+            print(f"DEBUG: Using promo copy directly from LLM's recommendation output.")
+        else:
+            # Fill the cluster's template locally; the LLM is only called for a cluster's first SKU
+            llm_promo_text, copy_source = promo_copy_library.get_copy(
+                sku, product['category'], product['current_price'], llm_recommendation_output.get('recommended_price'),
+                llm_recommendation_output.get('recommendation_type'), targets[0][0].get('segment'), run['generate_promo_template']
+            )
+            print(f"DEBUG: LLM did not provide promo_copy. Using promo copy from {copy_source}.")
+
+        if llm_promo_text and "Error:" not in llm_promo_text: # Check for actual content, not just error string
+            for customer, affinity_score in targets:
+                customer_segment = customer.get('segment')
+                customer_contact = customer.get('email') or customer.get('phone_number') 
+                
+                promo_id = f"promo_{sku}_{customer['customer_id']}_{int(time.time())}"
+                promotion_idea_item = {
+                    'sku_region_pk': sku_region_pk,
+                    # Customer suffix keeps the sort key unique when several customers are targeted in the same second
+                    'timestamp': f"{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}#{customer['customer_id']}",
+                    'id': promo_id,
+                    'sku': sku,
+                    'customer_id': customer['customer_id'],
+                    'customer_segment': customer_segment,
+                    'affinity_score': Decimal(str(affinity_score)),
+                    'promo_text': llm_promo_text,
+                    'type': 'promotion_idea', 
+                    'status': 'draft', 
+                }
+                run['promotion_ideas'].append(promotion_idea_item) 
+                print(f"DEBUG: Queued promo idea {promo_id} for customer {customer['customer_id']} (affinity {affinity_score})")
+
+                # Alerts go to the outbox after the pricing loop rather than one SNS round trip per customer
+                if customer_contact:
+                    run['pending_alerts'].append(build_topic_alert(
+                        promo_id, build_alert_message(sku, llm_promo_text), customer['customer_id'], customer_segment, sku, customer_contact
+                    ))
+        else:
+            # No alert goes out for this SKU, so its targets stay available to later SKUs
+            run['targeting_index'].release(targets)
+            print(f"DEBUG: No valid promo copy generated for SKU {sku_region_pk} to send alerts.")
+    else:
+        print(f"WARN: Bedrock recommendation invocation failed or returned no valid output for SKU {sku_region_pk}.")
+
+def _flush_strategy_run(run):
+    """
+    Persists the results added since the last flush and queues their alerts.
+    Not thread-safe; call it when no worker is processing SKUs for the run.
+    """
+    new_pricing = run['pricing_recommendations'][run['persisted_pricing']:]
+    new_promotions = run['promotion_ideas'][run['persisted_promotions']:]
+    pending_alerts, run['pending_alerts'] = run['pending_alerts'], []
+
+    # Decisions are persisted first; alerts are handed to the outbox and delivered asynchronously
+    _persist_pricing_recommendations(new_pricing)
+    _persist_promotion_ideas(new_promotions)
+    run['persisted_pricing'] += len(new_pricing)
+    run['persisted_promotions'] += len(new_promotions)
+    if pending_alerts:
+        run['alert_delivery']['queued'] += _enqueue_customer_alerts(pending_alerts, new_promotions)['queued']
 
-        print(f"Generated {len(pricing_recommendations)} pricing recommendations and {len(promotion_ideas)} promotion ideas.")
+def _save_checkpoint(run, checkpoint, base_counts, skus_processed, processed_since_save, status=CHECKPOINT_STATUS_IN_PROGRESS):
+    """
+    Flushes the run's results, then records the SKUs processed since the last save
+    (processed_since_save, a list of sku_region_pks that is emptied) as done, so a resumed
+    run skips exactly them. base_counts are the checkpoint's totals when this invocation started.
+    """
+    _flush_strategy_run(run)
+    if processed_since_save:
+        checkpoint['processed_skus'].extend(processed_since_save)
+        checkpoint['cursor'] = processed_since_save[-1]
+        del processed_since_save[:]
+    checkpoint.update(
+        status=status,
+        skus_processed=base_counts['skus_processed'] + skus_processed,
+        pricing_recommendations=base_counts['pricing_recommendations'] + len(run['pricing_recommendations']),
+        promotion_ideas=base_counts['promotion_ideas'] + len(run['promotion_ideas']),
+    )
+    checkpoint_store.save(checkpoint)
+    print(f"DEBUG: Checkpointed run {checkpoint['run_id']} at {checkpoint['cursor']} ({checkpoint['skus_processed']} SKUs processed, status {status}).")
+
+def _finish_strategy_run(run, extra_body=None, status_code=200):
+    """
+    Persists any remaining results, queues their alerts and builds the Lambda response.
+    """
+    pricing_recommendations = run['pricing_recommendations']
+    promotion_ideas = run['promotion_ideas']
+    _flush_strategy_run(run)
+    alert_delivery = run['alert_delivery']
+
+    token_usage = run['prompt_builder'].usage.summary()
+    model_routing = model_router.metrics()
+    structured_output = structured_output_stats.summary()
+    promo_copy_stats = promo_copy_library.summary()
+    print(f"Promo copy: {promo_copy_stats['template_generations']} template generations, {promo_copy_stats['template_reuses']} template reuses, {promo_copy_stats['rendered_cache_hits']} rendered cache hits.")
+    print(f"Generated {len(pricing_recommendations)} pricing recommendations and {len(promotion_ideas)} promotion ideas.")
+    print(f"Token usage for this run: {token_usage['calls']} calls, {token_usage['input_tokens']} uncached input tokens, {token_usage['cache_read_input_tokens']} cache-read input tokens, {token_usage['output_tokens']} output tokens.")
+    for route_name, route_metrics in model_routing.items():
+        print(f"Model route '{route_name}': {route_metrics['calls']} calls, avg {route_metrics['avg_latency_ms']} ms, ~${route_metrics['estimated_cost_usd']}.")
+    body = {
+        'message': 'Strategy recommendations generated successfully',
+        'pricing_recommendations': pricing_recommendations,
+        'promotion_ideas': promotion_ideas,
+        'token_usage': token_usage,
+        'model_routing': model_routing,
+        'structured_output': structured_output,
+        'promo_copy': promo_copy_stats,
+        'alert_delivery': alert_delivery,
+        'guardrails': guardrail_engine.summary(),
+        'fallback_recommendations': sum(1 for item in pricing_recommendations if item.get('source') == FALLBACK_SOURCE),
+        'circuit_breaker': bedrock_breaker.snapshot()
+    }
+    body.update(extra_body or {})
+    return {
+        'statusCode': status_code,
+        'body': json.dumps(body, default=str)
+    }
+
+def run_pipelined_strategy(forecast_stream, worker_count=None, queue_size=None):
+    """
+    Runs the strategy stage on forecasts as they are produced instead of re-scanning
+    the forecasts table. forecast_stream yields (inventory_item, forecast_item) pairs
+    (see demand_forecast_agent.generate_forecasts); it is consumed on a producer thread
+    and handed to strategy workers through a bounded priority queue, so LLM latency overlaps
+    with forecasting and a slow strategy stage applies backpressure to the producer.
+    When forecasts arrive faster than they are processed, the highest-impact queued SKU goes first.
+    """
+    worker_count = worker_count or int(os.getenv("PIPELINE_STRATEGY_WORKERS", "4"))
+    queue_size = queue_size or int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+    current_aws_region = os.getenv("AWS_REGION", "us-east-1").upper()
+    print(f"Promotion Strategy Agent triggered (pipelined, {worker_count} workers, queue size {queue_size}).")
+
+    try:
+        print(f"DEBUG: Scanning {customer_profiles_table.name} for all customer profiles.")
+        customer_profiles = customer_profiles_table.scan()['Items']
+        run = _start_strategy_run(customer_profiles)
+
+        work_queue = queue.PriorityQueue(maxsize=queue_size)
+        priority_weights = load_priority_weights()
+        # Sequence numbers break priority ties so queue entries never compare the items themselves
+        sequence = itertools.count()
+        started_at = time.time()
+        stats = {'forecasts_received': 0, 'skus_processed': 0, 'producer_seconds': None, 'first_sku_seconds': None, 'producer_error': None}
+        stats_lock = threading.Lock()
+
+        def _produce():
+            try:
+                for inventory_item, forecast_item in forecast_stream:
+                    product = _build_product_snapshot(inventory_item, {forecast_item['sku_region_pk']: forecast_item} if forecast_item else {}, current_aws_region)
+                    if not product:
+                        continue
+                    work_queue.put((-impact_score(product, priority_weights), next(sequence), product))
+                    with stats_lock:
+                        stats['forecasts_received'] += 1
+            except Exception as e:
+                print(f"ERROR: Forecast stage failed in pipelined run: {e}")
+                stats['producer_error'] = str(e)
+            finally:
+                stats['producer_seconds'] = round(time.time() - started_at, 3)
+                # Sentinels sort after every real item
+                for _ in range(worker_count):
+                    work_queue.put((float('inf'), next(sequence), None))
+
+        def _consume():
+            while True:
+                _, _, product = work_queue.get()
+                if product is None:
+                    return
+                try:
+                    _process_sku(run, product)
+                except Exception as e:
+                    print(f"ERROR: Strategy worker failed for SKU {product['sku_region_pk']}: {e}")
+                with stats_lock:
+                    stats['skus_processed'] += 1
+                    if stats['first_sku_seconds'] is None:
+                        stats['first_sku_seconds'] = round(time.time() - started_at, 3)
+
+        producer = threading.Thread(target=_produce, name='forecast-producer', daemon=True)
+        workers = [threading.Thread(target=_consume, name=f'strategy-worker-{i}', daemon=True) for i in range(worker_count)]
+        producer.start()
+        for worker in workers:
+            worker.start()
+        producer.join()
+        for worker in workers:
+            worker.join()
+
+        stats['total_seconds'] = round(time.time() - started_at, 3)
+        stats['worker_count'] = worker_count
+        print(f"Pipelined run: {stats['skus_processed']} SKUs in {stats['total_seconds']} s (forecast stage finished at {stats['producer_seconds']} s).")
+        return _finish_strategy_run(run, {'pipeline': stats})
+    except Exception as e:
+        import traceback
+        print(f"ERROR: Error in pipelined Promotion Strategy Agent run: {e}")
+        print(traceback.format_exc())
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Strategy recommendations generated successfully',
-                'pricing_recommendations': pricing_recommendations,
-                'promotion_ideas': promotion_ideas
-            }, default=str)
+            'statusCode': 500,
+            'body': json.dumps({'message': f'Error generating strategy recommendations: {str(e)}'})
         }
+
+def _run_checkpointed_strategy(event, context, current_aws_region):
+    """
+    Processes SKUs in order of expected revenue impact, as ranked when the run started, until
+    done or the invocation's time (or STRATEGY_TOKEN_BUDGET token) budget runs low,
+    checkpointing every STRATEGY_CHECKPOINT_EVERY SKUs. A run that stops early returns
+    status 'in_progress' (HTTP 202) and a resume_token; re-invoke with {'resume_token': ...}
+    to continue where it left off. In Lambda that needs STRATEGY_CHECKPOINT_TABLE; without it
+    no resume_token is returned.
+    """
+    resume_token = event.get('resume_token')
+    if resume_token and not checkpoint_resumable:
+        return {'statusCode': 400, 'body': json.dumps({'message': 'Strategy runs cannot be resumed without STRATEGY_CHECKPOINT_TABLE'})}
+    if resume_token:
+        checkpoint = checkpoint_store.load(resume_token)
+        if checkpoint is None:
+            return {'statusCode': 404, 'body': json.dumps({'message': f'No checkpoint found for resume token {resume_token}'})}
+        if checkpoint['status'] == CHECKPOINT_STATUS_COMPLETE:
+            return {'statusCode': 200, 'body': json.dumps({'message': 'Strategy run already complete', 'status': 'complete', 'resume_token': None, 'checkpoint': checkpoint_summary(checkpoint), 'pricing_recommendations': [], 'promotion_ideas': []}, default=str)}
+        print(f"DEBUG: Resuming strategy run {resume_token} after {checkpoint['cursor']} ({len(checkpoint['processed_skus'])} SKUs done).")
+    else:
+        checkpoint = new_checkpoint(f"strategy-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}-{uuid.uuid4().hex[:8]}")
+    checkpoint['invocations'] += 1
+    base_counts = {name: checkpoint[name] for name in ('skus_processed', 'pricing_recommendations', 'promotion_ideas')}
+
+    budget = TimeBudget(
+        context,
+        budget_seconds=float(os.getenv("STRATEGY_TIME_BUDGET_SECONDS", "0")) or None,
+        safety_margin_seconds=float(os.getenv("STRATEGY_SAFETY_MARGIN_SECONDS", "30"))
+    )
+
+    all_forecasts, all_inventory_items, customer_profiles = _load_strategy_inputs()
+    latest_forecasts = _index_latest_forecasts(all_forecasts)
+    products = rank_products([
+        product for product in (_build_product_snapshot(item, latest_forecasts, current_aws_region) for item in all_inventory_items) if product
+    ])
+    # Inputs (prices, forecasts) change between invocations, so a run keeps the order it ranked at
+    # its start; SKUs added since then go last, in current rank order
+    if checkpoint.get('priority_order'):
+        frozen_positions = {sku_region_pk: position for position, sku_region_pk in enumerate(checkpoint['priority_order'])}
+        products.sort(key=lambda product: frozen_positions.get(product['sku_region_pk'], len(frozen_positions)))
+    else:
+        checkpoint['priority_order'] = [product['sku_region_pk'] for product in products]
+    processed = set(checkpoint.get('processed_skus') or [])
+    if processed:
+        products = [product for product in products if product['sku_region_pk'] not in processed]
+    print(f"DEBUG: {len(products)} SKUs left to process in run {checkpoint['run_id']}.")
+    run = _start_strategy_run(customer_profiles)
+
+    processed_since_save = []
+    skus_processed = 0
+    stop_reason = None
+    for product in products:
+        if budget.should_stop():
+            stop_reason = 'time_budget'
+            print(f"WARN: Time budget nearly exhausted ({budget.remaining_seconds():.1f} s left); stopping after {skus_processed} SKUs.")
+            break
+        if strategy_token_budget:
+            token_usage = run['prompt_builder'].usage.summary()
+            if token_usage['input_tokens'] + token_usage['output_tokens'] >= strategy_token_budget:
+                stop_reason = 'token_budget'
+                print(f"WARN: Token budget of {strategy_token_budget} reached; stopping after {skus_processed} SKUs.")
+                break
+        _process_sku(run, product)
+        budget.record_unit()
+        skus_processed += 1
+        processed_since_save.append(product['sku_region_pk'])
+        if skus_processed % strategy_checkpoint_every == 0:
+            _save_checkpoint(run, checkpoint, base_counts, skus_processed, processed_since_save)
+
+    complete = skus_processed == len(products)
+    _save_checkpoint(run, checkpoint, base_counts, skus_processed, processed_since_save, CHECKPOINT_STATUS_COMPLETE if complete else CHECKPOINT_STATUS_IN_PROGRESS)
+    covered_impact = sum(product['impact_score'] for product in products[:skus_processed])
+    total_impact = sum(product['impact_score'] for product in products)
+    return _finish_strategy_run(
+        run,
+        {
+            'status': 'complete' if complete else 'in_progress',
+            'stop_reason': stop_reason,
+            'resume_token': checkpoint['run_id'] if checkpoint_resumable and not complete else None,
+            'checkpoint': checkpoint_summary(checkpoint),
+            # Share of this invocation's remaining expected impact that it covered
+            'impact_coverage': round(covered_impact / total_impact, 4) if total_impact else 1.0,
+        },
+        status_code=200 if complete else 202
+    )
+
+def lambda_handler(event, context):
+    """
+    Lambda function for the Promotion Strategy Agent.
+    Now uses Amazon Bedrock for core pricing/promotion recommendations.
+    Pass {'mode': 'batch' | 'batch_submit' | 'batch_ingest'} to use batch inference instead
+    of per-SKU synchronous calls (pricing recommendations only, no customer alerts),
+    or {'mode': 'drain_alerts'} to deliver queued customer alerts from the outbox.
+    Synchronous runs stop before the Lambda timeout and return a resume_token;
+    pass {'resume_token': ...} to continue the run.
+    """
+    print("Promotion Strategy Agent triggered.")
+
+    current_aws_region = os.getenv("AWS_REGION", "us-east-1").upper()
+
+    try:
+        if (event or {}).get('mode') in ('batch', 'batch_submit', 'batch_ingest'):
+            return _run_batch_mode(event, current_aws_region)
+        if (event or {}).get('mode') == 'drain_alerts':
+            return _run_alert_drain(event, context)
+
+        return _run_checkpointed_strategy(event or {}, context, current_aws_region)
     except Exception as e:
         import traceback
         print(f"ERROR: Error in Promotion Strategy Agent: {e}")
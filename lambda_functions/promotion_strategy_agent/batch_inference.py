@@ -0,0 +1,151 @@
+import json
+import os
+import time
+
+# Terminal states of a Bedrock model invocation job
+BATCH_TERMINAL_STATUSES = ('Completed', 'PartiallyCompleted', 'Failed', 'Stopped', 'Expired')
+BATCH_SUCCESS_STATUSES = ('Completed', 'PartiallyCompleted')
+
+
+def build_manifest_record(record_id, model_input):
+    """
+    Builds one line of a batch inference manifest in the Bedrock batch input format.
+    """
+    return {"recordId": record_id, "modelInput": model_input}
+
+
+def write_jsonl(path, records):
+    """
+    Writes records to a JSONL file, one JSON document per line. Returns the record count.
+    """
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(',', ':'), default=str))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def read_jsonl_lines(lines):
+    """
+    Parses JSONL lines, skipping blank and malformed lines.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError:
+            print(f"WARN: Skipping malformed batch output line: {line[:200]}")
+
+
+def extract_model_text(output_record):
+    """
+    Returns the generated text of a batch output record, or None if the record failed.
+    """
+    if output_record.get('error'):
+        return None
+    model_output = output_record.get('modelOutput') or {}
+    content = model_output.get('content') or []
+    if not content:
+        return None
+    return content[0].get('text')
+
+
+class LocalBatchInferenceBackend:
+    """
+    In-process stand-in for a batch inference service, for local runs and testing.
+    Each manifest record is answered by a responder function that receives the
+    record's modelInput and returns the generated text. Jobs complete on submit.
+    """
+    name = 'local'
+
+    def __init__(self, work_dir, responder):
+        self.work_dir = work_dir
+        self.responder = responder
+
+    def submit(self, job_name, manifest_path):
+        output_path = os.path.join(self.work_dir, f"{job_name}.jsonl.out")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            records = list(read_jsonl_lines(f))
+
+        def _outputs():
+            for record in records:
+                try:
+                    text = self.responder(record['modelInput'])
+                    yield dict(record, modelOutput={'content': [{'type': 'text', 'text': text}]})
+                except Exception as e:
+                    yield dict(record, error={'errorMessage': str(e)})
+
+        write_jsonl(output_path, _outputs())
+        print(f"DEBUG: Local batch backend processed {len(records)} records into {output_path}")
+        return {'backend': self.name, 'job_id': job_name, 'output_location': output_path}
+
+    def get_status(self, job):
+        return 'Completed' if os.path.exists(job['output_location']) else 'Failed'
+
+    def fetch_results(self, job):
+        with open(job['output_location'], 'r', encoding='utf-8') as f:
+            yield from read_jsonl_lines(f)
+
+
+class BedrockBatchInferenceBackend:
+    """
+    Submits manifests to Amazon Bedrock batch inference (model invocation jobs).
+    The manifest is staged in S3 and results are read back from the job's S3 output prefix.
+    """
+    name = 'bedrock'
+
+    def __init__(self, bedrock_client, s3_client, bucket, role_arn, model_id, prefix='batch-inference'):
+        self.bedrock_client = bedrock_client
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.role_arn = role_arn
+        self.model_id = model_id
+        self.prefix = prefix.strip('/')
+
+    def submit(self, job_name, manifest_path):
+        input_key = f"{self.prefix}/{job_name}/input/records.jsonl"
+        output_prefix = f"{self.prefix}/{job_name}/output/"
+        print(f"DEBUG: Uploading batch manifest to s3://{self.bucket}/{input_key}")
+        self.s3_client.upload_file(manifest_path, self.bucket, input_key)
+
+        response = self.bedrock_client.create_model_invocation_job(
+            jobName=job_name,
+            roleArn=self.role_arn,
+            modelId=self.model_id,
+            inputDataConfig={'s3InputDataConfig': {'s3Uri': f"s3://{self.bucket}/{input_key}", 's3InputFormat': 'JSONL'}},
+            outputDataConfig={'s3OutputDataConfig': {'s3Uri': f"s3://{self.bucket}/{output_prefix}"}}
+        )
+        print(f"DEBUG: Created Bedrock model invocation job {response['jobArn']}")
+        return {'backend': self.name, 'job_id': response['jobArn'], 'output_location': output_prefix}
+
+    def get_status(self, job):
+        return self.bedrock_client.get_model_invocation_job(jobIdentifier=job['job_id'])['status']
+
+    def fetch_results(self, job):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=job['output_location']):
+            for obj in page.get('Contents', []):
+                if not obj['Key'].endswith('.jsonl.out'):
+                    continue
+                body = self.s3_client.get_object(Bucket=self.bucket, Key=obj['Key'])['Body']
+                yield from read_jsonl_lines(line.decode('utf-8') for line in body.iter_lines())
+
+
+def wait_for_batch_job(backend, job, poll_interval_seconds=30, timeout_seconds=None):
+    """
+    Polls a batch job until it reaches a terminal status or the timeout elapses.
+    Returns the last observed status.
+    """
+    started_at = time.time()
+    while True:
+        status = backend.get_status(job)
+        if status in BATCH_TERMINAL_STATUSES:
+            return status
+        if timeout_seconds is not None and time.time() - started_at >= timeout_seconds:
+            return status
+        print(f"DEBUG: Batch job {job['job_id']} is {status}; checking again in {poll_interval_seconds}s.")
+        time.sleep(poll_interval_seconds)
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+from decimal import Decimal
+
+CHECKPOINT_STATUS_IN_PROGRESS = 'in_progress'
+CHECKPOINT_STATUS_COMPLETE = 'complete'
+
+# Per-SKU list fields, stored compressed in DynamoDB to stay well under the 400 KB item limit
+COMPRESSED_FIELDS = ('processed_skus', 'priority_order')
+
+
+def new_checkpoint(run_id):
+    """
+    Builds the initial checkpoint of a strategy run. 'priority_order' is the ranked list of
+    sku_region_pks, frozen when the run starts so every invocation works through the same
+    order. 'processed_skus' lists the sku_region_pk of every SKU whose results are persisted;
+    a resumed run skips exactly those. 'cursor' is the last of them, for progress reporting.
+    """
+    return {
+        'run_id': run_id,
+        'status': CHECKPOINT_STATUS_IN_PROGRESS,
+        'cursor': None,
+        'priority_order': [],
+        'processed_skus': [],
+        'skus_processed': 0,
+        'pricing_recommendations': 0,
+        'promotion_ideas': 0,
+        'invocations': 0,
+        'started_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        'updated_at': None,
+    }
+
+
+def checkpoint_summary(checkpoint):
+    """
+    Returns the checkpoint without its per-SKU lists, for responses and logs.
+    """
+    summary = {key: value for key, value in checkpoint.items() if key not in COMPRESSED_FIELDS}
+    summary['skus_done'] = len(checkpoint.get('processed_skus') or [])
+    return summary
+
+
+class LocalCheckpointStore:
+    """
+    Stores strategy run checkpoints as JSON files, one per run, for local runs.
+    """
+    name = 'local'
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'strategy-checkpoints')
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _path(self, run_id):
+        return os.path.join(self.directory, f"{run_id}.json")
+
+    def load(self, run_id):
+        try:
+            with open(self._path(run_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, checkpoint):
+        checkpoint['updated_at'] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        path = self._path(checkpoint['run_id'])
+        with self._lock:
+            # Write-then-rename so a crash never leaves a half-written checkpoint
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(checkpoint, f)
+            os.replace(path + '.tmp', path)
+
+
+class DynamoDBCheckpointStore:
+    """
+    Stores strategy run checkpoints in a DynamoDB table with partition key 'run_id'.
+    """
+    name = 'dynamodb'
+
+    def __init__(self, table):
+        self.table = table
+
+    def load(self, run_id):
+        item = self.table.get_item(Key={'run_id': run_id}).get('Item')
+        if item is None:
+            return None
+        # None-valued fields are not stored, so start from the defaults
+        checkpoint = new_checkpoint(run_id)
+        for key, value in item.items():
+            if key in COMPRESSED_FIELDS:
+                value = json.loads(zlib.decompress(bytes(value)))
+            elif isinstance(value, Decimal):
+                value = int(value) if value == value.to_integral_value() else float(value)
+            checkpoint[key] = value
+        return checkpoint
+
+    def save(self, checkpoint):
+        checkpoint['updated_at'] = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        item = {}
+        for key, value in checkpoint.items():
+            if value is None:
+                continue
+            if key in COMPRESSED_FIELDS:
+                value = zlib.compress(json.dumps(value).encode('utf-8'))
+            elif isinstance(value, float):
+                # DynamoDB rejects floats
+                value = Decimal(str(value))
+            item[key] = value
+        self.table.put_item(Item=item)
+
+
+class TimeBudget:
+    """
+    Tracks how much of an invocation's time is left. Uses the Lambda context's
+    get_remaining_time_in_millis() when available, else an optional fixed budget.
+    should_stop() is True once the remaining time can no longer fit the safety margin
+    plus one more SKU at the average pace seen so far.
+    """
+
+    def __init__(self, context=None, budget_seconds=None, safety_margin_seconds=30.0):
+        self._context = context if hasattr(context, 'get_remaining_time_in_millis') else None
+        self._deadline = time.time() + budget_seconds if budget_seconds and self._context is None else None
+        self.safety_margin_seconds = safety_margin_seconds
+        self._started_at = time.time()
+        self._units = 0
+
+    def remaining_seconds(self):
+        if self._context is not None:
+            return self._context.get_remaining_time_in_millis() / 1000.0
+        if self._deadline is not None:
+            return self._deadline - time.time()
+        return None
+
+    def record_unit(self):
+        self._units += 1
+
+    def average_unit_seconds(self):
+        return (time.time() - self._started_at) / self._units if self._units else 0.0
+
+    def should_stop(self):
+        remaining = self.remaining_seconds()
+        if remaining is None:
+            return False
+        return remaining < self.safety_margin_seconds + self.average_unit_seconds()
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from collections import deque
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency while its circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Trips when too many recent calls fail or are slow, so callers fail fast instead of
+    waiting on timeouts. Over a sliding window of the last window_size calls (once at
+    least min_calls are seen), the breaker opens if the failure rate reaches
+    failure_rate_threshold or the rate of calls slower than slow_call_ms reaches
+    slow_call_rate_threshold. After open_seconds one probe call is let through
+    (half-open): success closes the breaker, failure re-opens it.
+    """
+
+    def __init__(self, name, failure_rate_threshold=0.5, slow_call_ms=5000.0, slow_call_rate_threshold=0.5,
+                 window_size=20, min_calls=5, open_seconds=30.0):
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self._lock = threading.Lock()
+        self._window = deque(maxlen=window_size)
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.stats = {'calls': 0, 'failures': 0, 'slow_calls': 0, 'rejected': 0, 'opened': 0}
+
+    @classmethod
+    def from_env(cls, name, prefix):
+        """
+        Builds a breaker configured by <prefix>_FAILURE_RATE, <prefix>_SLOW_CALL_MS,
+        <prefix>_SLOW_CALL_RATE, <prefix>_WINDOW, <prefix>_MIN_CALLS and <prefix>_OPEN_SECONDS.
+        """
+        return cls(
+            name,
+            failure_rate_threshold=float(os.getenv(f"{prefix}_FAILURE_RATE", "0.5")),
+            slow_call_ms=float(os.getenv(f"{prefix}_SLOW_CALL_MS", "5000")),
+            slow_call_rate_threshold=float(os.getenv(f"{prefix}_SLOW_CALL_RATE", "0.5")),
+            window_size=int(os.getenv(f"{prefix}_WINDOW", "20")),
+            min_calls=int(os.getenv(f"{prefix}_MIN_CALLS", "5")),
+            open_seconds=float(os.getenv(f"{prefix}_OPEN_SECONDS", "30")),
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == STATE_OPEN and time.time() - self._opened_at >= self.open_seconds:
+            self._state = STATE_HALF_OPEN
+            self._probe_in_flight = False
+            print(f"DEBUG: Circuit breaker '{self.name}' half-open; allowing a probe call.")
+        return self._state
+
+    def allow(self):
+        """
+        Returns True if a call may proceed. In the half-open state only one probe is allowed at a time.
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.stats['rejected'] += 1
+            return False
+
+    def _open(self):
+        self._state = STATE_OPEN
+        self._opened_at = time.time()
+        self._probe_in_flight = False
+        self.stats['opened'] += 1
+
+    def record(self, success, latency_ms):
+        """
+        Records the outcome of a call that allow() let through.
+        """
+        slow = latency_ms >= self.slow_call_ms
+        with self._lock:
+            self.stats['calls'] += 1
+            self.stats['failures'] += 0 if success else 1
+            self.stats['slow_calls'] += 1 if slow else 0
+
+            if self._state == STATE_HALF_OPEN:
+                if success and not slow:
+                    self._state = STATE_CLOSED
+                    self._window.clear()
+                    print(f"DEBUG: Circuit breaker '{self.name}' closed after a successful probe.")
+                else:
+                    self._open()
+                    print(f"WARN: Circuit breaker '{self.name}' probe failed; re-opening for {self.open_seconds} s.")
+                return
+
+            self._window.append((success, slow))
+            if self._state == STATE_CLOSED and len(self._window) >= self.min_calls:
+                failure_rate = sum(1 for ok, _ in self._window if not ok) / len(self._window)
+                slow_rate = sum(1 for _, is_slow in self._window if is_slow) / len(self._window)
+                if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+                    self._open()
+                    print(f"WARN: Circuit breaker '{self.name}' opened (failure rate {failure_rate:.0%}, slow-call rate {slow_rate:.0%}).")
+
+    def release(self):
+        """
+        Ends a call that allow() let through without recording an outcome, e.g. when the
+        caller abandoned it. A half-open breaker lets the next probe through.
+        """
+        with self._lock:
+            if self._state == STATE_HALF_OPEN:
+                self._probe_in_flight = False
+
+    def call(self, func, *args, **kwargs):
+        """
+        Calls func through the breaker. Raises CircuitOpenError without calling it when open.
+        Any exception from func counts as a failure and is re-raised.
+        """
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker '{self.name}' is open")
+        started_at = time.time()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(False, (time.time() - started_at) * 1000)
+            raise
+        self.record(True, (time.time() - started_at) * 1000)
+        return result
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, state=self._current_state())
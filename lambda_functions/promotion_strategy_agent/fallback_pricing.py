@@ -0,0 +1,70 @@
+import os
+
+FALLBACK_SOURCE = 'rule_based_fallback'
+
+# Never price below cost plus this margin
+DEFAULT_MIN_MARGIN = 0.05
+# Largest single move the rules make, as a fraction of the current price
+DEFAULT_MAX_CHANGE = 0.10
+
+
+def rule_based_recommendation(current_price, cost, inventory, demand_factor, competitor_price,
+                              forecasted_demand=None, min_margin=None, max_change=None):
+    """
+    Deterministic pricing recommendation used when the LLM is unavailable.
+    Returns a dict shaped like the LLM's recommendation output.
+
+    Rules, in order:
+    - competitor more than 5% cheaper: move toward the competitor price
+    - demand up more than 5% with stock running short: raise the price
+    - demand down more than 5% with surplus stock: flash sale
+    - otherwise keep the current price
+    The result is capped at max_change either way and never goes below cost plus min_margin.
+    """
+    min_margin = DEFAULT_MIN_MARGIN if min_margin is None else min_margin
+    max_change = DEFAULT_MAX_CHANGE if max_change is None else max_change
+    demand_factor = demand_factor or 1.0
+    recommendation_type = 'price_adjustment'
+    target_price = current_price
+
+    stock_short = forecasted_demand is not None and forecasted_demand > 0 and inventory < forecasted_demand * 1.5
+    surplus_stock = forecasted_demand is None or inventory > (forecasted_demand or 0) * 3
+
+    if competitor_price and competitor_price < current_price * 0.95:
+        target_price = competitor_price
+        reason = f"Competitor price {competitor_price:.2f} is more than 5% below ours; moving toward it."
+    elif demand_factor > 1.05 and stock_short:
+        target_price = current_price * (1 + min(demand_factor - 1.0, max_change))
+        reason = f"Demand factor {demand_factor:.2f} with limited stock; raising price."
+    elif demand_factor < 0.95 and surplus_stock:
+        target_price = current_price * (1 - max_change)
+        recommendation_type = 'flash_sale'
+        reason = f"Demand factor {demand_factor:.2f} with surplus stock; short flash sale to clear inventory."
+    else:
+        reason = "No strong pricing signal; keeping the current price."
+
+    floor_price = cost * (1 + min_margin) if cost else 0.0
+    target_price = min(max(target_price, current_price * (1 - max_change)), current_price * (1 + max_change))
+    if target_price < floor_price:
+        target_price = floor_price
+        reason += f" Held at the minimum margin floor {floor_price:.2f}."
+
+    return {
+        'recommended_price': round(target_price, 2),
+        'recommendation_type': recommendation_type,
+        'reason': f"Rule-based fallback: {reason}",
+        'promo_copy': '',
+    }
+
+
+def fallback_for_product(product):
+    """
+    Applies rule_based_recommendation to a product snapshot, with limits from
+    FALLBACK_MIN_MARGIN and FALLBACK_MAX_CHANGE.
+    """
+    return rule_based_recommendation(
+        product['current_price'], product.get('cost'), product.get('inventory') or 0.0,
+        product.get('demand_factor'), product.get('competitor_price'), product.get('forecasted_demand') or None,
+        min_margin=float(os.getenv("FALLBACK_MIN_MARGIN", str(DEFAULT_MIN_MARGIN))),
+        max_change=float(os.getenv("FALLBACK_MAX_CHANGE", str(DEFAULT_MAX_CHANGE))),
+    )
@@ -0,0 +1,181 @@
+import json
+import math
+import os
+import threading
+from decimal import Decimal
+
+GUARDRAIL_OK = 'ok'
+GUARDRAIL_CLAMPED = 'clamped'
+GUARDRAIL_REJECTED = 'rejected'
+
+# Declarative rules; override with STRATEGY_GUARDRAILS (JSON), setting a rule to null disables it.
+# action is 'clamp' (move the price inside the bound) or 'reject' (keep the price, reject the recommendation).
+DEFAULT_GUARDRAILS = {
+    'min_margin': {'value': 0.10, 'action': 'clamp'},
+    'max_change_pct': {'value': 0.25, 'action': 'clamp'},
+    'map_floor': {'action': 'clamp'},
+    'price_ending': {'value': 0.99},
+}
+
+
+def load_guardrail_config():
+    """
+    Returns DEFAULT_GUARDRAILS merged with the STRATEGY_GUARDRAILS overrides.
+    """
+    config = {name: dict(rule) for name, rule in DEFAULT_GUARDRAILS.items()}
+    raw = os.getenv("STRATEGY_GUARDRAILS")
+    if raw:
+        try:
+            for name, rule in json.loads(raw).items():
+                if rule is None:
+                    config.pop(name, None)
+                else:
+                    config.setdefault(name, {}).update(rule)
+        except (ValueError, AttributeError) as e:
+            print(f"WARN: Ignoring invalid STRATEGY_GUARDRAILS: {e}")
+    return config
+
+
+def _column(rows, field):
+    return [row.get(field) for row in rows]
+
+
+def _compile_bounds(config):
+    """
+    Turns the rule config into (rule_name, action, kind, bound_fn) entries. bound_fn maps the
+    input columns to a column of bounds (None where the rule does not apply); kind is
+    'floor' or 'ceiling'. Ceilings come first so the later floors (margin, MAP) win.
+    """
+    bounds = []
+    if 'max_change_pct' in config:
+        rule = config['max_change_pct']
+        pct = float(rule['value'])
+        bounds.append(('max_change_pct', rule.get('action', 'clamp'), 'ceiling',
+                       lambda cols: [current * (1 + pct) if current else None for current in cols['current_price']]))
+        bounds.append(('max_change_pct', rule.get('action', 'clamp'), 'floor',
+                       lambda cols: [current * (1 - pct) if current else None for current in cols['current_price']]))
+    if 'min_margin' in config:
+        rule = config['min_margin']
+        margin = float(rule['value'])
+        bounds.append(('min_margin', rule.get('action', 'clamp'), 'floor',
+                       lambda cols: [cost * (1 + margin) if cost else None for cost in cols['cost']]))
+    if 'map_floor' in config:
+        rule = config['map_floor']
+        bounds.append(('map_floor', rule.get('action', 'clamp'), 'floor',
+                       lambda cols: [map_price or None for map_price in cols['map_price']]))
+    return bounds
+
+
+def _apply_price_ending(price, ending, floor, ceiling):
+    """
+    Moves a price to the nearest ending (e.g. .99) at or below it, or the next one up
+    if that would break a floor. If no ending fits between floor and ceiling (or the
+    price is under one unit), the price is kept as is.
+    """
+    candidate = math.floor(price) + ending
+    if candidate > price + 1e-9:
+        candidate -= 1
+    if floor is not None and candidate < floor - 1e-9:
+        candidate += 1
+    if candidate <= 0 or (ceiling is not None and candidate > ceiling + 1e-9):
+        return round(price, 2)
+    return round(candidate, 2)
+
+
+class GuardrailEngine:
+    """
+    Validates recommended prices against business rules compiled once from a declarative
+    config. evaluate() works column by column over a whole batch of candidates: each rule
+    computes its bound column in one pass and clamps or rejects the violating rows.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_guardrail_config()
+        self._bounds = _compile_bounds(self.config)
+        self._ending = float(self.config['price_ending']['value']) if 'price_ending' in self.config else None
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {GUARDRAIL_OK: 0, GUARDRAIL_CLAMPED: 0, GUARDRAIL_REJECTED: 0, 'by_rule': {}}
+
+    def evaluate(self, rows):
+        """
+        rows are dicts with 'price', 'current_price', 'cost' and optional 'map_price'.
+        Returns one (price, status, reasons) tuple per row.
+        """
+        if not rows:
+            return []
+        cols = {field: _column(rows, field) for field in ('current_price', 'cost', 'map_price')}
+        prices = _column(rows, 'price')
+        statuses = [GUARDRAIL_OK] * len(rows)
+        reasons = [[] for _ in rows]
+        floors = [None] * len(rows)
+        ceilings = [None] * len(rows)
+        violations = {}
+
+        for rule_name, action, kind, bound_fn in self._bounds:
+            bound_column = bound_fn(cols)
+            if kind == 'floor':
+                floors = [b if f is None else (f if b is None else max(f, b)) for f, b in zip(floors, bound_column)]
+            else:
+                ceilings = [b if c is None else (c if b is None else min(c, b)) for c, b in zip(ceilings, bound_column)]
+            violating = [
+                i for i, (price, bound) in enumerate(zip(prices, bound_column))
+                if bound is not None and (price < bound - 1e-9 if kind == 'floor' else price > bound + 1e-9)
+            ]
+            for i in violating:
+                if statuses[i] == GUARDRAIL_REJECTED:
+                    continue
+                bound = round(bound_column[i], 2)
+                if action == 'reject':
+                    statuses[i] = GUARDRAIL_REJECTED
+                    reasons[i].append(f"{rule_name}: {prices[i]:.2f} is {'below' if kind == 'floor' else 'above'} {bound:.2f}")
+                else:
+                    reasons[i].append(f"{rule_name}: clamped {prices[i]:.2f} to {bound:.2f}")
+                    prices[i] = bound
+                    statuses[i] = GUARDRAIL_CLAMPED
+            if violating:
+                violations[rule_name] = violations.get(rule_name, 0) + len(violating)
+
+        if self._ending is not None:
+            for i, price in enumerate(prices):
+                if statuses[i] != GUARDRAIL_REJECTED:
+                    prices[i] = _apply_price_ending(price, self._ending, floors[i], ceilings[i])
+
+        with self._lock:
+            for status in statuses:
+                self.stats[status] += 1
+            for rule_name, count in violations.items():
+                self.stats['by_rule'][rule_name] = self.stats['by_rule'].get(rule_name, 0) + count
+        return list(zip(prices, statuses, reasons))
+
+    def apply(self, pricing_items, products):
+        """
+        Applies the guardrails in place to pricing recommendation items, given the product
+        snapshots they were made for (same order). Clamped prices replace 'recommended_price';
+        rejected items get status 'rejected'. Every item gets 'guardrail_status' and, when a
+        rule fired, 'guardrail_reasons'.
+        """
+        rows = [
+            {
+                'price': float(item['recommended_price']),
+                'current_price': product.get('current_price'),
+                'cost': product.get('cost'),
+                'map_price': product.get('map_price'),
+            }
+            for item, product in zip(pricing_items, products)
+        ]
+        for item, (price, status, reasons) in zip(pricing_items, self.evaluate(rows)):
+            item['recommended_price'] = Decimal(str(price))
+            item['guardrail_status'] = status
+            if reasons:
+                item['guardrail_reasons'] = reasons
+            if status == GUARDRAIL_REJECTED:
+                item['status'] = 'rejected'
+        return pricing_items
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, by_rule=dict(self.stats['by_rule']))
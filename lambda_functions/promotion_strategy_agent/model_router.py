@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+
+# Approximate on-demand Bedrock prices (USD per 1K tokens); override per environment via BEDROCK_ROUTING_CONFIG.
+DEFAULT_ROUTES = {
+    'fast': {'model_id': 'anthropic.claude-3-haiku-20240307-v1:0', 'input_cost_per_1k': 0.00025, 'output_cost_per_1k': 0.00125},
+    'large': {'model_id': 'anthropic.claude-3-sonnet-20240229-v1:0', 'input_cost_per_1k': 0.003, 'output_cost_per_1k': 0.015},
+}
+
+# Fixed route per task type; tasks mapped to None are routed by complexity score.
+DEFAULT_TASK_ROUTES = {
+    'promo_copy': 'fast',
+    'promo_template': 'fast',
+    'json_repair': 'fast',
+    'recommendation': None,
+    'batch_recommendation': 'large',
+}
+
+DEFAULT_COMPLEXITY_THRESHOLD = 0.5
+
+# Latency samples kept per route for percentile reporting
+MAX_LATENCY_SAMPLES = 1000
+
+# Prompt-cache reads and writes are billed relative to the route's input price
+CACHE_READ_COST_FACTOR = 0.1
+CACHE_WRITE_COST_FACTOR = 1.25
+
+
+def score_pricing_complexity(product):
+    """
+    Scores how hard a pricing decision is, from 0.0 (routine) to 1.0 (hard).
+    Large competitor gaps, strong demand shifts and thin margins make a decision harder.
+    """
+    current_price = product.get('current_price') or 0.0
+    if current_price <= 0:
+        return 1.0
+
+    competitor_price = product.get('competitor_price')
+    competitor_gap = abs(competitor_price - current_price) / current_price if competitor_price else 0.0
+    demand_shift = abs((product.get('demand_factor') or 1.0) - 1.0)
+    margin = (current_price - (product.get('cost') or 0.0)) / current_price
+
+    gap_score = min(competitor_gap / 0.2, 1.0)
+    demand_score = min(demand_shift / 0.1, 1.0)
+    margin_score = 1.0 - min(max(margin, 0.0) / 0.3, 1.0)
+    return round(0.4 * gap_score + 0.35 * demand_score + 0.25 * margin_score, 3)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class ModelRouter:
+    """
+    Picks a Bedrock model per task type and complexity score, and keeps
+    per-route latency, token and estimated cost metrics.
+    """
+
+    def __init__(self, routes=None, task_routes=None, complexity_threshold=DEFAULT_COMPLEXITY_THRESHOLD):
+        self.routes = routes or DEFAULT_ROUTES
+        self.task_routes = task_routes or DEFAULT_TASK_ROUTES
+        self.complexity_threshold = complexity_threshold
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a router from the environment:
+        BEDROCK_MODEL_ID (large route), BEDROCK_FAST_MODEL_ID (fast route),
+        BEDROCK_COMPLEXITY_THRESHOLD, and BEDROCK_ROUTING_CONFIG, a JSON document with
+        optional 'routes', 'task_routes' and 'complexity_threshold' overrides.
+        """
+        routes = {name: dict(route) for name, route in DEFAULT_ROUTES.items()}
+        routes['large']['model_id'] = os.getenv("BEDROCK_MODEL_ID", routes['large']['model_id'])
+        routes['fast']['model_id'] = os.getenv("BEDROCK_FAST_MODEL_ID", routes['fast']['model_id'])
+        task_routes = dict(DEFAULT_TASK_ROUTES)
+        complexity_threshold = float(os.getenv("BEDROCK_COMPLEXITY_THRESHOLD", DEFAULT_COMPLEXITY_THRESHOLD))
+
+        routing_config = os.getenv("BEDROCK_ROUTING_CONFIG")
+        if routing_config:
+            try:
+                overrides = json.loads(routing_config)
+                for name, route in overrides.get('routes', {}).items():
+                    routes.setdefault(name, {'input_cost_per_1k': 0.0, 'output_cost_per_1k': 0.0}).update(route)
+                task_routes.update(overrides.get('task_routes', {}))
+                complexity_threshold = float(overrides.get('complexity_threshold', complexity_threshold))
+            except (ValueError, AttributeError) as e:
+                print(f"WARN: Ignoring invalid BEDROCK_ROUTING_CONFIG: {e}")
+
+        return cls(routes, task_routes, complexity_threshold)
+
+    def select(self, task_type, complexity=None):
+        """
+        Returns (route_name, model_id) for a task. Tasks without a fixed route go to the
+        'large' route when complexity meets the threshold (or is unknown), else 'fast'.
+        """
+        route_name = self.task_routes.get(task_type)
+        if route_name is None:
+            route_name = 'large' if complexity is None or complexity >= self.complexity_threshold else 'fast'
+        if route_name not in self.routes:
+            route_name = 'large'
+        return route_name, self.routes[route_name]['model_id']
+
+    def record(self, route_name, latency_ms, input_tokens=0, output_tokens=0, success=True,
+               cache_read_tokens=0, cache_write_tokens=0):
+        """
+        Records the outcome of one call made on a route.
+        input_tokens is uncached input; cache reads and writes are costed separately.
+        """
+        route = self.routes.get(route_name, {})
+        input_cost_per_1k = route.get('input_cost_per_1k', 0.0)
+        cost = (
+            (input_tokens / 1000.0) * input_cost_per_1k
+            + (cache_read_tokens / 1000.0) * input_cost_per_1k * CACHE_READ_COST_FACTOR
+            + (cache_write_tokens / 1000.0) * input_cost_per_1k * CACHE_WRITE_COST_FACTOR
+            + (output_tokens / 1000.0) * route.get('output_cost_per_1k', 0.0)
+        )
+        with self._lock:
+            metrics = self._metrics.setdefault(route_name, {
+                'calls': 0, 'errors': 0, 'input_tokens': 0, 'output_tokens': 0, 'cache_read_tokens': 0,
+                'estimated_cost_usd': 0.0, 'total_latency_ms': 0.0, 'latencies_ms': []
+            })
+            metrics['calls'] += 1
+            if not success:
+                metrics['errors'] += 1
+            metrics['input_tokens'] += input_tokens
+            metrics['output_tokens'] += output_tokens
+            metrics['cache_read_tokens'] += cache_read_tokens
+            metrics['estimated_cost_usd'] += cost
+            metrics['total_latency_ms'] += latency_ms
+            if len(metrics['latencies_ms']) < MAX_LATENCY_SAMPLES:
+                metrics['latencies_ms'].append(latency_ms)
+
+    def metrics(self):
+        """
+        Returns per-route call counts, latency percentiles, tokens and estimated cost.
+        """
+        with self._lock:
+            snapshot = {}
+            for route_name, metrics in self._metrics.items():
+                latencies = sorted(metrics['latencies_ms'])
+                snapshot[route_name] = {
+                    'model_id': self.routes.get(route_name, {}).get('model_id'),
+                    'calls': metrics['calls'],
+                    'errors': metrics['errors'],
+                    'input_tokens': metrics['input_tokens'],
+                    'output_tokens': metrics['output_tokens'],
+                    'cache_read_tokens': metrics['cache_read_tokens'],
+                    'estimated_cost_usd': round(metrics['estimated_cost_usd'], 6),
+                    'avg_latency_ms': round(metrics['total_latency_ms'] / metrics['calls'], 1) if metrics['calls'] else 0.0,
+                    'p50_latency_ms': round(_percentile(latencies, 50), 1),
+                    'p95_latency_ms': round(_percentile(latencies, 95), 1),
+                }
+            return snapshot
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics = {}
@@ -0,0 +1,101 @@
+import time
+from botocore.exceptions import ClientError
+
+# Maximum number of entries SNS accepts in a single PublishBatch call
+SNS_PUBLISH_BATCH_LIMIT = 10
+
+ALERT_SUBJECT = "Exclusive Promotion Alert!"
+
+
+def build_alert_message(sku, promo_text):
+    """
+    Builds the customer-facing text of a promotion alert.
+    """
+    return f"📢 Special Offer for You!\nProduct: {sku}\nOffer: {promo_text}\nDon't miss out!"
+
+
+def build_topic_alert(alert_id, message, customer_id, customer_segment, sku, contact):
+    """
+    Builds an alert for topic fan-out. The message attributes let subscription
+    filter policies route each alert to the right customer endpoint.
+    """
+    attributes = {
+        'customer_id': customer_id,
+        'sku': sku,
+        'channel': 'sms' if contact and '@' not in contact else 'email',
+    }
+    if customer_segment:
+        attributes['customer_segment'] = customer_segment
+    return {'id': alert_id, 'message': message, 'contact': contact, 'attributes': attributes}
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def publish_alert_batches(sns_client, topic_arn, alerts):
+    """
+    Publishes alerts to an SNS topic with PublishBatch, up to 10 messages per call.
+    Returns (sent_ids, failed_ids, batch_stats), where batch_stats has one entry per
+    PublishBatch call with its size, duration and throughput.
+    """
+    sent_ids = []
+    failed_ids = []
+    batch_stats = []
+
+    for batch_number, batch in enumerate(_chunks(alerts, SNS_PUBLISH_BATCH_LIMIT), start=1):
+        # Entry Ids only need to be unique within a batch and must be alphanumeric
+        entries_by_entry_id = {str(index): alert for index, alert in enumerate(batch)}
+        entries = [
+            {
+                'Id': entry_id,
+                'Message': alert['message'],
+                'Subject': ALERT_SUBJECT,
+                'MessageAttributes': {
+                    name: {'DataType': 'String', 'StringValue': str(value)} for name, value in alert['attributes'].items()
+                }
+            }
+            for entry_id, alert in entries_by_entry_id.items()
+        ]
+
+        started_at = time.time()
+        try:
+            response = sns_client.publish_batch(TopicArn=topic_arn, PublishBatchRequestEntries=entries)
+            batch_sent = [entries_by_entry_id[entry['Id']]['id'] for entry in response.get('Successful', [])]
+            batch_failed = [entries_by_entry_id[entry['Id']]['id'] for entry in response.get('Failed', [])]
+        except ClientError as e:
+            print(f"ERROR: SNS Client Error publishing alert batch {batch_number}: {e.response['Error']['Message']}")
+            batch_sent, batch_failed = [], [alert['id'] for alert in batch]
+        duration_seconds = max(time.time() - started_at, 1e-6)
+
+        sent_ids.extend(batch_sent)
+        failed_ids.extend(batch_failed)
+        stats = {
+            'batch': batch_number,
+            'size': len(batch),
+            'sent': len(batch_sent),
+            'failed': len(batch_failed),
+            'duration_ms': round(duration_seconds * 1000, 1),
+            'messages_per_second': round(len(batch_sent) / duration_seconds, 1),
+        }
+        batch_stats.append(stats)
+        print(f"DEBUG: SNS alert batch {batch_number}: {stats['sent']}/{stats['size']} sent in {stats['duration_ms']} ms ({stats['messages_per_second']} msg/s).")
+
+    return sent_ids, failed_ids, batch_stats
+
+
+def send_sms_alert(sns_client, phone_number, message):
+    """
+    Sends one alert directly to a phone number. SNS cannot batch direct-to-phone publishes.
+    Returns True on success.
+    """
+    try:
+        sns_client.publish(PhoneNumber=phone_number, Message=message)
+        return True
+    except ClientError as e:
+        print(f"ERROR: SNS Client Error sending SMS alert to {phone_number}: {e.response['Error']['Message']}")
+        return False
+    except Exception as e:
+        print(f"ERROR: Unexpected error sending SMS alert to {phone_number}: {e}")
+        return False
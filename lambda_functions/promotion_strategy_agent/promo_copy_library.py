@@ -0,0 +1,165 @@
+import threading
+from collections import OrderedDict
+
+try:
+    from .targeting import category_terms
+except ImportError:  # Deployed from the agent's own folder, where this is a top-level module
+    from targeting import category_terms
+
+# Placeholders a template may use; they are filled locally per SKU.
+TEMPLATE_FIELDS = ('sku', 'category', 'price', 'discount_pct')
+
+# Used when the model cannot produce a usable template for a cluster.
+DEFAULT_TEMPLATES = {
+    'discount': "Save {discount_pct}% on {sku}! Now just {price} - a great pick in {category}. Limited time only, so grab yours today.",
+    'no_discount': "{sku} is one of our top picks in {category}, now available for {price}. Stock is moving fast - don't miss out!",
+}
+
+DEFAULT_MAX_RENDERED = 1024
+
+
+def discount_band(current_price, recommended_price):
+    """
+    Buckets the offer's discount so SKUs with similar offers share a template:
+    'none', '1-9', '10-19' or '20+' percent.
+    """
+    discount_pct = discount_percent(current_price, recommended_price)
+    if discount_pct < 1:
+        return 'none'
+    if discount_pct < 10:
+        return '1-9'
+    if discount_pct < 20:
+        return '10-19'
+    return '20+'
+
+
+def discount_percent(current_price, recommended_price):
+    if not current_price or recommended_price is None or recommended_price >= current_price:
+        return 0
+    return int(round((current_price - recommended_price) / current_price * 100))
+
+
+def cluster_key(category, offer_type, band, segment):
+    """
+    Key of a template cluster: (primary category term, offer type, discount band, audience segment).
+    """
+    terms = category_terms(category)
+    return (terms[0] if terms else 'general', offer_type or 'price_adjustment', band, segment or 'all')
+
+
+def build_template_prompt(key):
+    """
+    Builds the prompt asking the model for a reusable copy template for one cluster.
+    """
+    category, offer_type, band, segment = key
+    offer = "no discount" if band == 'none' else f"a {band}% discount"
+    return (
+        f"Write a concise, engaging marketing message template for a '{offer_type.replace('_', ' ')}' offer "
+        f"with {offer} on a product in the '{category}' category, aimed at '{segment}' customers. Max 50 words. "
+        "Use these placeholders exactly, with curly braces, instead of concrete values: "
+        "{sku} for the product, {price} for the offer price"
+        + ("" if band == 'none' else ", {discount_pct} for the discount percentage (number only)")
+        + ". Output only the template text."
+    )
+
+
+class _KeepMissing(dict):
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+def render_template(template, values):
+    """
+    Fills a template's placeholders. Returns None if the template is malformed
+    (e.g. stray braces or positional fields).
+    """
+    try:
+        return template.format_map(_KeepMissing(values))
+    except (ValueError, IndexError, KeyError, AttributeError):
+        return None
+
+
+def _is_usable_template(text):
+    return bool(text) and not text.startswith("Error:") and '{sku}' in text and render_template(text, {}) is not None
+
+
+class PromoCopyLibrary:
+    """
+    Parameterized promo copy templates generated once per (category, offer type,
+    discount band, segment) cluster and filled locally per SKU, with an LRU of
+    rendered copies. Templates persist across warm invocations.
+    """
+
+    def __init__(self, max_rendered=DEFAULT_MAX_RENDERED):
+        self.max_rendered = max_rendered
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._rendered = OrderedDict()
+        self.reset_stats()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'template_generations': 0, 'template_reuses': 0, 'default_templates': 0, 'rendered_cache_hits': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _template_for(self, key, generate):
+        """
+        Returns (template, source) for a cluster, calling generate(prompt) only on the first miss.
+        """
+        with self._lock:
+            template = self._templates.get(key)
+        if template is not None:
+            self._count('template_reuses')
+            return template, 'cached_template'
+
+        generated = (generate(build_template_prompt(key)) or '').strip().strip('"')
+        self._count('template_generations')
+        if not _is_usable_template(generated):
+            # Not cached, so the cluster gets a real template once the model is reachable again
+            print(f"WARN: Unusable promo copy template for cluster {key}; using the default template.")
+            self._count('default_templates')
+            return DEFAULT_TEMPLATES['no_discount' if key[2] == 'none' else 'discount'], 'default_template'
+        with self._lock:
+            # Another thread may have stored a template for this cluster meanwhile; keep the first
+            template = self._templates.setdefault(key, generated)
+        return template, 'llm_template'
+
+    def get_copy(self, sku, category, current_price, recommended_price, offer_type, segment, generate):
+        """
+        Returns (promo_text, source) for a SKU. source is 'rendered_cache', 'cached_template',
+        'llm_template' or 'default_template'.
+        """
+        band = discount_band(current_price, recommended_price)
+        key = cluster_key(category, offer_type, band, segment)
+        price = recommended_price if recommended_price is not None else current_price
+        values = {
+            'sku': sku,
+            'category': category or 'our catalog',
+            'price': f"${price:.2f}",
+            'discount_pct': discount_percent(current_price, recommended_price),
+        }
+        render_key = (key, sku, values['price'], values['discount_pct'])
+
+        with self._lock:
+            rendered = self._rendered.get(render_key)
+            if rendered is not None:
+                self._rendered.move_to_end(render_key)
+                self.stats['rendered_cache_hits'] += 1
+                return rendered, 'rendered_cache'
+
+        template, source = self._template_for(key, generate)
+        rendered = render_template(template, values) or render_template(DEFAULT_TEMPLATES['discount' if values['discount_pct'] else 'no_discount'], values)
+
+        if source != 'default_template':
+            with self._lock:
+                self._rendered[render_key] = rendered
+                while len(self._rendered) > self.max_rendered:
+                    self._rendered.popitem(last=False)
+        return rendered, source
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, templates=len(self._templates), rendered_cached=len(self._rendered))
@@ -0,0 +1,120 @@
+import json
+import threading
+
+# Approximate characters per token for Claude-family tokenizers.
+# Used only when Bedrock does not report token usage for a call.
+CHARS_PER_TOKEN = 4
+
+DEFAULT_BUSINESS_GOAL_PRIORITY = "maximize_revenue_and_clear_excess_inventory_and_be_competitive"
+
+
+def estimate_tokens(text):
+    """
+    Estimates the number of tokens in a piece of text.
+    This is a cheap heuristic (~4 characters per token), not a real tokenizer.
+    """
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+class TokenUsageTracker:
+    """
+    Accumulates Bedrock token usage for a single agent run.
+    Actual token counts reported by Bedrock are preferred; estimates are used otherwise.
+    input_tokens counts uncached input only; prompt-cache reads and writes are tracked separately.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_input_tokens = 0
+        self.cache_creation_input_tokens = 0
+        self.estimated_calls = 0
+        self.by_call_type = {}
+
+    def record(self, call_type, prompt_text, completion_text, reported_usage=None):
+        """
+        Records the token usage of one Bedrock call and returns the per-call usage.
+        reported_usage is the 'usage' block of the Bedrock response body, if any.
+        """
+        reported_usage = reported_usage or {}
+        estimated = 'input_tokens' not in reported_usage or 'output_tokens' not in reported_usage
+        call_usage = {
+            'call_type': call_type,
+            'input_tokens': int(reported_usage.get('input_tokens', estimate_tokens(prompt_text))),
+            'output_tokens': int(reported_usage.get('output_tokens', estimate_tokens(completion_text))),
+            'cache_read_input_tokens': int(reported_usage.get('cache_read_input_tokens', 0)),
+            'cache_creation_input_tokens': int(reported_usage.get('cache_creation_input_tokens', 0)),
+            'estimated': estimated,
+        }
+
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += call_usage['input_tokens']
+            self.output_tokens += call_usage['output_tokens']
+            self.cache_read_input_tokens += call_usage['cache_read_input_tokens']
+            self.cache_creation_input_tokens += call_usage['cache_creation_input_tokens']
+            if estimated:
+                self.estimated_calls += 1
+            totals = self.by_call_type.setdefault(call_type, {'calls': 0, 'input_tokens': 0, 'output_tokens': 0})
+            totals['calls'] += 1
+            totals['input_tokens'] += call_usage['input_tokens']
+            totals['output_tokens'] += call_usage['output_tokens']
+
+        return call_usage
+
+    def summary(self):
+        """
+        Returns the per-run token usage totals as a JSON-serializable dict.
+        """
+        with self._lock:
+            total_input = self.input_tokens + self.cache_read_input_tokens + self.cache_creation_input_tokens
+            return {
+                'calls': self.calls,
+                'input_tokens': self.input_tokens,
+                'output_tokens': self.output_tokens,
+                'cache_read_input_tokens': self.cache_read_input_tokens,
+                'cache_creation_input_tokens': self.cache_creation_input_tokens,
+                'cached_input_ratio': round(self.cache_read_input_tokens / total_input, 4) if total_input else 0.0,
+                'avg_input_tokens_per_call': round(self.input_tokens / self.calls, 1) if self.calls else 0.0,
+                'avg_output_tokens_per_call': round(self.output_tokens / self.calls, 1) if self.calls else 0.0,
+                'estimated_calls': self.estimated_calls,
+                'by_call_type': {k: dict(v) for k, v in self.by_call_type.items()},
+            }
+
+
+class PromptBuilder:
+    """
+    Builds compact per-SKU data contexts for the Promotion Strategy Agent.
+    The distinct customer segment set is computed once per run, so the prompt
+    size no longer grows with the number of customer profiles.
+    """
+
+    def __init__(self, customer_profiles, business_goal_priority=DEFAULT_BUSINESS_GOAL_PRIORITY):
+        self.customer_segments = sorted({c.get('segment') for c in customer_profiles if c.get('segment')})
+        self.business_goal_priority = business_goal_priority
+        self.usage = TokenUsageTracker()
+
+    def build_data_context(self, sku, current_price, inventory, cost, demand_factor, competitor_price):
+        """
+        Returns the data context dict the LLM reasons over for a single SKU.
+        """
+        return {
+            "sku": sku,
+            "current_price": current_price,
+            "inventory": inventory,
+            "cost_of_goods": cost,
+            "latest_demand_factor": demand_factor,
+            "latest_competitor_price": competitor_price,
+            "customer_segments_available": self.customer_segments,
+            "business_goal_priority": self.business_goal_priority
+        }
+
+    def serialize(self, data_context):
+        """
+        Serializes a data context without indentation or padding whitespace.
+        """
+        return json.dumps(data_context, separators=(',', ':'), default=str)
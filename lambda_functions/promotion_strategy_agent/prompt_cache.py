@@ -0,0 +1,87 @@
+import hashlib
+import os
+import threading
+import time
+
+try:
+    from .prompt_builder import estimate_tokens
+except ImportError:  # Deployed from the agent's own folder, where this is a top-level module
+    from prompt_builder import estimate_tokens
+
+# 'bedrock' marks the system block cacheable on models that support it, 'simulate' estimates
+# cache hits locally without sending cache_control, 'off' disables both.
+CACHE_MODE_BEDROCK = 'bedrock'
+CACHE_MODE_SIMULATE = 'simulate'
+CACHE_MODE_OFF = 'off'
+
+# Model ID fragments of Bedrock models that accept cache_control; override with BEDROCK_PROMPT_CACHE_MODELS.
+DEFAULT_CACHEABLE_MODEL_MARKERS = (
+    'claude-3-5-haiku', 'claude-3-5-sonnet-20241022', 'claude-3-7-sonnet',
+    'claude-sonnet-4', 'claude-opus-4', 'claude-haiku-4',
+)
+
+# Cached prefixes expire after 5 minutes without a hit
+CACHE_TTL_SECONDS = 300
+# Bedrock only caches prefixes of at least this many tokens (more for some models)
+DEFAULT_MIN_CACHEABLE_TOKENS = 1024
+
+
+def cacheable_model_markers():
+    raw = os.getenv("BEDROCK_PROMPT_CACHE_MODELS")
+    return tuple(marker.strip() for marker in raw.split(',') if marker.strip()) if raw else DEFAULT_CACHEABLE_MODEL_MARKERS
+
+
+def supports_prompt_caching(model_id):
+    """
+    Returns True if the Bedrock model accepts cache_control on prompt blocks.
+    """
+    return bool(model_id) and any(marker in model_id for marker in cacheable_model_markers())
+
+
+def build_system_blocks(system_text, cacheable):
+    """
+    Returns the 'system' field of an Anthropic Messages request: a plain string, or a
+    single text block marked as a cache checkpoint when the model supports caching.
+    """
+    if not cacheable:
+        return system_text
+    return [{'type': 'text', 'text': system_text, 'cache_control': {'type': 'ephemeral'}}]
+
+
+class PromptCacheSimulator:
+    """
+    Local stand-in for Bedrock prompt caching. Tracks which (model, prefix) pairs would
+    be cached and rewrites a call's usage block the way Bedrock reports it: the prefix's
+    tokens move from input_tokens to cache_creation_input_tokens on a miss and to
+    cache_read_input_tokens on a hit.
+    """
+
+    def __init__(self, ttl_seconds=CACHE_TTL_SECONDS, min_cacheable_tokens=DEFAULT_MIN_CACHEABLE_TOKENS):
+        self.ttl_seconds = ttl_seconds
+        self.min_cacheable_tokens = min_cacheable_tokens
+        self._lock = threading.Lock()
+        self._expires_at = {}
+
+    def apply(self, model_id, prefix_text, reported_usage, prompt_text=None, now=None):
+        """
+        Returns a copy of reported_usage with simulated cache read/creation tokens.
+        Prefixes shorter than min_cacheable_tokens are never cached, as on Bedrock.
+        When the model reports no input_tokens, they are estimated from prompt_text, the
+        full prompt the prefix belongs to.
+        """
+        usage = dict(reported_usage or {})
+        prefix_tokens = estimate_tokens(prefix_text)
+        if prefix_tokens < self.min_cacheable_tokens:
+            return usage
+
+        now = now or time.time()
+        key = (model_id, hashlib.sha256(prefix_text.encode('utf-8')).hexdigest())
+        with self._lock:
+            hit = self._expires_at.get(key, 0) > now
+            self._expires_at[key] = now + self.ttl_seconds
+
+        input_tokens = usage.get('input_tokens')
+        input_tokens = int(input_tokens) if input_tokens is not None else estimate_tokens(prompt_text or prefix_text)
+        usage['input_tokens'] = max(input_tokens - prefix_tokens, 0)
+        usage['cache_read_input_tokens' if hit else 'cache_creation_input_tokens'] = prefix_tokens
+        return usage
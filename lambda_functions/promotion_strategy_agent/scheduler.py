@@ -0,0 +1,79 @@
+import json
+import os
+
+# Relative weight of each impact signal; override with STRATEGY_PRIORITY_WEIGHTS (JSON).
+DEFAULT_PRIORITY_WEIGHTS = {
+    'competitor_gap': 1.0,
+    'demand_shift': 1.0,
+    'stockout_risk': 0.5,
+    'base': 0.05,
+}
+
+
+def load_priority_weights():
+    """
+    Reads impact signal weights from STRATEGY_PRIORITY_WEIGHTS, e.g. {"stockout_risk": 1.0}.
+    Signals not listed keep their default weight.
+    """
+    weights = dict(DEFAULT_PRIORITY_WEIGHTS)
+    raw = os.getenv("STRATEGY_PRIORITY_WEIGHTS")
+    if raw:
+        try:
+            weights.update({name: float(weight) for name, weight in json.loads(raw).items()})
+        except (ValueError, AttributeError) as e:
+            print(f"WARN: Ignoring invalid STRATEGY_PRIORITY_WEIGHTS: {e}")
+    return weights
+
+
+def impact_signals(product):
+    """
+    Returns the raw impact signals of one product snapshot:
+    revenue at stake (price x units in play), competitor gap and demand shift as
+    fractions (capped at 1.0), and stock-out risk (forecast demand / inventory, capped at 1.0).
+    """
+    price = product.get('current_price') or 0.0
+    inventory = max(product.get('inventory') or 0.0, 0.0)
+    forecasted_demand = product.get('forecasted_demand') or 0.0
+    competitor_price = product.get('competitor_price')
+
+    return {
+        'revenue_at_stake': price * max(inventory, forecasted_demand),
+        'competitor_gap': min(abs(competitor_price - price) / price, 1.0) if competitor_price and price > 0 else 0.0,
+        'demand_shift': min(abs((product.get('demand_factor') or 1.0) - 1.0), 1.0),
+        'stockout_risk': (min(forecasted_demand / inventory, 1.0) if inventory > 0 else 1.0) if forecasted_demand else 0.0,
+    }
+
+
+def impact_score(product, weights=None):
+    """
+    Expected revenue impact of repricing a SKU: revenue at stake scaled by how much
+    its pricing inputs have moved. SKUs with nothing moving keep a small base score
+    so large ones still outrank small ones.
+    """
+    weights = weights or DEFAULT_PRIORITY_WEIGHTS
+    signals = impact_signals(product)
+    multiplier = (
+        weights.get('competitor_gap', 0.0) * signals['competitor_gap']
+        + weights.get('demand_shift', 0.0) * signals['demand_shift']
+        + weights.get('stockout_risk', 0.0) * signals['stockout_risk']
+        + weights.get('base', 0.0)
+    )
+    return round(signals['revenue_at_stake'] * multiplier, 4)
+
+
+def rank_products(products, weights=None):
+    """
+    Scores every product in one pass, stores the score as 'impact_score' and returns the
+    products best first. Ties break on sku_region_pk so the order is deterministic.
+    """
+    weights = weights or load_priority_weights()
+    for product in products:
+        product['impact_score'] = impact_score(product, weights)
+    return sorted(products, key=priority_key)
+
+
+def priority_key(product):
+    """
+    Sort key of a scored product: highest impact first, then sku_region_pk.
+    """
+    return (-product['impact_score'], product['sku_region_pk'])
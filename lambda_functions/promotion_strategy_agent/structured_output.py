@@ -0,0 +1,190 @@
+import json
+import threading
+
+# Schema of the pricing recommendation the LLM is asked to return
+RECOMMENDATION_SCHEMA = {
+    'required': {'recommended_price': 'number', 'recommendation_type': 'string', 'reason': 'string'},
+    'optional': {'promo_copy': 'string'},
+    'enums': {'recommendation_type': ('price_adjustment', 'flash_sale', 'bundle_offer')},
+}
+
+# How many trailing members repair_truncated_json may drop before giving up
+MAX_REPAIR_CUTS = 5
+
+
+def _scan_json(text):
+    """
+    Scans JSON text and returns (open_brackets_stack, in_string, pending_escape, end_index).
+    end_index is the index just past the first balanced top-level value, or None if it never closes.
+    """
+    stack = []
+    in_string = False
+    escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == '\\':
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append(char)
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            if not stack:
+                return stack, False, False, index + 1
+    return stack, in_string, escape, None
+
+
+def extract_first_json_object(text):
+    """
+    Returns the first balanced JSON object embedded in text (e.g. wrapped in prose or
+    code fences). If the object never closes, the truncated remainder is returned.
+    Returns None if the text contains no '{'.
+    """
+    if not text:
+        return None
+    start = text.find('{')
+    if start < 0:
+        return None
+    _, _, _, end = _scan_json(text[start:])
+    return text[start:start + end] if end else text[start:]
+
+
+def _close_open_structures(fragment):
+    """
+    Closes an unterminated string and any open objects/arrays at the end of a JSON fragment.
+    """
+    stack, in_string, escape, _ = _scan_json(fragment)
+    if escape:
+        fragment = fragment[:-1]
+    if in_string:
+        fragment += '"'
+    fragment = fragment.rstrip()
+    if fragment.endswith(','):
+        fragment = fragment[:-1]
+    elif fragment.endswith(':'):
+        fragment += 'null'
+    closers = {'{': '}', '[': ']'}
+    return fragment + ''.join(closers[opener] for opener in reversed(stack))
+
+
+def repair_truncated_json(fragment):
+    """
+    Repairs a JSON object truncated mid-output (e.g. by max_tokens).
+    Open strings and brackets are closed; if that is not enough, trailing members
+    are dropped one at a time. Returns the repaired JSON text, or None.
+    """
+    candidate = fragment
+    for _ in range(MAX_REPAIR_CUTS + 1):
+        closed = _close_open_structures(candidate)
+        try:
+            json.loads(closed)
+            return closed
+        except json.JSONDecodeError:
+            cut = candidate.rstrip().rfind(',')
+            if cut <= 0:
+                return None
+            candidate = candidate[:cut]
+    return None
+
+
+def validate_against_schema(obj, schema=RECOMMENDATION_SCHEMA):
+    """
+    Validates (and lightly coerces) a parsed object against a schema.
+    Numeric strings are coerced to floats. Returns (obj, errors).
+    """
+    if not isinstance(obj, dict):
+        return obj, ["top-level value must be a JSON object"]
+
+    errors = []
+    fields = dict(schema.get('required', {}), **schema.get('optional', {}))
+    for field, field_type in fields.items():
+        if field not in obj or obj[field] is None:
+            if field in schema.get('required', {}):
+                errors.append(f"missing required field '{field}'")
+            else:
+                obj.pop(field, None)
+            continue
+        value = obj[field]
+        if field_type == 'number':
+            if isinstance(value, bool):
+                errors.append(f"field '{field}' must be a number")
+                continue
+            try:
+                obj[field] = float(value)
+            except (TypeError, ValueError):
+                errors.append(f"field '{field}' must be a number")
+        elif field_type == 'string' and not isinstance(value, str):
+            errors.append(f"field '{field}' must be a string")
+
+    for field, allowed in schema.get('enums', {}).items():
+        if field in obj and obj[field] not in allowed:
+            errors.append(f"field '{field}' must be one of {', '.join(allowed)}")
+    return obj, errors
+
+
+def parse_structured_output(text, schema=RECOMMENDATION_SCHEMA):
+    """
+    Extracts, repairs and validates a JSON object from LLM output.
+    Returns (obj, errors, repaired): obj is None when nothing usable was found,
+    errors lists schema violations, repaired is True if truncation was repaired locally.
+    """
+    fragment = extract_first_json_object(text)
+    if fragment is None:
+        return None, ["no JSON object found in output"], False
+
+    repaired = False
+    try:
+        obj = json.loads(fragment)
+    except json.JSONDecodeError:
+        fixed = repair_truncated_json(fragment)
+        if fixed is None:
+            return None, ["output is not valid JSON and could not be repaired"], False
+        obj = json.loads(fixed)
+        repaired = True
+
+    obj, errors = validate_against_schema(obj, schema)
+    return obj, errors, repaired
+
+
+def build_json_fix_prompt(broken_text, errors, schema=RECOMMENDATION_SCHEMA):
+    """
+    Builds the short follow-up prompt asking the model to fix its own JSON,
+    without re-sending the original product context.
+    """
+    fields = ", ".join(f"'{name}' ({field_type})" for name, field_type in dict(schema['required'], **schema.get('optional', {})).items())
+    return (
+        "Fix this JSON so it is valid and complete. "
+        f"It must be one JSON object with: {fields}. "
+        f"Problems: {'; '.join(errors)}. "
+        "Output only the corrected JSON.\n\n"
+        f"{broken_text[:2000]}"
+    )
+
+
+class StructuredOutputStats:
+    """
+    Counts how each LLM output was turned into a usable object during a run.
+    """
+
+    OUTCOMES = ('parsed', 'repaired_locally', 'fixed_by_followup', 'failed')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = dict.fromkeys(self.OUTCOMES, 0)
+        self.followup_calls = 0
+
+    def record(self, outcome, followup_calls=0):
+        with self._lock:
+            self.counts[outcome] += 1
+            self.followup_calls += followup_calls
+
+    def summary(self):
+        with self._lock:
+            return dict(self.counts, followup_calls=self.followup_calls)
@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+# Affinity points per matching preference; segment weights and recency are added on top.
+PREFERENCE_WEIGHT = 1.0
+RECENCY_WEIGHT = 0.25
+RECENCY_HALF_LIFE_DAYS = 30.0
+# Alerts one customer can get from a single run; further SKUs rotate to the next-best customers
+DEFAULT_MAX_ALERTS_PER_CUSTOMER = 3
+
+
+def _normalize_term(term):
+    return str(term).strip().lower()
+
+
+def category_terms(category):
+    """
+    Splits a product category such as 'Electronics & Smart Home' into lowercase match terms.
+    """
+    if not category:
+        return []
+    normalized = _normalize_term(category)
+    terms = {normalized}
+    for separator in ('&', '/', ','):
+        normalized = normalized.replace(separator, '|')
+    terms.update(part.strip() for part in normalized.split('|') if part.strip())
+    return sorted(terms)
+
+
+def _recency_scores(customer_profiles, now=None):
+    """
+    Scores every customer's last purchase recency in one pass: 1.0 for today, halving every 30 days.
+    """
+    now = now or time.time()
+    scores = []
+    for customer in customer_profiles:
+        last_purchase_date = customer.get('last_purchase_date')
+        try:
+            purchased_at = time.mktime(time.strptime(str(last_purchase_date)[:10], "%Y-%m-%d"))
+            days_since = max(0.0, (now - purchased_at) / 86400.0)
+            scores.append(0.5 ** (days_since / RECENCY_HALF_LIFE_DAYS))
+        except (TypeError, ValueError):
+            scores.append(0.0)
+    return scores
+
+
+def load_segment_weights():
+    """
+    Reads per-segment affinity weights from PROMO_SEGMENT_WEIGHTS, a JSON object such as
+    {"Loyalty Tier A": 0.5}. Segments not listed get no extra weight.
+    """
+    raw = os.getenv("PROMO_SEGMENT_WEIGHTS")
+    if not raw:
+        return {}
+    try:
+        return {segment: float(weight) for segment, weight in json.loads(raw).items()}
+    except (ValueError, AttributeError) as e:
+        print(f"WARN: Ignoring invalid PROMO_SEGMENT_WEIGHTS: {e}")
+        return {}
+
+
+class CustomerTargetingIndex:
+    """
+    Inverted index from preference to customer positions, built once per run. Scoring a
+    category only touches the posting lists of its terms, so targeting cost grows with the
+    number of matching customers rather than with the whole customer base. Each category's
+    ranking is memoized. No customer is targeted more than max_alerts_per_customer times
+    (PROMO_MAX_ALERTS_PER_CUSTOMER, 0 for no cap) by one index, so the SKUs of a category
+    rotate through its best customers instead of alerting the same top-K every time.
+    """
+
+    def __init__(self, customer_profiles, segment_weights=None, now=None, max_alerts_per_customer=None):
+        self.customers = [c for c in customer_profiles if c.get('customer_id')]
+        self.segment_weights = segment_weights if segment_weights is not None else load_segment_weights()
+        if max_alerts_per_customer is None:
+            max_alerts_per_customer = int(os.getenv("PROMO_MAX_ALERTS_PER_CUSTOMER", str(DEFAULT_MAX_ALERTS_PER_CUSTOMER)))
+        self.max_alerts_per_customer = max_alerts_per_customer
+        self.by_preference = {}
+        self._position_by_customer_id = {}
+        for position, customer in enumerate(self.customers):
+            self._position_by_customer_id[customer['customer_id']] = position
+            for preference in set(_normalize_term(p) for p in customer.get('preferences', []) or []):
+                self.by_preference.setdefault(preference, []).append(position)
+
+        self.recency = _recency_scores(self.customers, now)
+        self.segment_bonus = [self.segment_weights.get(c.get('segment'), 0.0) for c in self.customers]
+        # Fallback ranking for SKUs whose category matches no preference
+        self._fallback_ranking = sorted(
+            range(len(self.customers)),
+            key=lambda position: self.segment_bonus[position] + RECENCY_WEIGHT * self.recency[position],
+            reverse=True
+        )
+        self._lock = threading.Lock()
+        self._ranking_by_category = {}
+        self._alerts_by_position = Counter()
+
+    def top_customers(self, category, k):
+        """
+        Returns up to k (customer, affinity_score) pairs for a SKU category, best first,
+        skipping customers who reached max_alerts_per_customer. Affinity = matching
+        preferences + segment weight + purchase recency. The returned customers count as
+        alerted; pass the list to release() if the SKU sends no alert after all.
+        """
+        if k <= 0 or not self.customers:
+            return []
+        with self._lock:
+            ranking = self._ranking_by_category.get(category)
+        if ranking is None:
+            ranking = self._rank_customers(category)
+            with self._lock:
+                self._ranking_by_category[category] = ranking
+
+        targets = []
+        with self._lock:
+            for position, score in ranking:
+                if self.max_alerts_per_customer and self._alerts_by_position[position] >= self.max_alerts_per_customer:
+                    continue
+                self._alerts_by_position[position] += 1
+                targets.append((self.customers[position], score))
+                if len(targets) == k:
+                    break
+        return targets
+
+    def release(self, targets):
+        """
+        Gives back the alerts counted by top_customers for targets that were not alerted.
+        """
+        with self._lock:
+            for customer, _ in targets:
+                position = self._position_by_customer_id.get(customer['customer_id'])
+                if position is not None and self._alerts_by_position[position]:
+                    self._alerts_by_position[position] -= 1
+
+    def alert_counts(self):
+        """
+        Returns customer_id -> alerts counted so far.
+        """
+        with self._lock:
+            return {self.customers[position]['customer_id']: count for position, count in self._alerts_by_position.items() if count}
+
+    def _rank_customers(self, category):
+        """
+        Returns [(position, affinity_score)] for every candidate of a category, best first.
+        """
+        # Counter.update counts whole posting lists at C speed
+        preference_matches = Counter()
+        for term in category_terms(category):
+            postings = self.by_preference.get(term)
+            if postings:
+                preference_matches.update(postings)
+
+        if not preference_matches:
+            return [
+                (position, round(self.segment_bonus[position] + RECENCY_WEIGHT * self.recency[position], 4))
+                for position in self._fallback_ranking
+            ]
+
+        scored = sorted(
+            ((PREFERENCE_WEIGHT * matches + self.segment_bonus[position] + RECENCY_WEIGHT * self.recency[position], position)
+             for position, matches in preference_matches.items()),
+            reverse=True
+        )
+        return [(position, round(score, 4)) for score, position in scored]
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 import time
@@ -7,6 +8,31 @@ from botocore.exceptions import ClientError
 from decimal import Decimal
 from dotenv import load_dotenv
 
+try:
+    from .async_engine import AsyncHttpClient, run_partitioned_async
+    from .coalescing import coalesce_latest, mark_recommendations_skipped
+    from .http_client import HttpClient
+    from .price_mirror import PriceMirror
+    from .retry_queue import (
+        DEFAULT_SQLITE_PATH, RETRY_STATUS_PENDING, DynamoDBRetryQueue, RetryDrainer, SQLiteRetryQueue, build_retry_entry
+    )
+    from .sync_engine import occurrence_waves, run_partitioned
+    from .transactions import (
+        MAX_SKUS_PER_TRANSACTION, price_sync_actions, transact_price_syncs
+    )
+except ImportError:  # Deployed from the agent's own folder, where this is a top-level module
+    from async_engine import AsyncHttpClient, run_partitioned_async
+    from coalescing import coalesce_latest, mark_recommendations_skipped
+    from http_client import HttpClient
+    from price_mirror import PriceMirror
+    from retry_queue import (
+        DEFAULT_SQLITE_PATH, RETRY_STATUS_PENDING, DynamoDBRetryQueue, RetryDrainer, SQLiteRetryQueue, build_retry_entry
+    )
+    from sync_engine import occurrence_waves, run_partitioned
+    from transactions import (
+        MAX_SKUS_PER_TRANSACTION, price_sync_actions, transact_price_syncs
+    )
+
 # Load environment variables (for local testing)
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
@@ -18,18 +44,72 @@ price_sync_log_table = dynamodb.Table(os.getenv("PRICE_SYNC_LOG_TABLE", "retail-
 
 # Ensure this points to port 5000 as per main.py update
 ECOMMERCE_PRICE_UPDATE_API = os.getenv("MOCK_ECOMMERCE_API_ENDPOINT", "http://127.0.0.1:5000/mock-api/update_price")
+ECOMMERCE_BULK_PRICE_UPDATE_API = os.getenv("MOCK_ECOMMERCE_BULK_API_ENDPOINT", "http://127.0.0.1:5000/mock-api/update_prices")
+ECOMMERCE_PRICE_FEED_API = os.getenv("MOCK_ECOMMERCE_PRICES_API_ENDPOINT", "http://127.0.0.1:5000/mock-api/prices")
+
+# 'single' sends one request per SKU; 'batch' sends chunks of SYNC_BATCH_SIZE SKUs to the bulk endpoint
+SYNC_MODE = os.getenv("SYNC_MODE", "single").lower()
+SYNC_BATCH_SIZE = int(os.getenv("SYNC_BATCH_SIZE", "100"))
+# Max e-commerce requests (SKUs, or chunks in batch mode) in flight at once; 1 syncs sequentially
+SYNC_MAX_IN_FLIGHT = int(os.getenv("SYNC_MAX_IN_FLIGHT", "8"))
+# Collapse several recommendations for one SKU in an event to the latest before syncing
+SYNC_COALESCE = os.getenv("SYNC_COALESCE", "true").lower() == "true"
+# Skip recommendations whose price the storefront already shows (checked against a local price mirror)
+SYNC_SKIP_UNCHANGED = os.getenv("SYNC_SKIP_UNCHANGED", "true").lower() == "true"
+# SKUs per TransactWriteItems call (inventory update + sync log entry each), capped at the service limit
+SYNC_TRANSACTION_SKUS = min(int(os.getenv("SYNC_TRANSACTION_SKUS", str(MAX_SKUS_PER_TRANSACTION))), MAX_SKUS_PER_TRANSACTION)
+# 'threads' pushes prices from a thread pool; 'asyncio' pushes them from an event loop (aiohttp if installed)
+SYNC_ENGINE = os.getenv("SYNC_ENGINE", "threads").lower()
+
+# Shared across warm invocations so connections to the e-commerce API are reused
+http_client = HttpClient.from_env()
+
+def _fetch_price_feed_page(since):
+    """
+    Reads one page of the storefront's price feed: prices changed after cursor 'since'.
+    """
+    response = http_client.get(ECOMMERCE_PRICE_FEED_API, params={'since': since} if since else None)
+    response.raise_for_status()
+    return response.json()
+
+# Storefront prices, refreshed incrementally at the start of each sync and kept across warm invocations
+price_mirror = PriceMirror(_fetch_price_feed_page)
+
+# Storefront updates that fail are queued and retried with backoff instead of being dropped.
+# Set SYNC_RETRY_TABLE (partition key 'sku_region_pk') to use DynamoDB; otherwise a SQLite file at SYNC_RETRY_DB.
+SYNC_RETRY_QUEUE = os.getenv("SYNC_RETRY_QUEUE", "true").lower() == "true"
+sync_retry_table_name = os.getenv("SYNC_RETRY_TABLE")
+if sync_retry_table_name:
+    retry_queue = DynamoDBRetryQueue(dynamodb.Table(sync_retry_table_name))
+elif os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+    # In Lambda, /tmp goes away with the execution environment and nothing drains a SQLite file there
+    retry_queue = None
+    if SYNC_RETRY_QUEUE:
+        print("WARN: SYNC_RETRY_TABLE is not set; failed storefront price updates will NOT be queued for retry in Lambda.")
+else:
+    retry_queue = SQLiteRetryQueue(os.getenv("SYNC_RETRY_DB", DEFAULT_SQLITE_PATH))
+
+def _queues_retries(event):
+    """
+    Returns True if failed storefront updates of this event go to the retry queue.
+    """
+    return retry_queue is not None and event.get('queue_retries', SYNC_RETRY_QUEUE)
 
-def _update_ecommerce_price(sku, new_price):
+def _update_ecommerce_price(sku, new_price, idempotency_key=None):
     """
     Simulates sending a real-time price update to an external e-commerce platform.
+    Uses the pooled HTTP client, which times out and retries transient failures.
+    idempotency_key (the recommendation ID) lets the platform ignore repeated deliveries.
     """
     payload = {
         'sku': sku,
         'new_price': new_price
     }
+    if idempotency_key:
+        payload['idempotency_key'] = idempotency_key
     print(f"DEBUG: Attempting to send price update to e-commerce API: {ECOMMERCE_PRICE_UPDATE_API} for SKU {sku} to price {new_price}")
     try:
-        response = requests.post(ECOMMERCE_PRICE_UPDATE_API, json=payload)
+        response = http_client.post_json(ECOMMERCE_PRICE_UPDATE_API, payload)
         response.raise_for_status() 
         print(f"DEBUG: Successfully updated price for SKU {sku} on e-commerce platform (simulated). Response: {response.json()}")
         return True
@@ -40,89 +120,524 @@ def _update_ecommerce_price(sku, new_price):
         print(f"ERROR: Unexpected error in _update_ecommerce_price for SKU {sku}: {e}")
         return False
 
-def lambda_handler(event, context):
+def _update_ecommerce_prices(updates):
     """
-    Lambda function for the Real-Time Price Sync Agent.
-    Applies approved pricing recommendations and logs the sync action.
-    Triggered by Step Functions or directly by UI apply action.
+    Sends a chunk of price updates to the e-commerce platform's bulk endpoint in one request.
+    updates is a list of {'sku', 'new_price', 'idempotency_key'} dicts. Returns a dict of sku -> True/False;
+    if the whole request fails, every SKU in the chunk is reported as failed.
     """
-    print("Real-Time Price Sync Agent triggered.")
+    print(f"DEBUG: Sending {len(updates)} price updates to bulk e-commerce API: {ECOMMERCE_BULK_PRICE_UPDATE_API}")
+    try:
+        response = http_client.post_json(ECOMMERCE_BULK_PRICE_UPDATE_API, {'updates': updates})
+        response.raise_for_status()
+        outcomes = {result.get('sku'): result.get('status') == 'success' for result in response.json().get('results', [])}
+    except requests.exceptions.RequestException as e:
+        print(f"ERROR: Bulk price update of {len(updates)} SKUs failed: {e}")
+        outcomes = {}
+    except Exception as e:
+        print(f"ERROR: Unexpected error in _update_ecommerce_prices: {e}")
+        outcomes = {}
+    # SKUs missing from the response are treated as not updated
+    return {update['sku']: outcomes.get(update['sku'], False) for update in updates}
+
+async def _update_ecommerce_price_async(client, sku, new_price, idempotency_key=None):
+    """
+    Same as _update_ecommerce_price, sent through the AsyncHttpClient 'client'.
+    """
+    payload = {'sku': sku, 'new_price': new_price}
+    if idempotency_key:
+        payload['idempotency_key'] = idempotency_key
+    print(f"DEBUG: Attempting to send price update to e-commerce API: {ECOMMERCE_PRICE_UPDATE_API} for SKU {sku} to price {new_price}")
+    try:
+        response = await client.post_json(ECOMMERCE_PRICE_UPDATE_API, payload)
+        response.raise_for_status()
+        print(f"DEBUG: Successfully updated price for SKU {sku} on e-commerce platform (simulated). Response: {response.json()}")
+        return True
+    except requests.exceptions.RequestException as e:
+        print(f"ERROR: Failed to update price for SKU {sku} on e-commerce platform: {e}")
+        return False
+    except Exception as e:
+        print(f"ERROR: Unexpected error in _update_ecommerce_price_async for SKU {sku}: {e}")
+        return False
+
+async def _update_ecommerce_prices_async(client, updates):
+    """
+    Same as _update_ecommerce_prices, sent through the AsyncHttpClient 'client'.
+    """
+    print(f"DEBUG: Sending {len(updates)} price updates to bulk e-commerce API: {ECOMMERCE_BULK_PRICE_UPDATE_API}")
+    try:
+        response = await client.post_json(ECOMMERCE_BULK_PRICE_UPDATE_API, {'updates': updates})
+        response.raise_for_status()
+        outcomes = {result.get('sku'): result.get('status') == 'success' for result in response.json().get('results', [])}
+    except requests.exceptions.RequestException as e:
+        print(f"ERROR: Bulk price update of {len(updates)} SKUs failed: {e}")
+        outcomes = {}
+    except Exception as e:
+        print(f"ERROR: Unexpected error in _update_ecommerce_prices_async: {e}")
+        outcomes = {}
+    return {update['sku']: outcomes.get(update['sku'], False) for update in updates}
+
+def _validate_recommendation(rec):
+    """
+    Returns (sku_region_pk, sku, recommended_price) for a recommendation that should be synced,
+    or a 'skipped' sync result for one that should not.
+    """
+    print(f"DEBUG: Sync Agent inspecting recommendation: ID={rec.get('id', 'N/A')}, SKU={rec.get('sku', 'N/A')}, Type='{rec.get('type', 'N/A')}', Status='{rec.get('status', 'N/A')}'")
+
+    if rec.get('type') == 'price_adjustment' and rec.get('status') == 'applied':
+        sku_region_pk = rec.get('sku_region_pk') 
+        sku = rec.get('sku')
+        # --- FIX: Use 'recommendedPrice' (camelCase) from frontend object ---
+        recommended_price = float(rec.get('recommendedPrice', 0.0)) 
+        # --- END FIX ---
 
-    recommendations_to_sync = event.get('recommendations', [])
-
-    synced_actions_count = 0
-    synced_results = []
-
-    if not recommendations_to_sync:
-        print("DEBUG: No recommendations received in event for sync agent.")
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'message': 'No recommendations provided to sync.'})
-        }
-
-    for rec in recommendations_to_sync:
-        print(f"DEBUG: Sync Agent inspecting recommendation: ID={rec.get('id', 'N/A')}, SKU={rec.get('sku', 'N/A')}, Type='{rec.get('type', 'N/A')}', Status='{rec.get('status', 'N/A')}'")
-
-        if rec.get('type') == 'price_adjustment' and rec.get('status') == 'applied':
-            sku_region_pk = rec.get('sku_region_pk') 
-            sku = rec.get('sku')
-            # --- FIX: Use 'recommendedPrice' (camelCase) from frontend object ---
-            recommended_price = float(rec.get('recommendedPrice', 0.0)) 
-            # --- END FIX ---
-
-            if not sku_region_pk or not sku or recommended_price is None:
-                print(f"WARN: Skipping recommendation {rec.get('id', 'N/A')} due to missing critical fields (sku_region_pk, sku, recommended_price).")
-                synced_results.append({'sku': sku, 'status': 'skipped', 'reason': 'missing critical fields'})
-                continue 
-
-            print(f"DEBUG: Processing recommendation for SKU {sku_region_pk} with new price {recommended_price}")
-
-            if _update_ecommerce_price(sku, recommended_price):
-                try:
-                    inventory_table.update_item(
-                        Key={'sku_region_pk': sku_region_pk},
-                        UpdateExpression="SET current_stock = :price, last_updated = :ts",
-                        ExpressionAttributeValues={
-                            ':price': Decimal(str(recommended_price)), 
-                            ':ts': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
-                        }
-                    )
-                    print(f"DEBUG: Successfully updated inventory table for SKU {sku_region_pk}")
-
-                    log_item = {
-                        'sku_region_pk': sku_region_pk,
-                        'timestamp': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
-                        'recommendation_id': rec.get('id', 'N/A'),
-                        'sku': sku,
-                        'action': 'price_sync',
-                        'old_price': Decimal(str(rec.get('currentPrice', 0.0))), # Use currentPrice from frontend object
-                        'new_price': Decimal(str(recommended_price)), 
-                        'status': 'success'
-                    }
-                    price_sync_log_table.put_item(Item=log_item)
-                    print(f"DEBUG: Successfully logged price sync for SKU {sku_region_pk}")
-
-                    synced_actions_count += 1
-                    synced_results.append({'sku': sku, 'status': 'success', 'new_price': recommended_price})
-
-                except ClientError as e:
-                    print(f"ERROR: ClientError during DynamoDB updates for SKU {sku_region_pk}: {e.response['Error']['Message']}")
-                    synced_results.append({'sku': sku, 'status': 'failed_db_update', 'error': str(e)})
-                except Exception as e:
-                    print(f"ERROR: Unexpected error during DynamoDB updates for SKU {sku_region_pk}: {e}")
-                    synced_results.append({'sku': sku, 'status': 'failed_db_update', 'error': str(e)})
-            else:
-                print(f"ERROR: Failed to update e-commerce price for SKU {sku_region_pk}. Skipping subsequent DB updates.")
-                synced_results.append({'sku': sku, 'status': 'failed_ecommerce_update', 'new_price': recommended_price})
+        if not sku_region_pk or not sku or recommended_price is None:
+            print(f"WARN: Skipping recommendation {rec.get('id', 'N/A')} due to missing critical fields (sku_region_pk, sku, recommended_price).")
+            return {'sku': sku, 'status': 'skipped', 'reason': 'missing critical fields'}
+        return sku_region_pk, sku, recommended_price
+
+    print(f"DEBUG: Skipping recommendation {rec.get('id', 'N/A')} due to status '{rec.get('status', 'N/A')}' or type '{rec.get('type', 'N/A')}' (expected 'applied' and 'price_adjustment').")
+    return {'sku': rec.get('sku', 'N/A'), 'status': 'skipped', 'reason': 'status or type mismatch'}
+
+def _build_sync_log_item(rec, sku_region_pk, sku, recommended_price, timestamp):
+    return {
+        'sku_region_pk': sku_region_pk,
+        'timestamp': timestamp,
+        'recommendation_id': rec.get('id', 'N/A'),
+        'sku': sku,
+        'action': 'price_sync',
+        'old_price': Decimal(str(rec.get('currentPrice', 0.0))), # Use currentPrice from frontend object
+        'new_price': Decimal(str(recommended_price)), 
+        'status': 'success'
+    }
+
+def _write_sync_chunk(chunk):
+    """
+    Records the inventory price update and sync log entry of every SKU in chunk (pushed
+    pending entries, one per SKU) in one DynamoDB transaction, atomically per SKU.
+    Returns a list of (index, sync_result).
+    """
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    records = [
+        (index, price_sync_actions(
+            inventory_table.name, price_sync_log_table.name, sku_region_pk, Decimal(str(recommended_price)),
+            _build_sync_log_item(rec, sku_region_pk, sku, recommended_price, timestamp)
+        ))
+        for index, rec, sku_region_pk, sku, recommended_price in chunk
+    ]
+    try:
+        errors = transact_price_syncs(dynamodb.meta.client, records)
+    except Exception as e:
+        print(f"ERROR: Unexpected error during DynamoDB updates for {len(chunk)} SKUs: {e}")
+        errors = {index: str(e) for index, _ in records}
+
+    results = []
+    for index, rec, sku_region_pk, sku, recommended_price in chunk:
+        if errors.get(index) is None:
+            print(f"DEBUG: Successfully updated inventory table and logged price sync for SKU {sku_region_pk}")
+            results.append((index, {'sku': sku, 'status': 'success', 'new_price': recommended_price}))
+        else:
+            print(f"ERROR: DynamoDB updates failed for SKU {sku_region_pk}: {errors[index]}")
+            results.append((index, {'sku': sku, 'status': 'failed_db_update', 'error': errors[index]}))
+    return results
+
+def _transaction_waves(pushed):
+    """
+    Yields, wave by wave, the chunks of SYNC_TRANSACTION_SKUS pushed entries to record in one
+    transaction each. A SKU appears at most once per wave, and waves follow event order.
+    """
+    for wave in occurrence_waves(pushed, _pending_sku_key):
+        yield [wave[start:start + SYNC_TRANSACTION_SKUS] for start in range(0, len(wave), SYNC_TRANSACTION_SKUS)]
+
+def _record_price_syncs(pushed, synced_results, max_in_flight):
+    """
+    Records SKUs whose e-commerce update succeeded, SYNC_TRANSACTION_SKUS per transaction and up
+    to max_in_flight transactions at once. A transaction never holds the same SKU twice, and
+    repeated updates to a SKU are written in event order.
+    """
+    for chunks in _transaction_waves(pushed):
+        for chunk_results in run_partitioned(chunks, _write_sync_chunk, max_in_flight):
+            for index, result in chunk_results:
+                synced_results[index] = result
+
+async def _record_price_syncs_async(pushed, synced_results, max_in_flight):
+    """
+    Same as _record_price_syncs from an event loop. boto3 is blocking, so each transaction runs
+    on the loop's default thread pool, which also bounds how many are in flight.
+    """
+    for chunks in _transaction_waves(pushed):
+        for chunk_results in await run_partitioned_async(chunks, lambda chunk: asyncio.to_thread(_write_sync_chunk, chunk), max_in_flight):
+            for index, result in chunk_results:
+                synced_results[index] = result
+
+def _pending_sku_key(entry):
+    return entry[2]
+
+def _coalesce_pending(pending, synced_results):
+    """
+    Keeps only the latest pending recommendation per sku_region_pk (by timestamp, then event
+    order). Superseded ones get a 'skipped' result and are marked skipped in the recommendations
+    table in one PartiQL batch. Returns the pending entries left to sync.
+    """
+    latest, superseded = coalesce_latest(pending, _pending_sku_key, lambda entry: entry[1].get('timestamp'))
+    if not superseded:
+        return pending
+
+    superseded_keys = []
+    for (index, rec, sku_region_pk, sku, _), winner_entry in superseded:
+        winner = winner_entry[1]
+        synced_results[index] = {'sku': sku, 'status': 'skipped', 'reason': 'superseded', 'superseded_by': winner.get('id', 'N/A')}
+        if rec.get('timestamp'):
+            superseded_keys.append((sku_region_pk, rec['timestamp'], winner.get('id', 'N/A')))
+    print(f"DEBUG: Coalesced {len(pending)} recommendations to {len(latest)}; {len(superseded)} superseded.")
+
+    if superseded_keys:
+        try:
+            mark_recommendations_skipped(dynamodb.meta.client, recommendations_table.name, superseded_keys)
+        except ClientError as e:
+            print(f"WARN: Could not mark superseded recommendations as skipped: {e.response['Error']['Message']}")
+    return latest
+
+def _skip_unchanged(pending, synced_results):
+    """
+    Refreshes the price mirror and drops pending recommendations whose price the storefront
+    already shows; they get an 'unchanged' result without an HTTP call or DynamoDB write.
+    Returns the pending entries left to sync.
+    """
+    price_mirror.refresh()
+    remaining = []
+    for entry in pending:
+        index, _, sku_region_pk, sku, recommended_price = entry
+        if price_mirror.is_unchanged(sku, recommended_price):
+            print(f"DEBUG: Storefront already shows {recommended_price} for SKU {sku_region_pk}; skipping no-op update.")
+            synced_results[index] = {'sku': sku, 'status': 'unchanged', 'new_price': recommended_price}
         else:
-            print(f"DEBUG: Skipping recommendation {rec.get('id', 'N/A')} due to status '{rec.get('status', 'N/A')}' or type '{rec.get('type', 'N/A')}' (expected 'applied' and 'price_adjustment').")
-            synced_results.append({'sku': rec.get('sku', 'N/A'), 'status': 'skipped', 'reason': 'status or type mismatch'})
+            remaining.append(entry)
+    return remaining
+
+def _push_one(entry):
+    """
+    Pushes one pending (index, rec, sku_region_pk, sku, price) with its own e-commerce request.
+    Returns (entry, updated).
+    """
+    _, rec, sku_region_pk, sku, recommended_price = entry
+    print(f"DEBUG: Processing recommendation for SKU {sku_region_pk} with new price {recommended_price}")
+    return entry, _update_ecommerce_price(sku, recommended_price, rec.get('id'))
+
+def _push_chunk(chunk):
+    """
+    Pushes a chunk of pending recommendations through the bulk e-commerce endpoint.
+    Returns a list of (entry, updated).
+    """
+    outcomes = _update_ecommerce_prices([
+        {'sku': sku, 'new_price': price, 'idempotency_key': rec.get('id')} for _, rec, _, sku, price in chunk
+    ])
+    return [(entry, outcomes[entry[3]]) for entry in chunk]
+
+def _push_single(pending, max_in_flight):
+    """
+    Pushes pending recommendations one request per SKU, up to max_in_flight at once.
+    Recommendations for the same SKU are pushed one after another in event order.
+    """
+    return run_partitioned(pending, _push_one, max_in_flight, key_fn=_pending_sku_key)
+
+async def _push_one_async(client, entry):
+    _, rec, sku_region_pk, sku, recommended_price = entry
+    print(f"DEBUG: Processing recommendation for SKU {sku_region_pk} with new price {recommended_price}")
+    return entry, await _update_ecommerce_price_async(client, sku, recommended_price, rec.get('id'))
 
+async def _push_chunk_async(client, chunk):
+    outcomes = await _update_ecommerce_prices_async(client, [
+        {'sku': sku, 'new_price': price, 'idempotency_key': rec.get('id')} for _, rec, _, sku, price in chunk
+    ])
+    return [(entry, outcomes[entry[3]]) for entry in chunk]
+
+def _push_batched(pending, batch_size, max_in_flight):
+    """
+    Pushes pending recommendations in chunks of batch_size through the bulk e-commerce endpoint,
+    up to max_in_flight chunks at once. A SKU appears at most once per wave of chunks and waves
+    run in order, so repeated updates to a SKU still land in event order.
+    """
+    outcomes = []
+    for wave in occurrence_waves(pending, _pending_sku_key):
+        chunks = [wave[start:start + batch_size] for start in range(0, len(wave), batch_size)]
+        for chunk_outcomes in run_partitioned(chunks, _push_chunk, max_in_flight):
+            outcomes.extend(chunk_outcomes)
+    return outcomes
+
+def _split_push_outcomes(push_outcomes, synced_results):
+    """
+    Splits (entry, updated) push outcomes into the entries to record in DynamoDB, in event
+    order, and the failed ones, which get a 'failed_ecommerce_update' result.
+    """
+    pushed = []
+    failed = []
+    for entry, ecommerce_updated in push_outcomes:
+        index, _, sku_region_pk, sku, recommended_price = entry
+        if ecommerce_updated:
+            price_mirror.record(sku, recommended_price)
+            pushed.append(entry)
+        else:
+            print(f"ERROR: Failed to update e-commerce price for SKU {sku_region_pk}. Skipping subsequent DB updates.")
+            synced_results[index] = {'sku': sku, 'status': 'failed_ecommerce_update', 'new_price': recommended_price}
+            failed.append(entry)
+    # Keep event order so repeated updates to a SKU are recorded in the order they were pushed
+    pushed.sort(key=lambda entry: entry[0])
+    return pushed, failed
+
+def _sync_pending(pending, synced_results, sync_mode, batch_size, max_in_flight, skip_unchanged):
+    """
+    Pushes pending (index, rec, sku_region_pk, sku, price) entries to the storefront and records
+    the successful ones in DynamoDB, filling synced_results. Returns the entries whose storefront
+    update failed.
+    """
+    if pending and skip_unchanged:
+        pending = _skip_unchanged(pending, synced_results)
+
+    if sync_mode == 'batch':
+        print(f"DEBUG: Syncing {len(pending)} prices in batches of {batch_size}, {max_in_flight} in flight.")
+        push_outcomes = _push_batched(pending, batch_size, max_in_flight)
+    else:
+        print(f"DEBUG: Syncing {len(pending)} prices, {max_in_flight} in flight.")
+        push_outcomes = _push_single(pending, max_in_flight)
+
+    pushed, failed = _split_push_outcomes(push_outcomes, synced_results)
+    _record_price_syncs(pushed, synced_results, max_in_flight)
+    return failed
+
+async def _sync_pending_async(pending, synced_results, sync_mode, batch_size, max_in_flight, skip_unchanged):
+    """
+    Same as _sync_pending from an event loop: storefront updates go through an AsyncHttpClient
+    with up to max_in_flight requests in flight, and the blocking price feed refresh and
+    DynamoDB writes are offloaded to threads.
+    """
+    if pending and skip_unchanged:
+        pending = await asyncio.to_thread(_skip_unchanged, pending, synced_results)
+
+    async with AsyncHttpClient(http_client, max_connections=max_in_flight) as client:
+        if sync_mode == 'batch':
+            print(f"DEBUG: Syncing {len(pending)} prices in batches of {batch_size}, {max_in_flight} in flight (asyncio).")
+            push_outcomes = []
+            for wave in occurrence_waves(pending, _pending_sku_key):
+                chunks = [wave[start:start + batch_size] for start in range(0, len(wave), batch_size)]
+                for chunk_outcomes in await run_partitioned_async(chunks, lambda chunk: _push_chunk_async(client, chunk), max_in_flight):
+                    push_outcomes.extend(chunk_outcomes)
+        else:
+            print(f"DEBUG: Syncing {len(pending)} prices, {max_in_flight} in flight (asyncio).")
+            push_outcomes = await run_partitioned_async(pending, lambda entry: _push_one_async(client, entry), max_in_flight, key_fn=_pending_sku_key)
+
+    pushed, failed = _split_push_outcomes(push_outcomes, synced_results)
+    await _record_price_syncs_async(pushed, synced_results, max_in_flight)
+    return failed
+
+def _create_retry_drainer():
+    """
+    Creates the drainer that retries queued storefront updates, configured from the environment.
+    """
+    return RetryDrainer(
+        retry_queue,
+        _sync_retry_entries,
+        max_attempts=int(os.getenv("SYNC_RETRY_MAX_ATTEMPTS", "5")),
+        base_backoff_seconds=float(os.getenv("SYNC_RETRY_BACKOFF_SECONDS", "5")),
+        claim_size=SYNC_BATCH_SIZE,
+    )
+
+def _claim_pending(pending, synced_results):
+    """
+    Claims the retry queue entry of every SKU about to be synced (replacing any older queued
+    price), so a retry drainer never pushes a SKU while this sync does. A SKU whose entry a
+    drainer holds is not pushed here: its newer price is handed to that drainer's claim and
+    pushed after the drainer's own push. Returns (pending left to push, claims by sku_region_pk).
+    """
+    latest = {}
+    for entry in pending:
+        latest[entry[2]] = entry
+    try:
+        claimed, handed_off = retry_queue.claim_keys([
+            build_retry_entry(rec, sku_region_pk, sku, recommended_price)
+            for _, rec, sku_region_pk, sku, recommended_price in latest.values()
+        ])
+    except Exception as e:
+        print(f"WARN: Could not claim retry queue entries; syncing without them: {e}")
+        return pending, {}
+
+    handed_off_pks = {entry['sku_region_pk'] for entry in handed_off}
+    if handed_off_pks:
+        print(f"DEBUG: {len(handed_off_pks)} SKUs have a retry in flight; their prices are queued behind it.")
+        for index, _, sku_region_pk, sku, recommended_price in pending:
+            if sku_region_pk in handed_off_pks:
+                synced_results[index] = {'sku': sku, 'status': 'deferred', 'reason': 'older retry in flight',
+                                         'new_price': recommended_price, 'queued_for_retry': True}
+    return [entry for entry in pending if entry[2] not in handed_off_pks], {entry['sku_region_pk']: entry for entry in claimed}
+
+def _settle_claims(claims, failed, synced_results):
+    """
+    Settles this sync's retry queue claims: SKUs the storefront took are done, failed ones
+    stay queued for retry. With the local SQLite queue a background drainer starts right away;
+    with SYNC_RETRY_TABLE a scheduled {'mode': 'drain_retries'} invocation drains the table.
+    Claims that cannot be settled are retried once their lease expires.
+    """
+    failed_pks = {sku_region_pk for _, _, sku_region_pk, _, _ in failed}
+    try:
+        retry_queue.mark_done([claim for sku_region_pk, claim in claims.items() if sku_region_pk not in failed_pks])
+        for sku_region_pk in failed_pks & claims.keys():
+            retry_queue.reschedule(claims[sku_region_pk], RETRY_STATUS_PENDING, 0, 0, 'storefront update failed')
+    except Exception as e:
+        print(f"ERROR: Could not settle {len(claims)} retry queue claims; they are retried once their lease expires: {e}")
+    for index, _, _, _, _ in failed:
+        synced_results[index]['queued_for_retry'] = True
+    if failed:
+        print(f"DEBUG: Queued {len(failed_pks)} failed price updates in the {retry_queue.name} retry queue.")
+        if isinstance(retry_queue, SQLiteRetryQueue):
+            _create_retry_drainer().start_background_drain()
+
+def _sync_retry_entries(entries):
+    """
+    Pushes claimed retry queue entries through the regular sync path.
+    Returns a dict of sku_region_pk -> error (None once the storefront has the price).
+    """
+    synced_results = [None] * len(entries)
+    pending = [
+        (index, dict(entry['recommendation'], sku=entry['sku'], sku_region_pk=entry['sku_region_pk'], recommendedPrice=entry['new_price']),
+         entry['sku_region_pk'], entry['sku'], float(entry['new_price']))
+        for index, entry in enumerate(entries)
+    ]
+    _sync_pending(pending, synced_results, SYNC_MODE, SYNC_BATCH_SIZE, SYNC_MAX_IN_FLIGHT, SYNC_SKIP_UNCHANGED)
+    # A failed DynamoDB write is not retried here: the storefront already has the price
+    return {
+        entry['sku_region_pk']: 'storefront update failed' if result['status'] == 'failed_ecommerce_update' else None
+        for entry, result in zip(entries, synced_results)
+    }
+
+def _run_retry_drain(event, context):
+    """
+    Handles {'mode': 'drain_retries'}: retries due storefront updates from the retry queue until
+    none are due or the invocation's time budget (minus a safety margin) runs out.
+    Meant to run on a schedule when SYNC_RETRY_TABLE is set.
+    """
+    if retry_queue is None:
+        return {'statusCode': 400, 'body': json.dumps({'message': 'No retry queue configured; set SYNC_RETRY_TABLE'})}
+    max_seconds = float(event.get('max_seconds', 60))
+    if hasattr(context, 'get_remaining_time_in_millis'):
+        max_seconds = min(max_seconds, context.get_remaining_time_in_millis() / 1000.0 - 5.0)
+    stats = _create_retry_drainer().drain(max_seconds=max(max_seconds, 1.0), wait_for_retries=False)
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': 'Price sync retry queue drained', 'retry_queue': retry_queue.name,
+                            'retries': stats, 'queue_counts': retry_queue.counts()}, default=str)
+    }
+
+def _sync_options(event):
+    """
+    Returns the _sync_pending keyword arguments for an event, falling back to the SYNC_* settings.
+    """
+    return {
+        'sync_mode': event.get('mode', SYNC_MODE),
+        'batch_size': max(1, int(event.get('batch_size', SYNC_BATCH_SIZE))),
+        'max_in_flight': max(1, int(event.get('max_in_flight', SYNC_MAX_IN_FLIGHT))),
+        'skip_unchanged': event.get('skip_unchanged', SYNC_SKIP_UNCHANGED),
+    }
+
+def _prepare_sync(event):
+    """
+    Validates the event's recommendations and, unless 'coalesce' is false, keeps the latest per SKU.
+    Unless 'queue_retries' is false, the retry queue entries of the SKUs to sync are claimed.
+    Returns (synced_results, pending, claims): skipped recommendations already have their result.
+    """
+    recommendations_to_sync = event['recommendations']
+    synced_results = [None] * len(recommendations_to_sync)
+    pending = []
+    for index, rec in enumerate(recommendations_to_sync):
+        validated = _validate_recommendation(rec)
+        if isinstance(validated, dict):
+            synced_results[index] = validated
+        else:
+            pending.append((index, rec) + validated)
+
+    if event.get('coalesce', SYNC_COALESCE):
+        pending = _coalesce_pending(pending, synced_results)
+    claims = {}
+    if pending and _queues_retries(event):
+        pending, claims = _claim_pending(pending, synced_results)
+    return synced_results, pending, claims
+
+def _finish_sync(event, engine, claims, failed, synced_results):
+    """
+    Settles the sync's retry queue claims, queuing failed storefront updates for retry, and builds the response.
+    """
+    if claims:
+        _settle_claims(claims, failed, synced_results)
+
+    synced_actions_count = sum(1 for result in synced_results if result['status'] == 'success')
+    http_metrics = http_client.metrics()
     print(f"Completed syncing {synced_actions_count} actions.")
+    for endpoint, metrics in http_metrics.items():
+        print(f"HTTP {endpoint}: {metrics['requests']} requests, {metrics['retries']} retries, {metrics['errors']} errors, p50 <= {metrics['latency']['p50_ms']} ms, p99 <= {metrics['latency']['p99_ms']} ms, avg rate-limit wait {metrics['queue_wait']['avg_ms']} ms.")
     return {
         'statusCode': 200,
         'body': json.dumps({
             'message': f'Price and promotion sync completed',
-            'sync_results': synced_results
+            'sync_mode': event.get('mode', SYNC_MODE),
+            'engine': engine,
+            'sync_results': synced_results,
+            'price_mirror': price_mirror.summary(),
+            'http_metrics': http_metrics
         }, default=str) 
-    }
\ No newline at end of file
+    }
+
+def _no_recommendations_response():
+    print("DEBUG: No recommendations received in event for sync agent.")
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'message': 'No recommendations provided to sync.'})
+    }
+
+def lambda_handler(event, context):
+    """
+    Lambda function for the Real-Time Price Sync Agent.
+    Applies approved pricing recommendations and logs the sync action.
+    Triggered by Step Functions or directly by UI apply action.
+    Set 'mode': 'batch' in the event (or SYNC_MODE=batch) to push prices through the
+    bulk endpoint in chunks of 'batch_size' (SYNC_BATCH_SIZE) instead of one request per SKU.
+    Up to 'max_in_flight' (SYNC_MAX_IN_FLIGHT) requests run concurrently; results keep event order.
+    Unless 'coalesce' (SYNC_COALESCE) is false, only the latest recommendation per SKU is synced.
+    Unless 'skip_unchanged' (SYNC_SKIP_UNCHANGED) is false, prices the storefront already shows
+    are reported 'unchanged' and not pushed.
+    Failed storefront updates are queued for retry (SYNC_RETRY_QUEUE); {'mode': 'drain_retries'}
+    retries the due ones. A SKU whose queued retry is being pushed right then is reported
+    'deferred': its price is queued behind that retry instead of racing it.
+    With 'engine': 'asyncio' (SYNC_ENGINE=asyncio) the sync runs in an event loop through
+    lambda_handler_async, so far more requests can be in flight without a thread each.
+    """
+    if event.get('engine', SYNC_ENGINE) == 'asyncio':
+        return asyncio.run(lambda_handler_async(event, context))
+
+    print("Real-Time Price Sync Agent triggered.")
+
+    if event.get('mode') == 'drain_retries':
+        return _run_retry_drain(event, context)
+
+    if not event.get('recommendations'):
+        return _no_recommendations_response()
+
+    synced_results, pending, claims = _prepare_sync(event)
+    failed = _sync_pending(pending, synced_results, **_sync_options(event))
+    return _finish_sync(event, 'threads', claims, failed, synced_results)
+
+async def lambda_handler_async(event, context):
+    """
+    Asyncio version of lambda_handler for callers that already run an event loop; takes the
+    same events and returns the same response. Storefront requests are awaited (aiohttp if
+    installed), while blocking boto3, SQLite and price feed calls run in worker threads.
+    """
+    print("Real-Time Price Sync Agent triggered (asyncio engine).")
+
+    if event.get('mode') == 'drain_retries':
+        return await asyncio.to_thread(_run_retry_drain, event, context)
+
+    if not event.get('recommendations'):
+        return _no_recommendations_response()
+
+    synced_results, pending, claims = await asyncio.to_thread(_prepare_sync, event)
+    failed = await _sync_pending_async(pending, synced_results, **_sync_options(event))
+    return await asyncio.to_thread(_finish_sync, event, 'asyncio', claims, failed, synced_results)
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # Optional: without it requests run on a thread pool
+    aiohttp = None
+
+
+async def run_partitioned_async(items, handle, max_in_flight, key_fn=None):
+    """
+    Awaits handle(item) for every item with at most max_in_flight calls running at once.
+    Like run_partitioned, items with the same key_fn(item) run one after another in input
+    order and different keys run concurrently. max_in_flight worker tasks pull key groups
+    from a shared iterator, so only the running calls exist at any time however many items
+    there are. Returns the results in input order; an exception from handle is re-raised.
+    """
+    groups = OrderedDict()
+    for position, item in enumerate(items):
+        groups.setdefault(key_fn(item) if key_fn else position, []).append(position)
+    results = [None] * len(items)
+    remaining_groups = iter(groups.values())
+
+    async def worker():
+        for positions in remaining_groups:
+            for position in positions:
+                results[position] = await handle(items[position])
+
+    await asyncio.gather(*(worker() for _ in range(min(max(1, max_in_flight), len(groups)))))
+    return results
+
+
+class AsyncResponse:
+    """
+    Fully read response from AsyncHttpClient, with the parts of requests.Response the sync agent uses.
+    """
+
+    def __init__(self, status_code, headers, content, url):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.url = url
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}")
+
+
+class AsyncHttpClient:
+    """
+    Async counterpart of HttpClient for use inside an event loop, sharing its timeouts, retry
+    policy, rate limiter and metrics. With aiohttp installed, requests go through one
+    ClientSession holding at most max_connections connections, so hundreds of requests can
+    be in flight without a thread each. Without aiohttp, the blocking client runs on a pool of
+    max_connections threads. Use as an async context manager; failures surface as
+    requests.exceptions errors, as with HttpClient.
+    """
+
+    def __init__(self, http_client, max_connections=100):
+        self.http_client = http_client
+        self.max_connections = max(1, max_connections)
+        self._session = None
+        self._executor = None
+
+    async def __aenter__(self):
+        if aiohttp:
+            connect_timeout, read_timeout = self.http_client.timeout
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout),
+            )
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_connections)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._session:
+            await self._session.close()
+            self._session = None
+        if self._executor:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def request(self, method, url, **kwargs):
+        """
+        Sends a request, retrying transient failures like HttpClient.request. Returns the last
+        response (the caller checks its status) or raises requests.exceptions.ConnectionError.
+        """
+        if self._session is None:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, lambda: self.http_client.request(method, url, **kwargs)
+            )
+
+        client = self.http_client
+        endpoint, bucket = client.endpoint_bucket(url)
+        for attempt in range(client.max_retries + 1):
+            queue_wait_ms = await bucket.acquire_async() * 1000 if bucket else 0.0
+            started_at = time.time()
+            try:
+                async with self._session.request(method, url, **kwargs) as response:
+                    content = await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                client.observe(endpoint, (time.time() - started_at) * 1000, error=True, retried=attempt > 0, queue_wait_ms=queue_wait_ms)
+                delay = client.error_retry_delay(method, endpoint, attempt, e)
+                if delay is None:
+                    raise requests.exceptions.ConnectionError(f"{method} {url} failed: {e.__class__.__name__}: {e}") from e
+                await asyncio.sleep(delay)
+                continue
+
+            client.observe(endpoint, (time.time() - started_at) * 1000, response.status,
+                           error=response.status >= 400, retried=attempt > 0, queue_wait_ms=queue_wait_ms)
+            delay = client.response_retry_delay(method, endpoint, bucket, attempt, response.status, response.headers.get('Retry-After'))
+            if delay is None:
+                return AsyncResponse(response.status, response.headers, content, url)
+            await asyncio.sleep(delay)
+
+    async def post_json(self, url, payload):
+        return await self.request('POST', url, json=payload)
@@ -0,0 +1,49 @@
+# PartiQL BatchExecuteStatement accepts at most 25 statements per call
+PARTIQL_BATCH_LIMIT = 25
+
+
+def coalesce_latest(entries, key_fn, timestamp_fn):
+    """
+    Collapses entries to the latest one per key_fn(entry), by timestamp_fn(entry) and then by
+    position (a later entry wins a tie). Returns (latest, superseded): latest keeps input order,
+    superseded is a list of (entry, winning_entry).
+    """
+    winners = {}
+    for position, entry in enumerate(entries):
+        key = key_fn(entry)
+        rank = (timestamp_fn(entry) or '', position)
+        if key not in winners or rank >= winners[key][0]:
+            winners[key] = (rank, entry)
+
+    latest = []
+    superseded = []
+    for entry in entries:
+        winner = winners[key_fn(entry)][1]
+        if winner is entry:
+            latest.append(entry)
+        else:
+            superseded.append((entry, winner))
+    return latest, superseded
+
+
+def mark_recommendations_skipped(dynamodb_client, table_name, superseded_keys):
+    """
+    Sets status 'skipped' and superseded_by on recommendations in the recommendations table
+    with PartiQL BatchExecuteStatement, 25 updates per call. superseded_keys are
+    (sku_region_pk, timestamp, superseded_by_id) tuples. Returns the number of failed updates.
+    """
+    failed = 0
+    for start in range(0, len(superseded_keys), PARTIQL_BATCH_LIMIT):
+        statements = [
+            {
+                'Statement': f'UPDATE "{table_name}" SET "status" = ? SET superseded_by = ? WHERE sku_region_pk = ? AND "timestamp" = ?',
+                'Parameters': [{'S': 'skipped'}, {'S': str(superseded_by)}, {'S': sku_region_pk}, {'S': timestamp}]
+            }
+            for sku_region_pk, timestamp, superseded_by in superseded_keys[start:start + PARTIQL_BATCH_LIMIT]
+        ]
+        response = dynamodb_client.batch_execute_statement(Statements=statements)
+        failures = [r['Error'] for r in response.get('Responses', []) if r.get('Error')]
+        if failures:
+            failed += len(failures)
+            print(f"WARN: {len(failures)} superseded recommendation status updates failed: {failures[0].get('Message')}")
+    return failed
@@ -0,0 +1,213 @@
+import bisect
+import os
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .rate_limiter import RateLimiter, parse_retry_after
+except ImportError:  # Deployed from the agent's own folder, where this is a top-level module
+    from rate_limiter import RateLimiter, parse_retry_after
+
+# Status codes worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# Status codes that mean the endpoint wants us to slow down
+THROTTLE_STATUS_CODES = frozenset({429, 503})
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is unbounded
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram. Percentiles are reported as the upper bound of
+    the bucket they fall in, so memory stays constant however many requests are made.
+    """
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+
+    def observe(self, latency_ms):
+        self.counts[bisect.bisect_left(self.bounds, latency_ms)] += 1
+        self.count += 1
+        self.total_ms += latency_ms
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return self.bounds[i] if i < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def snapshot(self):
+        buckets = {f"le_{bound}": count for bound, count in zip(self.bounds, self.counts)}
+        buckets['le_inf'] = self.counts[-1]
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total_ms / self.count, 1) if self.count else 0.0,
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'buckets': buckets,
+        }
+
+
+class HttpClient:
+    """
+    Shared HTTP client for downstream calls: one keep-alive Session with a connection pool,
+    (connect, read) timeouts on every request, and retries with full-jitter exponential
+    backoff on connection errors, timeouts and 429/5xx responses. Only use it for
+    idempotent requests (setting a price to a value is). With a rate_limiter, every attempt
+    first takes a token from its endpoint's bucket, and throttle responses (with their
+    Retry-After) slow down all workers sharing the client. Keeps per-endpoint metrics,
+    separating time spent waiting for the rate limiter from request latency.
+    """
+
+    def __init__(self, connect_timeout=3.05, read_timeout=10.0, max_retries=3, backoff_base=0.2,
+                 backoff_max=5.0, pool_size=20, rate_limiter=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = rate_limiter
+        self.session = requests.Session()
+        # Retries are handled here (with metrics), not by urllib3
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Builds a client configured by SYNC_HTTP_CONNECT_TIMEOUT, SYNC_HTTP_READ_TIMEOUT,
+        SYNC_HTTP_MAX_RETRIES, SYNC_HTTP_BACKOFF_BASE, SYNC_HTTP_BACKOFF_MAX and SYNC_HTTP_POOL_SIZE,
+        with a rate limiter configured by the SYNC_RATE_LIMIT* variables.
+        """
+        return cls(
+            connect_timeout=float(os.getenv("SYNC_HTTP_CONNECT_TIMEOUT", "3.05")),
+            read_timeout=float(os.getenv("SYNC_HTTP_READ_TIMEOUT", "10")),
+            max_retries=int(os.getenv("SYNC_HTTP_MAX_RETRIES", "3")),
+            backoff_base=float(os.getenv("SYNC_HTTP_BACKOFF_BASE", "0.2")),
+            backoff_max=float(os.getenv("SYNC_HTTP_BACKOFF_MAX", "5")),
+            pool_size=int(os.getenv("SYNC_HTTP_POOL_SIZE", "20")),
+            rate_limiter=RateLimiter.from_env(),
+        )
+
+    def _backoff_seconds(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _endpoint_metrics(self, endpoint):
+        return self._metrics.setdefault(endpoint, {
+            'requests': 0, 'retries': 0, 'errors': 0, 'status_codes': {},
+            'latency': LatencyHistogram(), 'queue_wait': LatencyHistogram()
+        })
+
+    def observe(self, endpoint, latency_ms, status_code=None, error=False, retried=False, queue_wait_ms=0.0):
+        with self._lock:
+            metrics = self._endpoint_metrics(endpoint)
+            metrics['queue_wait'].observe(queue_wait_ms)
+            metrics['requests'] += 1
+            metrics['retries'] += 1 if retried else 0
+            metrics['errors'] += 1 if error else 0
+            if status_code is not None:
+                metrics['status_codes'][status_code] = metrics['status_codes'].get(status_code, 0) + 1
+            metrics['latency'].observe(latency_ms)
+
+    def endpoint_bucket(self, url):
+        """
+        Returns (endpoint path, rate limiter bucket or None) for a URL.
+        """
+        endpoint = urlparse(url).path or url
+        return endpoint, self.rate_limiter.bucket(endpoint) if self.rate_limiter else None
+
+    def error_retry_delay(self, method, endpoint, attempt, error):
+        """
+        Returns the delay before retrying after a connection error or timeout, or None when
+        the attempts are used up.
+        """
+        if attempt >= self.max_retries:
+            return None
+        delay = self._backoff_seconds(attempt)
+        print(f"WARN: {method} {endpoint} failed ({error.__class__.__name__}); retry {attempt + 1}/{self.max_retries} in {delay:.2f} s.")
+        return delay
+
+    def response_retry_delay(self, method, endpoint, bucket, attempt, status_code, retry_after_header):
+        """
+        Feeds a response's status to the rate limiter and returns the delay before retrying,
+        or None when the response is final (success, non-retryable error or attempts used up).
+        """
+        retry_after = None
+        if status_code in THROTTLE_STATUS_CODES:
+            retry_after = parse_retry_after(retry_after_header)
+            if bucket:
+                bucket.throttled(retry_after)
+        elif bucket and status_code < 400:
+            bucket.succeeded()
+        if status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+            return None
+        # The shared bucket already holds every worker for Retry-After; otherwise wait here
+        delay = 0.0 if bucket and retry_after else max(self._backoff_seconds(attempt), retry_after or 0.0)
+        print(f"WARN: {method} {endpoint} returned {status_code}; retry {attempt + 1}/{self.max_retries} in {retry_after if retry_after else delay:.2f} s.")
+        return delay
+
+    def request(self, method, url, **kwargs):
+        """
+        Sends a request, retrying transient failures. Returns the last response (the caller
+        checks its status) or re-raises the last connection/timeout error.
+        """
+        endpoint, bucket = self.endpoint_bucket(url)
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.max_retries + 1):
+            queue_wait_ms = bucket.acquire() * 1000 if bucket else 0.0
+            started_at = time.time()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.observe(endpoint, (time.time() - started_at) * 1000, error=True, retried=attempt > 0, queue_wait_ms=queue_wait_ms)
+                delay = self.error_retry_delay(method, endpoint, attempt, e)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            self.observe(endpoint, (time.time() - started_at) * 1000, response.status_code,
+                         error=response.status_code >= 400, retried=attempt > 0, queue_wait_ms=queue_wait_ms)
+            delay = self.response_retry_delay(method, endpoint, bucket, attempt, response.status_code, response.headers.get('Retry-After'))
+            if delay is None:
+                return response
+            response.close()
+            time.sleep(delay)
+
+    def post_json(self, url, payload):
+        return self.request('POST', url, json=payload)
+
+    def get(self, url, params=None):
+        return self.request('GET', url, params=params)
+
+    def metrics(self):
+        """
+        Returns per-endpoint request, retry and error counts, status codes, request latency and
+        rate-limiter queue wait histograms, and the endpoint's rate limiter state.
+        """
+        rate_limits = self.rate_limiter.snapshot() if self.rate_limiter else {}
+        with self._lock:
+            return {
+                endpoint: dict(
+                    metrics, status_codes=dict(metrics['status_codes']), latency=metrics['latency'].snapshot(),
+                    queue_wait=metrics['queue_wait'].snapshot(), rate_limit=rate_limits.get(endpoint)
+                )
+                for endpoint, metrics in self._metrics.items()
+            }
@@ -0,0 +1,73 @@
+import threading
+
+# Prices closer than this are treated as equal (half a cent)
+PRICE_TOLERANCE = 0.005
+
+
+class PriceMirror:
+    """
+    Local copy of the storefront's current prices, kept across warm invocations. refresh()
+    pulls only the prices changed since the last cursor from the storefront's price feed;
+    successful pushes are recorded directly. is_unchanged() is only trusted after a
+    successful refresh, so a feed outage never causes a needed update to be skipped.
+    """
+
+    def __init__(self, fetch_page):
+        """
+        fetch_page(since) returns the feed page after cursor 'since' (None for a full load)
+        as a dict with 'prices' ([{'sku', 'price'}]), 'cursor' and optional 'has_more'.
+        """
+        self.fetch_page = fetch_page
+        self._lock = threading.Lock()
+        self._prices = {}
+        self._cursor = None
+        self.ready = False
+        self.stats = {'refreshes': 0, 'refreshed_prices': 0, 'unchanged_skips': 0}
+
+    def refresh(self):
+        """
+        Applies every feed page after the stored cursor. Returns the number of prices received,
+        or None (and marks the mirror not ready) if the feed could not be read.
+        """
+        received = 0
+        try:
+            while True:
+                page = self.fetch_page(self._cursor)
+                with self._lock:
+                    for entry in page.get('prices', []):
+                        self._prices[entry['sku']] = float(entry['price'])
+                    self._cursor = page.get('cursor', self._cursor)
+                received += len(page.get('prices', []))
+                if not page.get('has_more') or not page.get('prices'):
+                    break
+        except Exception as e:
+            print(f"WARN: Could not refresh the storefront price mirror; pushing every price this run: {e}")
+            self.ready = False
+            return None
+        with self._lock:
+            self.ready = True
+            self.stats['refreshes'] += 1
+            self.stats['refreshed_prices'] += received
+        return received
+
+    def is_unchanged(self, sku, price):
+        """
+        Returns True if the storefront is known to show price for sku already.
+        """
+        with self._lock:
+            current = self._prices.get(sku)
+            unchanged = self.ready and current is not None and abs(current - price) < PRICE_TOLERANCE
+            if unchanged:
+                self.stats['unchanged_skips'] += 1
+            return unchanged
+
+    def record(self, sku, price):
+        """
+        Records a price the storefront has accepted.
+        """
+        with self._lock:
+            self._prices[sku] = float(price)
+
+    def summary(self):
+        with self._lock:
+            return dict(self.stats, ready=self.ready, mirrored_skus=len(self._prices), cursor=self._cursor)
@@ -0,0 +1,179 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+# On a throttle response the rate is cut by this factor; each success wins back this share of the configured rate
+THROTTLE_DECREASE_FACTOR = 0.5
+RECOVERY_STEP_SHARE = 0.05
+
+
+def parse_retry_after(value):
+    """
+    Returns the delay in seconds from a Retry-After header (delta-seconds or HTTP date), or None.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every worker calling one endpoint: tokens refill at 'rate' per
+    second up to 'burst'. rate 0 means unlimited, but Retry-After pauses still apply.
+    Throttle responses halve the current rate and pause the bucket for Retry-After;
+    successes raise it back toward the configured rate (additive increase).
+    """
+
+    def __init__(self, rate, burst):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = max(1.0, float(burst))
+        self.min_rate = self.max_rate * 0.05
+        self._tokens = self.burst
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'acquired': 0, 'waited': 0, 'total_wait_ms': 0.0, 'max_wait_ms': 0.0, 'throttled': 0}
+
+    def _refill(self, now):
+        if self.rate:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def _try_take(self):
+        """
+        Takes a token if one is available. Returns 0 on success, otherwise the seconds to wait before trying again.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            if not self.rate:
+                return 0
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent. Returns the time spent waiting, in seconds.
+        """
+        started_at = time.monotonic()
+        wait = self._try_take()
+        while wait:
+            time.sleep(wait)
+            wait = self._try_take()
+        return self._record_wait(time.monotonic() - started_at)
+
+    async def acquire_async(self):
+        """
+        Like acquire(), but waits without blocking the event loop.
+        """
+        started_at = time.monotonic()
+        wait = self._try_take()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._try_take()
+        return self._record_wait(time.monotonic() - started_at)
+
+    def _record_wait(self, waited):
+        with self._lock:
+            self.stats['acquired'] += 1
+            if waited > 0.001:
+                self.stats['waited'] += 1
+                self.stats['total_wait_ms'] += waited * 1000
+                self.stats['max_wait_ms'] = max(self.stats['max_wait_ms'], waited * 1000)
+        return waited
+
+    def throttled(self, retry_after=None):
+        """
+        Records a 429/503 from the endpoint: slows the bucket down and, given Retry-After,
+        holds every worker until it has passed.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.stats['throttled'] += 1
+            if self.max_rate:
+                self.rate = max(self.min_rate, self.rate * THROTTLE_DECREASE_FACTOR)
+                self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def succeeded(self):
+        if not self.max_rate or self.rate >= self.max_rate:
+            return
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP_SHARE)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                total_wait_ms=round(self.stats['total_wait_ms'], 1),
+                max_wait_ms=round(self.stats['max_wait_ms'], 1),
+                configured_rate=self.max_rate or None,
+                current_rate=round(self.rate, 2) if self.max_rate else None,
+                burst=self.burst,
+            )
+
+
+class RateLimiter:
+    """
+    One TokenBucket per endpoint path, created on first use from the default rate/burst or a
+    per-endpoint override.
+    """
+
+    def __init__(self, default_rate=0.0, default_burst=10, overrides=None):
+        self.default_rate = default_rate
+        self.default_burst = default_burst
+        self.overrides = overrides or {}
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    @classmethod
+    def from_env(cls):
+        """
+        Configured by SYNC_RATE_LIMIT_RPS (0 = unlimited), SYNC_RATE_LIMIT_BURST and
+        SYNC_RATE_LIMITS, a JSON object of endpoint path -> {"rate": ..., "burst": ...}.
+        """
+        overrides = {}
+        raw = os.getenv("SYNC_RATE_LIMITS")
+        if raw:
+            try:
+                overrides = json.loads(raw)
+            except ValueError as e:
+                print(f"WARN: Ignoring invalid SYNC_RATE_LIMITS: {e}")
+        return cls(
+            default_rate=float(os.getenv("SYNC_RATE_LIMIT_RPS", "0")),
+            default_burst=float(os.getenv("SYNC_RATE_LIMIT_BURST", "10")),
+            overrides=overrides,
+        )
+
+    def bucket(self, endpoint):
+        with self._lock:
+            bucket = self._buckets.get(endpoint)
+            if bucket is None:
+                config = self.overrides.get(endpoint, {})
+                bucket = self._buckets[endpoint] = TokenBucket(
+                    config.get('rate', self.default_rate), config.get('burst', self.default_burst)
+                )
+            return bucket
+
+    def snapshot(self):
+        with self._lock:
+            buckets = dict(self._buckets)
+        return {endpoint: bucket.snapshot() for endpoint, bucket in buckets.items()}
@@ -0,0 +1,424 @@
+import json
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+RETRY_STATUS_PENDING = 'pending'
+RETRY_STATUS_IN_FLIGHT = 'in_flight'
+RETRY_STATUS_DONE = 'done'
+RETRY_STATUS_DEAD_LETTER = 'dead_letter'
+
+DEFAULT_SQLITE_PATH = os.path.join(tempfile.gettempdir(), 'price_sync_retries.sqlite3')
+
+# A claimed retry not settled within this many seconds (e.g. its drainer died) can be claimed again
+CLAIM_LEASE_SECONDS = 300
+
+
+def build_retry_entry(rec, sku_region_pk, sku, new_price):
+    """
+    Builds a retry queue entry for a price about to be synced. The queue holds at most one
+    entry per sku_region_pk, so a newer price replaces an older one; the recommendation ID is
+    the idempotency key the storefront uses to ignore repeated deliveries.
+    """
+    return {
+        'sku_region_pk': sku_region_pk,
+        'idempotency_key': str(rec.get('id') or f"{sku_region_pk}#{new_price}"),
+        'sku': sku,
+        'new_price': str(new_price),
+        'recommendation': {
+            'id': rec.get('id', 'N/A'),
+            'timestamp': rec.get('timestamp'),
+            'currentPrice': str(rec.get('currentPrice', 0.0)),
+        },
+        'status': RETRY_STATUS_PENDING,
+        'attempts': 0,
+        'next_attempt_at': 0,
+        'created_at': time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def new_claim_id():
+    return uuid.uuid4().hex
+
+
+def retry_backoff_seconds(attempts, base_seconds):
+    """
+    Exponential backoff with jitter after the given number of failed attempts.
+    """
+    return base_seconds * (2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+class SQLiteRetryQueue:
+    """
+    Durable retry queue in a local SQLite file, for local runs (and single-instance use).
+    Entries survive restarts; a background drainer in the same process retries them. A claimed
+    entry whose drainer dies is claimed again once its lease expires.
+    """
+    name = 'sqlite'
+
+    def __init__(self, path=DEFAULT_SQLITE_PATH, lease_seconds=CLAIM_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS price_sync_retries ("
+                " sku_region_pk TEXT PRIMARY KEY, idempotency_key TEXT NOT NULL, status TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL, next_attempt_at REAL NOT NULL, last_error TEXT, entry TEXT NOT NULL,"
+                " claimed_until REAL, claim_id TEXT)"
+            )
+            # Queue files written before claims had leases (and claim IDs) lack the columns
+            columns = {column[1] for column in conn.execute("PRAGMA table_info(price_sync_retries)")}
+            for column, column_type in (('claimed_until', 'REAL'), ('claim_id', 'TEXT')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE price_sync_retries ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS price_sync_retries_due ON price_sync_retries (status, next_attempt_at)")
+
+    @contextmanager
+    def _connect(self):
+        """
+        Yields a connection whose statements commit together (or roll back on error), then closes it.
+        """
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _row_to_entry(row):
+        entry = json.loads(row[6])
+        entry.update(status=row[2], attempts=row[3], next_attempt_at=row[4], last_error=row[5])
+        return entry
+
+    def claim(self, limit, now=None):
+        """
+        Claims up to limit due pending entries, or in-flight entries whose lease has expired.
+        """
+        now = now or time.time()
+        claimed_until = now + self.lease_seconds
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM price_sync_retries WHERE (status = ? AND next_attempt_at <= ?)"
+                " OR (status = ? AND COALESCE(claimed_until, 0) <= ?) ORDER BY next_attempt_at LIMIT ?",
+                (RETRY_STATUS_PENDING, now, RETRY_STATUS_IN_FLIGHT, now, limit)
+            ).fetchall()
+            claimed = [
+                dict(self._row_to_entry(row), status=RETRY_STATUS_IN_FLIGHT, claimed_until=claimed_until, claim_id=new_claim_id())
+                for row in rows
+            ]
+            conn.executemany(
+                "UPDATE price_sync_retries SET status = ?, claimed_until = ?, claim_id = ? WHERE sku_region_pk = ?",
+                [(RETRY_STATUS_IN_FLIGHT, claimed_until, entry['claim_id'], entry['sku_region_pk']) for entry in claimed]
+            )
+        return claimed
+
+    def claim_keys(self, entries, now=None):
+        """
+        Claims the SKUs of entries (built with build_retry_entry) before a sync pushes them,
+        replacing any older entry queued for the SKU. Returns (claimed, handed_off): a SKU whose
+        entry a drainer holds is not claimed; its newer price replaces the held entry instead,
+        and the drainer re-queues it once its own push finishes.
+        """
+        now = now or time.time()
+        claimed_until = now + self.lease_seconds
+        claimed = []
+        handed_off = []
+        with self._lock, self._connect() as conn:
+            for entry in entries:
+                held = conn.execute(
+                    "SELECT 1 FROM price_sync_retries WHERE sku_region_pk = ? AND status = ? AND COALESCE(claimed_until, 0) > ?",
+                    (entry['sku_region_pk'], RETRY_STATUS_IN_FLIGHT, now)
+                ).fetchone()
+                if held:
+                    conn.execute(
+                        "UPDATE price_sync_retries SET idempotency_key = ?, attempts = 0, last_error = NULL, entry = ? WHERE sku_region_pk = ?",
+                        (entry['idempotency_key'], json.dumps(entry), entry['sku_region_pk'])
+                    )
+                    handed_off.append(entry)
+                    continue
+                entry = dict(entry, status=RETRY_STATUS_IN_FLIGHT, claimed_until=claimed_until, claim_id=new_claim_id())
+                conn.execute(
+                    "INSERT OR REPLACE INTO price_sync_retries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (entry['sku_region_pk'], entry['idempotency_key'], RETRY_STATUS_IN_FLIGHT, 0, 0, None,
+                     json.dumps(entry), claimed_until, entry['claim_id'])
+                )
+                claimed.append(entry)
+        return claimed, handed_off
+
+    def _settle(self, conn, entry, assignments, values):
+        """
+        Applies assignments to a claimed entry if its claim still holds and its price is the one
+        pushed. If a sync handed the claim a newer price meanwhile, the entry goes back to pending
+        instead, due right away. Returns True if the entry was settled as asked.
+        """
+        if conn.execute(
+                f"UPDATE price_sync_retries SET {assignments} WHERE sku_region_pk = ? AND claim_id = ? AND idempotency_key = ? AND status = ?",
+                list(values) + [entry['sku_region_pk'], entry['claim_id'], entry['idempotency_key'], RETRY_STATUS_IN_FLIGHT]
+        ).rowcount:
+            return True
+        conn.execute(
+            "UPDATE price_sync_retries SET status = ?, next_attempt_at = 0 WHERE sku_region_pk = ? AND claim_id = ? AND status = ?",
+            (RETRY_STATUS_PENDING, entry['sku_region_pk'], entry['claim_id'], RETRY_STATUS_IN_FLIGHT)
+        )
+        return False
+
+    def mark_done(self, entries):
+        """
+        Marks pushed entries done. Returns how many were re-queued with a newer price instead.
+        """
+        with self._lock, self._connect() as conn:
+            return sum(0 if self._settle(conn, entry, "status = ?", [RETRY_STATUS_DONE]) else 1 for entry in entries)
+
+    def reschedule(self, entry, status, attempts, next_attempt_at, error):
+        with self._lock, self._connect() as conn:
+            return self._settle(conn, entry, "status = ?, attempts = ?, next_attempt_at = ?, last_error = ?",
+                         [status, attempts, next_attempt_at, error])
+
+    def next_due_at(self):
+        """
+        Returns when the earliest pending entry becomes due (or in-flight lease expires), or None.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(CASE WHEN status = ? THEN next_attempt_at ELSE COALESCE(claimed_until, 0) END)"
+                " FROM price_sync_retries WHERE status IN (?, ?)",
+                (RETRY_STATUS_PENDING, RETRY_STATUS_PENDING, RETRY_STATUS_IN_FLIGHT)
+            ).fetchone()
+        return row[0] if row and row[0] is not None else None
+
+    def counts(self):
+        with self._lock, self._connect() as conn:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM price_sync_retries GROUP BY status").fetchall())
+
+
+class DynamoDBRetryQueue:
+    """
+    Retry queue backed by a DynamoDB table (partition key 'sku_region_pk'), drained by
+    scheduled 'drain_retries' invocations of the agent. Claims are conditional updates, so
+    concurrent drainers never push the same retry twice, and settling a claim is conditioned
+    on its claim ID and idempotency key, so a newer price for a SKU is never overwritten by an
+    older attempt. A claimed entry whose drainer dies is claimed again once its lease expires.
+    """
+    name = 'dynamodb'
+
+    def __init__(self, table, lease_seconds=CLAIM_LEASE_SECONDS):
+        self.table = table
+        self.lease_seconds = lease_seconds
+
+    def _scan(self, filter_expression, **kwargs):
+        scan_kwargs = dict(kwargs, FilterExpression=filter_expression)
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _update_if(self, sku_region_pk, update_expression, condition, values):
+        """
+        Updates one entry if condition holds. Returns False when it does not (or the entry is gone).
+        """
+        try:
+            self.table.update_item(
+                Key={'sku_region_pk': sku_region_pk},
+                UpdateExpression=update_expression,
+                ConditionExpression=condition,
+                ExpressionAttributeNames={'#s': 'status'},
+                ExpressionAttributeValues=values
+            )
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            return False
+
+    def claim(self, limit, now=None):
+        """
+        Claims up to limit due pending entries, or in-flight entries whose lease has expired.
+        """
+        now = int(now or time.time())
+        claimed_until = now + int(self.lease_seconds)
+        claimed = []
+        due = (
+            (Attr('status').eq(RETRY_STATUS_PENDING) & Attr('next_attempt_at').lte(now))
+            | (Attr('status').eq(RETRY_STATUS_IN_FLIGHT) & Attr('claimed_until').lte(now))
+        )
+        for entry in self._scan(due):
+            if len(claimed) >= limit:
+                break
+            claim_id = new_claim_id()
+            # Fails if another drainer claimed the entry (or a newer one replaced it) since the scan
+            if not self._update_if(
+                    entry['sku_region_pk'],
+                    "SET #s = :in_flight, claimed_until = :claimed_until, claim_id = :claim_id",
+                    "idempotency_key = :key AND ((#s = :pending AND next_attempt_at <= :now)"
+                    " OR (#s = :in_flight AND claimed_until <= :now))",
+                    {':key': entry['idempotency_key'], ':pending': RETRY_STATUS_PENDING, ':in_flight': RETRY_STATUS_IN_FLIGHT,
+                     ':now': now, ':claimed_until': claimed_until, ':claim_id': claim_id}):
+                continue
+            claimed.append(dict(entry, new_price=str(entry['new_price']), status=RETRY_STATUS_IN_FLIGHT,
+                                claimed_until=claimed_until, claim_id=claim_id))
+        return claimed
+
+    def claim_keys(self, entries, now=None):
+        """
+        Claims the SKUs of entries (built with build_retry_entry) before a sync pushes them,
+        replacing any older entry queued for the SKU. Returns (claimed, handed_off): a SKU whose
+        entry a drainer holds is not claimed; its newer price replaces the held entry instead,
+        and the drainer re-queues it once its own push finishes.
+        """
+        now = int(now or time.time())
+        claimed_until = now + int(self.lease_seconds)
+        claimed = []
+        handed_off = []
+        for entry in entries:
+            claimed_entry = dict(entry, status=RETRY_STATUS_IN_FLIGHT, claimed_until=claimed_until, claim_id=new_claim_id())
+            # Either the put or the hand-off succeeds unless a claim starts or ends in between; then try again
+            while True:
+                try:
+                    self.table.put_item(
+                        Item=dict(claimed_entry, new_price=Decimal(entry['new_price'])),
+                        ConditionExpression="attribute_not_exists(sku_region_pk) OR #s <> :in_flight OR claimed_until <= :now",
+                        ExpressionAttributeNames={'#s': 'status'},
+                        ExpressionAttributeValues={':in_flight': RETRY_STATUS_IN_FLIGHT, ':now': now}
+                    )
+                    claimed.append(claimed_entry)
+                    break
+                except ClientError as e:
+                    if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                        raise
+                if self._update_if(
+                        entry['sku_region_pk'],
+                        "SET idempotency_key = :key, sku = :sku, new_price = :price, recommendation = :rec, attempts = :zero"
+                        " REMOVE last_error",
+                        "#s = :in_flight AND claimed_until > :now",
+                        {':key': entry['idempotency_key'], ':sku': entry['sku'], ':price': Decimal(entry['new_price']),
+                         ':rec': entry['recommendation'], ':zero': 0, ':in_flight': RETRY_STATUS_IN_FLIGHT, ':now': now}):
+                    handed_off.append(entry)
+                    break
+        return claimed, handed_off
+
+    def _settle(self, entry, update_expression, values):
+        """
+        Applies update_expression to a claimed entry if its claim still holds and its price is
+        the one pushed. If a sync handed the claim a newer price meanwhile, the entry goes back
+        to pending instead, due right away. Returns True if the entry was settled as asked.
+        """
+        claim_values = {':claim_id': entry['claim_id'], ':in_flight': RETRY_STATUS_IN_FLIGHT}
+        if self._update_if(entry['sku_region_pk'], update_expression,
+                           "claim_id = :claim_id AND idempotency_key = :key AND #s = :in_flight",
+                           dict(values, **claim_values, **{':key': entry['idempotency_key']})):
+            return True
+        self._update_if(entry['sku_region_pk'], "SET #s = :pending, next_attempt_at = :zero",
+                        "claim_id = :claim_id AND #s = :in_flight",
+                        dict(claim_values, **{':pending': RETRY_STATUS_PENDING, ':zero': 0}))
+        return False
+
+    def mark_done(self, entries):
+        """
+        Marks pushed entries done. Returns how many were re-queued with a newer price instead.
+        """
+        return sum(0 if self._settle(entry, "SET #s = :done", {':done': RETRY_STATUS_DONE}) else 1 for entry in entries)
+
+    def reschedule(self, entry, status, attempts, next_attempt_at, error):
+        return self._settle(
+            entry, "SET #s = :status, attempts = :attempts, next_attempt_at = :next_attempt_at, last_error = :error",
+            {':status': status, ':attempts': attempts, ':next_attempt_at': int(next_attempt_at), ':error': error}
+        )
+
+    def next_due_at(self):
+        due = [
+            float(item['next_attempt_at'] if item['status'] == RETRY_STATUS_PENDING else item.get('claimed_until', 0))
+            for item in self._scan(
+                Attr('status').is_in([RETRY_STATUS_PENDING, RETRY_STATUS_IN_FLIGHT]),
+                ProjectionExpression='#s, next_attempt_at, claimed_until', ExpressionAttributeNames={'#s': 'status'}
+            )
+        ]
+        return min(due) if due else None
+
+    def counts(self):
+        counts = {}
+        for item in self._scan(Attr('status').exists(), ProjectionExpression='#s', ExpressionAttributeNames={'#s': 'status'}):
+            counts[item['status']] = counts.get(item['status'], 0) + 1
+        return counts
+
+
+class RetryDrainer:
+    """
+    Retries queued price updates. sync_entries(entries) pushes a list of claimed entries and
+    returns a dict of sku_region_pk -> error (None on success). Failed retries back off
+    exponentially and are dead-lettered after max_attempts. A claim is held from before the
+    push until it is settled; a sync that sees the claim hands its newer price over instead of
+    pushing, and settling then re-queues that price, so it always lands after the older one.
+    """
+
+    def __init__(self, queue, sync_entries, max_attempts=5, base_backoff_seconds=5.0, claim_size=100):
+        self.queue = queue
+        self.sync_entries = sync_entries
+        self.max_attempts = max_attempts
+        self.base_backoff_seconds = base_backoff_seconds
+        self.claim_size = claim_size
+
+    def _handle_failure(self, entry, error):
+        attempts = int(entry.get('attempts', 0)) + 1
+        if attempts >= self.max_attempts:
+            if not self.queue.reschedule(entry, RETRY_STATUS_DEAD_LETTER, attempts, 0, error):
+                return False
+            print(f"ERROR: Price update for SKU {entry['sku_region_pk']} moved to dead letter after {attempts} attempts: {error}")
+            return True
+        self.queue.reschedule(entry, RETRY_STATUS_PENDING, attempts,
+                              time.time() + retry_backoff_seconds(attempts, self.base_backoff_seconds), error)
+        return False
+
+    def drain(self, max_seconds=60.0, wait_for_retries=True):
+        """
+        Retries due entries until the queue has none left or max_seconds elapse. With
+        wait_for_retries, sleeps until backed-off entries become due. Returns retry counts.
+        """
+        started_at = time.time()
+        stats = {'retried': 0, 'succeeded': 0, 'failed_attempts': 0, 'dead_lettered': 0, 'superseded': 0}
+        while time.time() - started_at < max_seconds:
+            claimed = self.queue.claim(self.claim_size)
+            if not claimed:
+                next_due_at = self.queue.next_due_at() if wait_for_retries else None
+                if next_due_at is None or next_due_at - started_at > max_seconds:
+                    break
+                time.sleep(min(max(next_due_at - time.time(), 0.05), 1.0))
+                continue
+
+            try:
+                errors = self.sync_entries(claimed)
+            except Exception as e:
+                errors = {entry['sku_region_pk']: str(e) for entry in claimed}
+            stats['retried'] += len(claimed)
+            succeeded = [entry for entry in claimed if errors.get(entry['sku_region_pk']) is None]
+            if succeeded:
+                stats['superseded'] += self.queue.mark_done(succeeded)
+                stats['succeeded'] += len(succeeded)
+            for entry in claimed:
+                if errors.get(entry['sku_region_pk']) is not None:
+                    stats['failed_attempts'] += 1
+                    stats['dead_lettered'] += 1 if self._handle_failure(entry, errors[entry['sku_region_pk']]) else 0
+
+        stats['duration_ms'] = round((time.time() - started_at) * 1000, 1)
+        print(f"Retry drainer pushed {stats['succeeded']} of {stats['retried']} queued price updates in {stats['duration_ms']} ms ({stats['dead_lettered']} dead-lettered, {stats['superseded']} re-queued with a newer price).")
+        return stats
+
+    def start_background_drain(self, max_seconds=300.0):
+        """
+        Drains the queue on a daemon thread so the caller can return immediately.
+        """
+        thread = threading.Thread(target=self.drain, kwargs={'max_seconds': max_seconds}, daemon=True, name='price-sync-retry-drain')
+        thread.start()
+        return thread
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def run_partitioned(items, handle, max_in_flight, key_fn=None):
+    """
+    Calls handle(item) for every item with at most max_in_flight calls running at once.
+    Items with the same key_fn(item) run one after another in input order, so updates to
+    one SKU never race; different keys run in parallel. Without key_fn every item is
+    independent. Returns the results in input order; an exception from handle is re-raised.
+    """
+    groups = OrderedDict()
+    for position, item in enumerate(items):
+        groups.setdefault(key_fn(item) if key_fn else position, []).append(position)
+    results = [None] * len(items)
+
+    def run_group(positions):
+        for position in positions:
+            results[position] = handle(items[position])
+
+    if max_in_flight <= 1 or len(groups) <= 1:
+        for positions in groups.values():
+            run_group(positions)
+        return results
+
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(groups))) as pool:
+        futures = [pool.submit(run_group, positions) for positions in groups.values()]
+        for future in futures:
+            future.result()
+    return results
+
+
+def occurrence_waves(items, key_fn):
+    """
+    Splits items into waves where each key appears at most once per wave: the first
+    occurrence of every key goes in wave 0, the second in wave 1, and so on. Running the
+    waves in order (and anything inside a wave concurrently) keeps per-key ordering.
+    """
+    waves = []
+    seen = {}
+    for item in items:
+        key = key_fn(item)
+        rank = seen.get(key, 0)
+        seen[key] = rank + 1
+        if rank == len(waves):
+            waves.append([])
+        waves[rank].append(item)
+    return waves
@@ -0,0 +1,88 @@
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+# TransactWriteItems accepts at most 100 actions; each synced SKU needs two
+TRANSACT_ITEM_LIMIT = 100
+ACTIONS_PER_SKU = 2
+MAX_SKUS_PER_TRANSACTION = TRANSACT_ITEM_LIMIT // ACTIONS_PER_SKU
+
+_serializer = TypeSerializer()
+
+
+def price_sync_actions(inventory_table_name, log_table_name, sku_region_pk, new_price, log_item):
+    """
+    Returns the two TransactWriteItems actions that record one SKU's price sync:
+    the inventory price update and the price sync log entry. new_price is a Decimal.
+    """
+    return [
+        {
+            'Update': {
+                'TableName': inventory_table_name,
+                'Key': {'sku_region_pk': {'S': sku_region_pk}},
+                'UpdateExpression': "SET current_stock = :price, last_updated = :ts",
+                'ExpressionAttributeValues': {
+                    ':price': _serializer.serialize(new_price),
+                    ':ts': {'S': log_item['timestamp']},
+                },
+            }
+        },
+        {
+            'Put': {
+                'TableName': log_table_name,
+                'Item': {name: _serializer.serialize(value) for name, value in log_item.items()},
+            }
+        },
+    ]
+
+
+def _cancelled_records(error_response, records):
+    """
+    Returns the positions of records whose actions a cancelled transaction reported as failing.
+    """
+    reasons = error_response.get('CancellationReasons') or []
+    culprits = set()
+    offset = 0
+    for position, (_, actions) in enumerate(records):
+        if any(reason.get('Code') not in (None, 'None') for reason in reasons[offset:offset + len(actions)]):
+            culprits.add(position)
+        offset += len(actions)
+    return culprits
+
+
+def _transact(dynamodb_client, records, errors):
+    try:
+        dynamodb_client.transact_write_items(TransactItems=[action for _, actions in records for action in actions])
+        for key, _ in records:
+            errors[key] = None
+        return
+    except ClientError as e:
+        error = e.response.get('Error', {})
+        message = f"{error.get('Code')}: {error.get('Message')}"
+        if len(records) == 1:
+            reasons = [reason for reason in e.response.get('CancellationReasons') or [] if reason.get('Code') not in (None, 'None')]
+            errors[records[0][0]] = f"{message} ({reasons[0]['Code']})" if reasons else message
+            return
+        culprits = _cancelled_records(e.response, records)
+
+    print(f"WARN: Transaction of {len(records)} price syncs failed ({message}); retrying {len(culprits) or 'all'} record(s) on their own.")
+    if culprits and len(culprits) < len(records):
+        # The rest did nothing wrong; write them together without the failing records
+        _transact(dynamodb_client, [record for position, record in enumerate(records) if position not in culprits], errors)
+        retry = [records[position] for position in sorted(culprits)]
+    else:
+        retry = records
+    for record in retry:
+        _transact(dynamodb_client, [record], errors)
+
+
+def transact_price_syncs(dynamodb_client, records):
+    """
+    Writes records, a list of (key, actions) with at most MAX_SKUS_PER_TRANSACTION entries,
+    in one TransactWriteItems call, so each record's actions apply together or not at all.
+    If the transaction is cancelled, the records it reports as failing are retried on their
+    own and the others are written without them; if no record is singled out, every record
+    is retried in its own transaction. Returns a dict of key -> None on success, or the error.
+    """
+    errors = {}
+    _transact(dynamodb_client, records, errors)
+    return errors
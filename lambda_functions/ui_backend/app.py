@@ -21,6 +21,40 @@ stepfunctions_client = boto3.client('stepfunctions', region_name=os.getenv("AWS_
 step_functions_state_machine_arn = os.getenv("STEP_FUNCTIONS_STATE_MACHINE_ARN", "arn:aws:states:us-east-1:123456789012:stateMachine:RetailPricingOptimizationWorkflow")
 
 
+def _format_sse(data, event_name=None):
+    """
+    Formats a single Server-Sent Events frame with a JSON payload.
+    """
+    frame = f"event: {event_name}\n" if event_name else ""
+    return frame + f"data: {json.dumps(data)}\n\n"
+
+
+def stream_promo_idea(event):
+    """
+    Generates a promotion idea and yields it as Server-Sent Events while Bedrock streams tokens.
+    Emits one 'data' frame per text chunk, then a 'done' frame, or an 'error' frame on failure.
+    Called directly by main.py so tokens reach the browser as soon as they are produced.
+    """
+    try:
+        request_body = json.loads(event.get('body') or '{}')
+        prompt = request_body.get('prompt', 'Generate a general promotion idea.')
+
+        # Note: This is a direct import for local testing. In AWS, this would be a separate Lambda call.
+        from lambda_functions.promotion_strategy_agent.app import _invoke_bedrock_model_stream
+        print(f"DEBUG: Streaming Bedrock model via _invoke_bedrock_model_stream with prompt: {prompt[:50]}...")
+        for text in _invoke_bedrock_model_stream(prompt):
+            yield _format_sse({'text': text})
+        yield _format_sse({'status': 'complete'}, event_name='done')
+    except ClientError as e:
+        print(f"ERROR: Bedrock Client Error streaming promo idea: {e.response['Error']['Message']}")
+        yield _format_sse({'message': f"Error generating promo idea: {e.response['Error']['Message']}"}, event_name='error')
+    except Exception as e:
+        import traceback
+        print(f"ERROR: Error streaming promo idea: {e}")
+        print(traceback.format_exc())
+        yield _format_sse({'message': f'Error generating promo idea: {str(e)}'}, event_name='error')
+
+
 def lambda_handler(event, context):
     """
     Lambda function acting as the UI backend API.
@@ -224,6 +258,17 @@ def lambda_handler(event, context):
                 'body': json.dumps({'message': f'Error generating promo idea: {str(e)}'})
             }
     
+    # Streaming variant of the promo idea generator.
+    # API Gateway (REST) cannot relay a stream, so here the SSE frames are buffered into one body;
+    # main.py serves this path with a true streaming response instead.
+    elif path == '/api/generate-promo-idea/stream' and http_method == 'POST':
+        sse_headers = dict(cors_headers, **{'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        return {
+            'statusCode': 200,
+            'headers': sse_headers,
+            'body': "".join(stream_promo_idea(event))
+        }
+    
     # Handle applying a recommendation (update status in DynamoDB)
     # This path is hit when the main.py /apply-recommendation route calls this handler.
     elif path == '/api/apply-recommendation' and http_method == 'POST':
@@ -278,7 +323,7 @@ def lambda_handler(event, context):
 
             # --- FIX: Robust check for sync_results ---
             # Check if sync_results is not empty AND if the first item's status is 'success'
-            if sync_response['statusCode'] == 200 and sync_result_body.get('sync_results') and len(sync_result_body['sync_results']) > 0 and sync_result_body['sync_results'][0]['status'] == 'success':
+            if sync_response['statusCode'] == 200 and sync_result_body.get('sync_results') and len(sync_result_body['sync_results']) > 0 and sync_result_body['sync_results'][0]['status'] in ('success', 'unchanged'):
                 return {
                     'statusCode': 200,
                     'headers': cors_headers,
@@ -1,7 +1,9 @@
 import os
 import json
+import random
+import threading
 import time
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from dotenv import load_dotenv
 from flask_cors import CORS # Ensure this is installed: pip install Flask-Cors
 
@@ -29,10 +31,10 @@ print(f"DEBUG: SNS_PROMOTION_TOPIC_ARN from .env: {os.getenv('SNS_PROMOTION_TOPI
 # In this local simulation, these are treated as local Python modules.
 # In a real AWS deployment, these would be actual Lambda functions invoked by Step Functions or API Gateway.
 from lambda_functions.market_data_ingestor.app import lambda_handler as market_data_ingestor_handler
-from lambda_functions.demand_forecast_agent.app import lambda_handler as demand_forecast_agent_handler
-from lambda_functions.promotion_strategy_agent.app import lambda_handler as promotion_strategy_agent_handler
+from lambda_functions.demand_forecast_agent.app import lambda_handler as demand_forecast_agent_handler, generate_forecasts
+from lambda_functions.promotion_strategy_agent.app import lambda_handler as promotion_strategy_agent_handler, run_pipelined_strategy
 from lambda_functions.real_time_price_sync_agent.app import lambda_handler as real_time_price_sync_agent_handler
-from lambda_functions.ui_backend.app import lambda_handler as ui_backend_handler
+from lambda_functions.ui_backend.app import lambda_handler as ui_backend_handler, stream_promo_idea
 
 # Initialize the Flask application
 app = Flask(__name__)
@@ -54,6 +56,33 @@ mock_ecommerce_products = {
     "P004": {"name": "Smart Home Security Camera", "current_price": 129.99},
     "P005": {"name": "Ergonomic Office Chair", "current_price": 499.99}
 }
+# Every price change gets the next version, so clients can fetch only what changed since a cursor
+for version, mock_product in enumerate(mock_ecommerce_products.values(), start=1):
+    mock_product['version'] = version
+mock_price_version = len(mock_ecommerce_products)
+mock_price_lock = threading.Lock()
+
+def _set_mock_price(sku, new_price):
+    global mock_price_version
+    with mock_price_lock:
+        mock_price_version += 1
+        mock_ecommerce_products[sku]['current_price'] = new_price
+        mock_ecommerce_products[sku]['version'] = mock_price_version
+
+# Fault injection for the mock price update endpoints (used by run_price_sync_benchmark.py):
+# fixed latency in ms added to every request, and the share of requests answered with a 503
+MOCK_ECOMMERCE_LATENCY_MS = float(os.getenv('MOCK_ECOMMERCE_LATENCY_MS', '0'))
+MOCK_ECOMMERCE_ERROR_RATE = float(os.getenv('MOCK_ECOMMERCE_ERROR_RATE', '0'))
+
+def _inject_mock_faults():
+    """
+    Applies the configured latency and returns a 503 response for the configured share of requests, else None.
+    """
+    if MOCK_ECOMMERCE_LATENCY_MS:
+        time.sleep(MOCK_ECOMMERCE_LATENCY_MS / 1000.0)
+    if MOCK_ECOMMERCE_ERROR_RATE and random.random() < MOCK_ECOMMERCE_ERROR_RATE:
+        return jsonify({"status": "error", "message": "Injected failure"}), 503
+    return None
 
 @app.route('/mock-api/update_price', methods=['POST'])
 def mock_update_price():
@@ -61,16 +90,62 @@ def mock_update_price():
     Simulates an external e-commerce API endpoint for updating product prices.
     This endpoint is called by the RealTimePriceSyncAgent.
     """
+    fault = _inject_mock_faults()
+    if fault:
+        return fault
     data = request.json
     sku = data.get('sku')
     new_price = data.get('new_price')
     if sku in mock_ecommerce_products:
         old_price = mock_ecommerce_products[sku]['current_price']
-        mock_ecommerce_products[sku]['current_price'] = new_price
+        _set_mock_price(sku, new_price)
         print(f"MOCK E-COMMERCE: Updated SKU {sku} price from {old_price} to {new_price}")
         return jsonify({"status": "success", "message": f"Price for {sku} updated to {new_price}"}), 200
     return jsonify({"status": "error", "message": f"SKU {sku} not found"}), 404
 
+@app.route('/mock-api/update_prices', methods=['POST'])
+def mock_update_prices():
+    """
+    Simulates a bulk price update endpoint: {"updates": [{"sku": ..., "new_price": ...}, ...]}.
+    Returns one result per update, so a chunk of SKUs is synced in a single request.
+    """
+    fault = _inject_mock_faults()
+    if fault:
+        return fault
+    updates = (request.json or {}).get('updates', [])
+    results = []
+    for update in updates:
+        sku = update.get('sku')
+        new_price = update.get('new_price')
+        if sku in mock_ecommerce_products:
+            _set_mock_price(sku, new_price)
+            results.append({"sku": sku, "status": "success", "new_price": new_price})
+        else:
+            results.append({"sku": sku, "status": "error", "message": f"SKU {sku} not found"})
+    print(f"MOCK E-COMMERCE: Bulk update of {len(updates)} SKUs ({sum(1 for r in results if r['status'] == 'success')} updated)")
+    return jsonify({"results": results}), 200
+
+@app.route('/mock-api/prices', methods=['GET'])
+def mock_list_prices():
+    """
+    Simulates the storefront's price feed. Returns current prices changed after the 'since'
+    cursor (all prices without one), at most 'limit' per page, plus the cursor to pass next time.
+    """
+    since = request.args.get('since', default=0, type=int)
+    limit = request.args.get('limit', default=1000, type=int)
+    with mock_price_lock:
+        changed = sorted(
+            (product['version'], sku, product['current_price'])
+            for sku, product in mock_ecommerce_products.items() if product['version'] > since
+        )
+    page = changed[:limit]
+    cursor = page[-1][0] if page else since
+    return jsonify({
+        "prices": [{"sku": sku, "price": price} for _, sku, price in page],
+        "cursor": str(cursor),
+        "has_more": len(changed) > limit
+    }), 200
+
 @app.route('/mock-api/activate_promo', methods=['POST'])
 def mock_activate_promo():
     """
@@ -99,6 +174,26 @@ def get_mock_market_data():
         print(f"ERROR: Failed to serve mock market data: {e}")
         return jsonify({"error": "Failed to load mock market data"}), 500
 
+# --- Streaming Route for AI Promo Generation ---
+# Registered before the generic /api/ route; Flask matches this static path first.
+@app.route('/api/generate-promo-idea/stream', methods=['POST'])
+def stream_promo_idea_route():
+    """
+    Relays Bedrock tokens to the frontend as Server-Sent Events while they are generated,
+    instead of waiting for the full completion like /api/generate-promo-idea.
+    """
+    event = {
+        'path': '/api/generate-promo-idea/stream',
+        'httpMethod': 'POST',
+        'body': request.data.decode('utf-8') if request.data else None
+    }
+    print(f"UI Backend triggered: POST /api/generate-promo-idea/stream (streaming via main.py)")
+    return Response(
+        stream_with_context(stream_promo_idea(event)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # --- Local API Gateway Simulation (for UI Backend and other direct UI calls) ---
 # This route catches all requests starting with /api/ and passes them to the ui_backend_handler.
 @app.route('/api/<path:subpath>', methods=['GET', 'POST'])
@@ -173,6 +268,20 @@ def handle_apply_recommendation_options():
     print("DEBUG: Handled OPTIONS for /apply-recommendation with 200 OK.")
     return response, 200
 
+# --- Price Sync Retry Queue Drain ---
+# Retries queued storefront updates now; mirrors the scheduled 'drain_retries' invocation in AWS.
+@app.route('/trigger-sync-retry-drain', methods=['POST'])
+def trigger_sync_retry_drain():
+    drain_response = real_time_price_sync_agent_handler({'mode': 'drain_retries', **(request.get_json(silent=True) or {})}, {})
+    return jsonify(json.loads(drain_response['body'])), drain_response['statusCode']
+
+# --- Customer Alert Outbox Drain ---
+# Delivers queued promotion alerts; mirrors the scheduled 'drain_alerts' invocation in AWS.
+@app.route('/trigger-alert-drain', methods=['POST'])
+def trigger_alert_drain():
+    drain_response = promotion_strategy_agent_handler({'mode': 'drain_alerts', **(request.get_json(silent=True) or {})}, {})
+    return jsonify(json.loads(drain_response['body'])), drain_response['statusCode']
+
 # --- Local Agent Orchestration (Simulated Step Functions Workflow) ---
 # This route triggers the entire pipeline of agents sequentially.
 @app.route('/trigger-full-agent-run', methods=['POST'])
@@ -180,8 +289,11 @@ def trigger_full_agent_run():
     """
     Simulates a full workflow run of all agents, mimicking a Step Functions execution.
     Each agent's lambda_handler is called directly in sequence.
+    With ?mode=pipelined (or AGENT_PIPELINE_MODE=pipelined), forecasts stream straight
+    into strategy workers through a bounded queue instead of running stage by stage.
     """
-    print("\n--- Triggering Full Agent Workflow (Simulated) ---")
+    pipeline_mode = request.args.get('mode') or os.getenv('AGENT_PIPELINE_MODE', 'sequential')
+    print(f"\n--- Triggering Full Agent Workflow (Simulated, {pipeline_mode}) ---")
     
     # 1. Market Data Ingestor Agent
     print("\n[Agent 1/4] Running Market Data Ingestor Agent...")
@@ -189,18 +301,34 @@ def trigger_full_agent_run():
     ingestor_response = market_data_ingestor_handler({}, {})
     print(f"Ingestor result: {ingestor_response['statusCode']}")
 
-    # 2. Demand Forecast Agent
-    print("\n[Agent 2/4] Running Demand Forecast Agent...")
-    # This agent scans DynamoDB tables itself; no input needed from previous agent.
-    forecast_response = demand_forecast_agent_handler({}, {})
-    print(f"Forecast result: {forecast_response['statusCode']}")
+    if pipeline_mode == 'pipelined':
+        # 2+3. Demand Forecast and Promotion Strategy Agents, overlapped
+        print("\n[Agents 2-3/4] Running Demand Forecast and Promotion Strategy Agents (pipelined)...")
+        # Each forecast is handed to a strategy worker as soon as it is produced; no forecasts table re-scan.
+        strategy_response = run_pipelined_strategy(generate_forecasts())
+    else:
+        # 2. Demand Forecast Agent
+        print("\n[Agent 2/4] Running Demand Forecast Agent...")
+        # This agent scans DynamoDB tables itself; no input needed from previous agent.
+        forecast_response = demand_forecast_agent_handler({}, {})
+        print(f"Forecast result: {forecast_response['statusCode']}")
 
-    # 3. Promotion Strategy Agent
-    print("\n[Agent 3/4] Running Promotion Strategy Agent...")
-    # This agent scans DynamoDB tables itself; no input needed from previous agent.
-    strategy_response = promotion_strategy_agent_handler({}, {})
+        # 3. Promotion Strategy Agent
+        print("\n[Agent 3/4] Running Promotion Strategy Agent...")
+        # This agent scans DynamoDB tables itself; no input needed from previous agent.
+        strategy_response = promotion_strategy_agent_handler({}, {})
     pricing_recommendations = json.loads(strategy_response['body']).get('pricing_recommendations', [])
     promotion_ideas = json.loads(strategy_response['body']).get('promotion_ideas', [])
+    # Long runs stop before the time budget runs out; re-invoke with the resume token until complete,
+    # as the Step Functions workflow's loop would.
+    resume_token = json.loads(strategy_response['body']).get('resume_token')
+    while strategy_response['statusCode'] == 202 and resume_token:
+        print(f"Strategy run paused; resuming with token {resume_token}...")
+        strategy_response = promotion_strategy_agent_handler({'resume_token': resume_token}, {})
+        strategy_body = json.loads(strategy_response['body'])
+        pricing_recommendations.extend(strategy_body.get('pricing_recommendations', []))
+        promotion_ideas.extend(strategy_body.get('promotion_ideas', []))
+        resume_token = strategy_body.get('resume_token')
     print(f"Strategy result: {strategy_response['statusCode']}")
     print(f"Generated {len(pricing_recommendations)} pricing recommendations.")
     print(f"Generated {len(promotion_ideas)} promotion ideas.")
@@ -231,9 +359,14 @@ if __name__ == '__main__':
     port = os.getenv('PORT', 5000)
     print(f"Starting local Flask server on port {port}...")
     print(f"UI Backend API: http://127.0.0.1:{port}/api/products")
+    print(f"Streaming Promo Idea API: http://127.0.0.1:{port}/api/generate-promo-idea/stream (POST, text/event-stream)")
     print(f"Mock E-commerce Price Update API: http://127.0.0.1:{port}/mock-api/update_price")
+    print(f"Mock E-commerce Bulk Price Update API: http://127.0.0.1:{port}/mock-api/update_prices")
+    print(f"Mock E-commerce Price Feed API: http://127.0.0.1:{port}/mock-api/prices?since=<cursor>")
     print(f"Mock Market Data API: http://127.0.0.1:{port}/mock-api/market-data")
-    print(f"Trigger Full Agent Run: http://127.0.0.1:{port}/trigger-full-agent-run (POST)")
+    print(f"Trigger Full Agent Run: http://127.0.0.1:{port}/trigger-full-agent-run (POST, ?mode=pipelined to overlap forecast and strategy)")
+    print(f"Drain Customer Alert Outbox: http://127.0.0.1:{port}/trigger-alert-drain (POST)")
+    print(f"Drain Price Sync Retry Queue: http://127.0.0.1:{port}/trigger-sync-retry-drain (POST)")
     print(f"Apply Recommendation Endpoint: http://127.0.0.1:{port}/apply-recommendation (POST/OPTIONS)")
     
     app.run(debug=True, port=port)
\ No newline at end of file
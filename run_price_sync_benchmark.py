@@ -0,0 +1,337 @@
+# retail-pricing-agent-ai/run_price_sync_benchmark.py
+"""
+Price sync throughput benchmark.
+
+Drives the Real-Time Price Sync Agent with synthetic batches of recommendations against a
+local mock storefront with injected latency and errors, and reports per engine and sync
+mode: successful updates/second, storefront request latency (p50/p99), peak Python memory
+(tracemalloc) and peak thread count.
+
+    python run_price_sync_benchmark.py --sizes 10,100,1000,10000 --latency-ms 20 --error-rate 0.01
+    python run_price_sync_benchmark.py --sizes 100000 --modes asyncio:batch,threads:batch --storefront main
+
+The storefront runs in a child process so it does not share the GIL or the memory figures:
+--storefront standin (default) is a small stdlib HTTP server with the mock e-commerce
+endpoints; --storefront main serves main.py's Flask mock API (MOCK_ECOMMERCE_* fault injection).
+DynamoDB writes go to an in-process stand-in taking --dynamodb-latency-ms per call, unless
+--dynamodb aws is given, which writes to the real tables configured in .env.
+"""
+import argparse
+import array
+import contextlib
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+from lambda_functions.real_time_price_sync_agent import app as sync_agent
+from lambda_functions.real_time_price_sync_agent.http_client import HttpClient
+
+DEFAULT_MODES = "threads:single,threads:batch,asyncio:single,asyncio:batch"
+
+
+def _sku(i):
+    return f"BENCH{i:06d}"
+
+
+class _StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Hundreds of connections may arrive at once with the asyncio engine
+    request_queue_size = 1024
+
+
+def _stand_in_handler(latency_ms, error_rate):
+    """
+    Returns a request handler serving main.py's mock price endpoints: /mock-api/update_price,
+    /mock-api/update_prices and an empty /mock-api/prices feed, with latency_ms added to every
+    update request and error_rate of them answered with a 503.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body are written separately; without this, delayed ACKs add ~40 ms per response
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._reply(200, {'prices': [], 'cursor': '0', 'has_more': False})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if latency_ms:
+                time.sleep(latency_ms / 1000.0)
+            if error_rate and random.random() < error_rate:
+                return self._reply(503, {'status': 'error', 'message': 'Injected failure'})
+            if self.path == '/mock-api/update_prices':
+                return self._reply(200, {'results': [
+                    {'sku': update.get('sku'), 'status': 'success', 'new_price': update.get('new_price')}
+                    for update in body.get('updates', [])
+                ]})
+            self._reply(200, {'status': 'success', 'message': f"Price for {body.get('sku')} updated to {body.get('new_price')}"})
+
+    return Handler
+
+
+def _serve_storefront(kind, latency_ms, error_rate, sku_count, port_queue):
+    """
+    Child process entry point: serves the mock storefront on a free port and reports the port.
+    """
+    sys.stdout = open(os.devnull, 'w')
+    if kind == 'main':
+        import logging
+        from werkzeug.serving import make_server
+        import main
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        main.MOCK_ECOMMERCE_LATENCY_MS = latency_ms
+        main.MOCK_ECOMMERCE_ERROR_RATE = error_rate
+        for i in range(sku_count):
+            main.mock_ecommerce_products.setdefault(_sku(i), {'name': f'Benchmark product {i}', 'current_price': 10.0, 'version': 0})
+        server = make_server('127.0.0.1', 0, main.app, threaded=True)
+    else:
+        server = _StandInServer(('127.0.0.1', 0), _stand_in_handler(latency_ms, error_rate))
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+class InProcessDynamoDB:
+    """
+    Stand-in for the DynamoDB client calls the sync agent makes (TransactWriteItems and
+    BatchExecuteStatement), sleeping latency_ms per call.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency_ms = latency_ms
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def transact_write_items(self, TransactItems):
+        self._call()
+        return {}
+
+    def batch_execute_statement(self, Statements):
+        self._call()
+        return {'Responses': [{} for _ in Statements]}
+
+
+class RecordingHttpClient(HttpClient):
+    """
+    HttpClient that also keeps every request latency (8 bytes each), for exact percentiles.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies_ms = array.array('d')
+
+    def observe(self, endpoint, latency_ms, *args, **kwargs):
+        self.latencies_ms.append(latency_ms)
+        super().observe(endpoint, latency_ms, *args, **kwargs)
+
+
+class _ThreadSampler:
+    """
+    Samples threading.active_count() in the background and keeps the peak (including itself).
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def build_recommendations(count, run_id):
+    """
+    Returns count applied price_adjustment recommendations for distinct synthetic SKUs.
+    """
+    return [
+        {
+            'id': f"BENCH-{run_id}-{i}",
+            'sku': _sku(i),
+            'sku_region_pk': f"{_sku(i)}_BENCH",
+            'type': 'price_adjustment',
+            'status': 'applied',
+            'currentPrice': 10.0,
+            'recommendedPrice': round(random.uniform(5.0, 15.0), 2),
+        }
+        for i in range(count)
+    ]
+
+
+def run_once(engine, sync_mode, max_in_flight, size, batch_size, measure_memory, run_id):
+    """
+    Syncs size synthetic recommendations through lambda_handler and returns the measurements.
+    """
+    recommendations = build_recommendations(size, run_id)
+    # A fresh client per run keeps metrics separate; the agent looks it up at call time
+    sync_agent.http_client = RecordingHttpClient.from_env()
+    event = {
+        'recommendations': recommendations,
+        'engine': engine,
+        'mode': sync_mode,
+        'batch_size': batch_size,
+        'max_in_flight': max_in_flight,
+        # Synthetic prices are new to the storefront, and failures are reported, not retried later
+        'skip_unchanged': False,
+        'queue_retries': False,
+    }
+    gc.collect()
+    if measure_memory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+    with _ThreadSampler() as threads, open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        started_at = time.perf_counter()
+        response = sync_agent.lambda_handler(event, {})
+        elapsed = time.perf_counter() - started_at
+
+    peak_memory = tracemalloc.get_traced_memory()[1] - baseline if measure_memory else None
+    statuses = [result['status'] for result in json.loads(response['body'])['sync_results']]
+    http_metrics = sync_agent.http_client.metrics()
+    latencies = sorted(sync_agent.http_client.latencies_ms)
+    succeeded = statuses.count('success')
+    return {
+        'engine': engine,
+        'mode': sync_mode,
+        'max_in_flight': max_in_flight,
+        'recommendations': size,
+        'succeeded': succeeded,
+        'failed': size - succeeded,
+        'elapsed_s': round(elapsed, 3),
+        'updates_per_s': round(succeeded / elapsed, 1) if elapsed else None,
+        'requests': sum(metrics['requests'] for metrics in http_metrics.values()),
+        'retries': sum(metrics['retries'] for metrics in http_metrics.values()),
+        'p50_ms': round(_percentile(latencies, 0.50), 2) if latencies else None,
+        'p99_ms': round(_percentile(latencies, 0.99), 2) if latencies else None,
+        'peak_memory_mib': round(peak_memory / (1024 * 1024), 2) if peak_memory is not None else None,
+        'peak_threads': threads.peak,
+    }
+
+
+def _parse_modes(spec, threads_in_flight, asyncio_in_flight):
+    """
+    Parses 'engine:mode[:max_in_flight],...' into (engine, mode, max_in_flight) tuples.
+    """
+    modes = []
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        parts = item.split(':')
+        if len(parts) not in (2, 3) or parts[0] not in ('threads', 'asyncio') or parts[1] not in ('single', 'batch'):
+            raise ValueError(f"Invalid mode '{item}'; expected engine:mode[:max_in_flight] with engine threads|asyncio and mode single|batch")
+        default_in_flight = asyncio_in_flight if parts[0] == 'asyncio' else threads_in_flight
+        modes.append((parts[0], parts[1], int(parts[2]) if len(parts) == 3 else default_in_flight))
+    return modes
+
+
+def _print_table(rows):
+    columns = ['engine', 'mode', 'max_in_flight', 'recommendations', 'updates_per_s', 'elapsed_s', 'failed',
+               'requests', 'retries', 'p50_ms', 'p99_ms', 'peak_memory_mib', 'peak_threads']
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print('  '.join(column.rjust(widths[column]) for column in columns))
+    for row in rows:
+        print('  '.join(str(row[column]).rjust(widths[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Real-Time Price Sync Agent throughput against a mock storefront.")
+    parser.add_argument('--sizes', default='10,100,1000,10000', help="Comma-separated recommendation counts per run (up to 100000).")
+    parser.add_argument('--modes', default=DEFAULT_MODES, help="Comma-separated engine:mode[:max_in_flight] (engine threads|asyncio, mode single|batch).")
+    parser.add_argument('--threads-in-flight', type=int, default=sync_agent.SYNC_MAX_IN_FLIGHT, help="Default max_in_flight for the threads engine.")
+    parser.add_argument('--asyncio-in-flight', type=int, default=256, help="Default max_in_flight for the asyncio engine.")
+    parser.add_argument('--batch-size', type=int, default=sync_agent.SYNC_BATCH_SIZE, help="SKUs per bulk request in batch mode.")
+    parser.add_argument('--storefront', choices=['standin', 'main'], default='standin', help="Mock storefront to serve from a child process.")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Latency injected into every storefront update request.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of storefront update requests answered with a 503.")
+    parser.add_argument('--dynamodb', choices=['standin', 'aws'], default='standin', help="Where the sync records are written.")
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=5.0, help="Latency of each stand-in DynamoDB call.")
+    parser.add_argument('--no-memory', action='store_true', help="Skip tracemalloc, which slows allocation-heavy runs down.")
+    parser.add_argument('--no-warmup', action='store_true', help="Skip the small unmeasured run per mode.")
+    parser.add_argument('--json-output', help="Also write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    modes = _parse_modes(args.modes, args.threads_in_flight, args.asyncio_in_flight)
+
+    port_queue = multiprocessing.Queue()
+    storefront = multiprocessing.Process(
+        target=_serve_storefront, args=(args.storefront, args.latency_ms, args.error_rate, max(sizes), port_queue), daemon=True
+    )
+    storefront.start()
+    storefront_url = f"http://127.0.0.1:{port_queue.get(timeout=60)}"
+    sync_agent.ECOMMERCE_PRICE_UPDATE_API = f"{storefront_url}/mock-api/update_price"
+    sync_agent.ECOMMERCE_BULK_PRICE_UPDATE_API = f"{storefront_url}/mock-api/update_prices"
+    sync_agent.ECOMMERCE_PRICE_FEED_API = f"{storefront_url}/mock-api/prices"
+    if args.dynamodb == 'standin':
+        sync_agent.dynamodb = SimpleNamespace(meta=SimpleNamespace(client=InProcessDynamoDB(args.dynamodb_latency_ms)))
+
+    print(f"--- Price Sync Benchmark: {args.storefront} storefront at {storefront_url} "
+          f"({args.latency_ms} ms latency, {args.error_rate:.1%} errors), {args.dynamodb} DynamoDB ---")
+    rows = []
+    try:
+        if not args.no_memory:
+            tracemalloc.start()
+        for engine, sync_mode, max_in_flight in modes:
+            if not args.no_warmup:
+                run_once(engine, sync_mode, max_in_flight, 10, args.batch_size, False, 'warmup')
+            for size in sizes:
+                row = run_once(engine, sync_mode, max_in_flight, size, args.batch_size, not args.no_memory, f"{engine}-{sync_mode}-{size}")
+                print(f"{engine}/{sync_mode} x{max_in_flight}, {size} recommendations: {row['updates_per_s']} updates/s, "
+                      f"p50 {row['p50_ms']} ms, p99 {row['p99_ms']} ms, peak memory {row['peak_memory_mib']} MiB")
+                rows.append(row)
+    finally:
+        tracemalloc.stop()
+        storefront.terminate()
+
+    print()
+    _print_table(rows)
+    if args.json_output:
+        with open(args.json_output, 'w') as f:
+            json.dump(rows, f, indent=2)
+        print(f"\nResults written to {args.json_output}")
+
+
+if __name__ == '__main__':
+    main()